@@ -0,0 +1,242 @@
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import aiohttp
+from app.services import http_client
+from app.services import product_validator
+from app.services import result_cache
+from app.services import stripe_detector
+from app.services.failure_cache import is_host_failure
+from app.services.signatures import DECISIVE_SIGNATURES, StreamingScanner, content_fingerprint
+from app.services.stripe_detector import (
+    TIERED_DETECTION,
+    analyze_html,
+    blocked_result,
+    cache_key,
+    error_result,
+    get_cached_result,
+    store_result
+)
+
+# Pages checked at the same time, overall and against a single domain
+ASYNC_MAX_CONCURRENCY = int(os.environ.get('ASYNC_MAX_CONCURRENCY', 50))
+ASYNC_PER_HOST_CONCURRENCY = int(os.environ.get('ASYNC_PER_HOST_CONCURRENCY', 4))
+
+# Threads parsing and scoring pages off the event loop
+ASYNC_PARSE_WORKERS = int(os.environ.get('ASYNC_PARSE_WORKERS', os.cpu_count() or 4))
+
+_parse_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    """Return the executor shared by engines that are not given one."""
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ThreadPoolExecutor(max_workers=ASYNC_PARSE_WORKERS, thread_name_prefix='stripe-parse')
+    return _parse_executor
+
+
+class _HostLimit:
+    __slots__ = ('semaphore', 'users')
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.users = 0
+
+
+class AsyncDetectionEngine:
+    """asyncio counterpart of is_stripe_enabled and validate_products.
+
+    Pages are fetched with a non-blocking aiohttp session, while parsing and
+    scoring run in an executor so they never block the event loop. A global
+    semaphore bounds how many pages are checked at once and a per-domain
+    semaphore bounds how many of them hit the same merchant. Each download
+    also waits for the fetch scheduler the blocking client uses, so the
+    per-host rate limits and Retry-After delays hold across both. Results
+    are read from and written to the same caches as the blocking detector.
+
+    Use as an async context manager, which opens and closes the session.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, per_host_concurrency: Optional[int] = None,
+                 executor: Optional[Executor] = None, tiered: Optional[bool] = None):
+        self.max_concurrency = max_concurrency or ASYNC_MAX_CONCURRENCY
+        self.per_host_concurrency = per_host_concurrency or ASYNC_PER_HOST_CONCURRENCY
+        self.tiered = TIERED_DETECTION if tiered is None else tiered
+        self._executor = executor
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._global_limit: Optional[asyncio.Semaphore] = None
+        # Per-domain slots, kept while a check holds or waits for one
+        self._host_limits: Dict[str, _HostLimit] = {}
+
+    async def __aenter__(self) -> 'AsyncDetectionEngine':
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host_concurrency)
+        # The fetch deadline is enforced per download, so that a page cut
+        # short by it is still scanned
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=http_client.CONNECT_TIMEOUT,
+            sock_read=http_client.READ_TIMEOUT
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=http_client.DEFAULT_HEADERS)
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+        self._session = None
+
+    @contextlib.asynccontextmanager
+    async def _host_limit(self, domain: str) -> AsyncIterator[None]:
+        """Hold one of the domain's slots, forgetting the domain once nobody uses it."""
+        limit = self._host_limits.get(domain)
+        if limit is None:
+            limit = self._host_limits[domain] = _HostLimit(self.per_host_concurrency)
+        limit.users += 1
+        try:
+            async with limit.semaphore:
+                yield
+        finally:
+            limit.users -= 1
+            if not limit.users:
+                del self._host_limits[domain]
+
+    async def _download_page(self, url: str) -> Tuple[str, Dict[str, Any]]:
+        """Stream a page, stopping at the first decisive signature.
+
+        Like http_client.get, every attempt waits for the shared scheduler,
+        and 429 and 503 responses hold the host back for their Retry-After
+        delay before being retried.
+        """
+        scheduler = http_client.scheduler
+        attempt = 0
+        while True:
+            host = await scheduler.acquire_async(url)
+            try:
+                # The deadline covers the whole download, headers included
+                started = time.monotonic()
+                response = await asyncio.wait_for(self._session.get(url), http_client.FETCH_DEADLINE)
+                async with response:
+                    if response.status in http_client.SCHEDULER_RETRY_STATUSES:
+                        delay = http_client.retry_after(response, attempt)
+                        scheduler.defer(host, min(delay, http_client.MAX_RETRY_AFTER))
+                        if attempt < http_client.MAX_RETRIES and delay <= http_client.MAX_RETRY_AFTER:
+                            attempt += 1
+                            continue
+                    response.raise_for_status()
+                    scanner = StreamingScanner(DECISIVE_SIGNATURES)
+                    reader = http_client.BodyReader(response.charset, stop=lambda text: bool(scanner.feed(text)),
+                                                    deadline=http_client.FETCH_DEADLINE - (time.monotonic() - started))
+                    await self._read_body(response, reader)
+            finally:
+                scheduler.release(host)
+            break
+        html, fetch_info = reader.finish(url)
+        validators = http_client.cache_validators(response.headers)
+        if validators:
+            fetch_info['validators'] = validators
+        if fetch_info['stopped'] == 'stop':
+            fetch_info['stopped'] = 'decisive_signature'
+        return html, fetch_info
+
+    @staticmethod
+    async def _read_body(response: aiohttp.ClientResponse, reader: http_client.BodyReader) -> None:
+        """Feed the body to the reader as it arrives, never waiting past its deadline."""
+        while True:
+            remaining = reader.remaining
+            if remaining <= 0:
+                reader.time_out()
+                return
+            try:
+                chunk = await asyncio.wait_for(response.content.readany(), remaining)
+            except asyncio.TimeoutError:
+                reader.time_out()
+                return
+            if not chunk or reader.feed(chunk):
+                return
+
+    async def is_stripe_enabled(self, url: str) -> Dict[str, Any]:
+        """Determine if a website uses Stripe, without blocking the loop.
+
+        Returns:
+            The same result dictionary as stripe_detector.is_stripe_enabled
+        """
+        domain = cache_key(url)
+        cached = get_cached_result(domain, refresh_url=url)
+        if cached is not None:
+            return cached
+        return await self.check_site(url, domain)
+
+    async def check_site(self, url: str, domain: str) -> Dict[str, Any]:
+        """Fetch and analyze a page whatever the cache holds, caching the result.
+
+        Args:
+            url: The page to check
+            domain: The cache key the result is stored under
+        """
+        blocked = blocked_result(domain)
+        if blocked is not None:
+            return blocked
+
+        try:
+            async with self._global_limit, self._host_limit(domain):
+                html, fetch_info = await self._download_page(url)
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(
+                    self._executor or _default_executor(), analyze_html, url, html, self.tiered
+                )
+            result['details'].update(fetch=fetch_info, fingerprint=content_fingerprint(url, html),
+                                     result_source='recomputed')
+            store_result(domain, result)
+            stripe_detector.failure_cache.record_success(domain)
+            return result
+        except Exception as e:
+            if is_host_failure(e):
+                stripe_detector.failure_cache.record_failure(domain, e)
+            return error_result(e)
+
+    async def validate_products(self, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Filter products to those using Stripe, checking domains concurrently.
+
+        Each uncached domain is checked once, however many products share
+        it, and the Stripe-enabled products are returned in input order.
+        """
+        verdicts, pending = product_validator._group_by_domain(products)
+        results = await asyncio.gather(*(self.is_stripe_enabled(url) for url in pending.values()))
+        verdicts.update(zip(pending, results))
+
+        result_cache.detection_cache.flush()
+        return product_validator._collect_stripe_products(products, verdicts, set(pending))
+
+
+async def is_stripe_enabled_async(url: str, engine: Optional[AsyncDetectionEngine] = None) -> Dict[str, Any]:
+    """Check one URL, with a throwaway engine unless one is given."""
+    if engine is not None:
+        return await engine.is_stripe_enabled(url)
+    async with AsyncDetectionEngine() as engine:
+        return await engine.is_stripe_enabled(url)
+
+
+async def validate_products_async(products: List[Dict[str, Any]],
+                                  engine: Optional[AsyncDetectionEngine] = None) -> List[Dict[str, Any]]:
+    """Filter products concurrently, with a throwaway engine unless one is given."""
+    if engine is not None:
+        return await engine.validate_products(products)
+    async with AsyncDetectionEngine() as engine:
+        return await engine.validate_products(products)
+
+
+def is_stripe_enabled_sync(url: str) -> Dict[str, Any]:
+    """Blocking wrapper around the async engine for synchronous endpoints."""
+    return asyncio.run(is_stripe_enabled_async(url))
+
+
+def validate_products_sync(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Blocking wrapper around the async engine for synchronous endpoints.
+
+    Must not be called from a thread that is already running an event loop.
+    """
+    return asyncio.run(validate_products_async(products))
@@ -0,0 +1,234 @@
+"""Offline bulk detection over a file of URLs.
+
+URLs are streamed from a JSONL file (objects with a "url" field, or bare
+strings) or a CSV file (a "url" column, otherwise the first one), fetched
+concurrently by the asyncio engine, and parsed and scored on a pool of
+processes with the same analyze_html the server uses. One JSON line is
+written per URL, in input order, and every result also goes into the
+shared detection cache::
+
+    python -m app.services.bulk_crawler urls.jsonl results.jsonl
+
+Progress is checkpointed next to the output file. Running the same command
+again after a crash resumes from the last checkpoint; the checkpoint is
+removed once the whole input has been processed.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterator, List, Optional
+from app.services import result_cache
+from app.services.async_detector import AsyncDetectionEngine
+from app.services.cache_keys import cache_key
+from app.services.stripe_detector import result_status
+
+# Input records between two checkpoints
+CHECKPOINT_EVERY = 1000
+
+
+def read_urls(path: str) -> Iterator[Optional[str]]:
+    """Stream the URLs of an input file.
+
+    Yields:
+        One URL per input record, or None for a record without one, so
+        records can be counted whether or not they hold a URL
+    """
+    with open(path, "r", encoding="utf-8", newline='') as f:
+        if path.lower().endswith('.csv'):
+            column = 0
+            for i, row in enumerate(csv.reader(f)):
+                if i == 0:
+                    names = [name.strip().lower() for name in row]
+                    if 'url' in names:
+                        column = names.index('url')
+                        continue
+                value = row[column].strip() if len(row) > column else ''
+                yield value or None
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield None
+                    continue
+                url = record.get('url') if isinstance(record, dict) else record
+                yield url if isinstance(url, str) and url else None
+
+
+def load_checkpoint(path: str, input_path: str) -> Dict[str, Any]:
+    """Return where a previous run over the same input stopped.
+
+    Returns:
+        The number of input records already done and the size of the
+        output file at that point; zeros when there is nothing to resume
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return {'records': 0, 'offset': 0}
+    if checkpoint.get('input') != os.path.abspath(input_path):
+        raise ValueError(f"{path} belongs to a crawl of {checkpoint.get('input')}")
+    return checkpoint
+
+
+def save_checkpoint(path: str, input_path: str, records: int, offset: int) -> None:
+    """Write the checkpoint atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({'input': os.path.abspath(input_path), 'records': records, 'offset': offset}, f)
+    os.replace(tmp_path, path)
+
+
+class BulkCrawler:
+    """Check a stream of URLs with bounded memory.
+
+    At most `window` URLs are in progress at once. Results are written in
+    input order, so everything before the checkpoint is known to be on
+    disk. URLs of a site already being checked wait for that check instead
+    of fetching the site again.
+    """
+
+    def __init__(self, engine: AsyncDetectionEngine, window: int, refresh: bool = False):
+        self.engine = engine
+        self.window = window
+        self.refresh = refresh
+        self._in_flight: Dict[str, 'asyncio.Future[Dict[str, Any]]'] = {}
+        # Results detected from then on were stored by this run
+        self._started = int(time.time())
+
+    def _refreshed(self, key: str) -> bool:
+        """Whether the cache holds a result for the key detected by this run."""
+        cached = result_cache.detection_cache.get(key)
+        return cached is not None and cached.get('details', {}).get('timestamp', 0) >= self._started
+
+    def _check(self, url: str) -> 'asyncio.Future[Dict[str, Any]]':
+        key = cache_key(url)
+        future = self._in_flight.get(key)
+        if future is None:
+            if self.refresh and not self._refreshed(key):
+                # Recheck each site once per run, then reuse what it stored
+                future = asyncio.ensure_future(self.engine.check_site(url, key))
+            else:
+                future = asyncio.ensure_future(self.engine.is_stripe_enabled(url))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return future
+
+    async def crawl(self, urls: Iterator[Optional[str]], output: BinaryIO,
+                    on_record: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+        """Check every URL and write one JSON line per URL to `output`.
+
+        Args:
+            urls: URLs, None for input records to skip
+            output: Binary file the results are appended to
+            on_record: Called after each input record is fully written
+
+        Returns:
+            Counts of records read and of results per status
+        """
+        counts = {'records': 0, 'enabled': 0, 'disabled': 0, 'unknown': 0}
+        pending: Deque[Any] = deque()
+
+        async def write_next() -> None:
+            url, future = pending.popleft()
+            if future is not None:
+                result = await future
+                counts[result_status(result)] += 1
+                output.write(json.dumps({'url': url, **result}).encode('utf-8') + b'\n')
+            counts['records'] += 1
+            if on_record is not None:
+                on_record(counts['records'])
+
+        for url in urls:
+            pending.append((url, self._check(url) if url else None))
+            if len(pending) >= self.window:
+                await write_next()
+        while pending:
+            await write_next()
+        return counts
+
+
+async def run_crawl(input_path: str, output_path: str, engine: AsyncDetectionEngine,
+                    window: Optional[int] = None, refresh: bool = False,
+                    checkpoint_every: int = CHECKPOINT_EVERY) -> Dict[str, int]:
+    """Crawl an input file into an output file, resuming from its checkpoint.
+
+    Args:
+        input_path: JSONL or CSV file of URLs
+        output_path: JSONL file results are written to
+        engine: An open engine doing the fetching and parsing
+        window: URLs in progress at once, defaults to four times the
+            engine's concurrency
+        refresh: Recheck every site instead of reusing cached results
+        checkpoint_every: Input records between two checkpoints
+
+    Returns:
+        Counts of the records processed by this run and their statuses
+    """
+    checkpoint_path = f"{output_path}.checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path, input_path)
+    skip = checkpoint['records']
+
+    urls = itertools.islice(read_urls(input_path), skip, None)
+
+    mode = 'r+b' if checkpoint['offset'] else 'wb'
+    with open(output_path, mode) as output:
+        # Drop whatever was written after the last checkpoint
+        output.seek(checkpoint['offset'])
+        output.truncate()
+
+        def on_record(done: int) -> None:
+            if done % checkpoint_every == 0:
+                output.flush()
+                os.fsync(output.fileno())
+                result_cache.detection_cache.flush()
+                save_checkpoint(checkpoint_path, input_path, skip + done, output.tell())
+
+        crawler = BulkCrawler(engine, window or engine.max_concurrency * 4, refresh)
+        counts = await crawler.crawl(urls, output, on_record)
+
+    result_cache.detection_cache.flush()
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    counts['resumed_from'] = skip
+    return counts
+
+
+async def _main(args: argparse.Namespace, executor: Executor) -> Dict[str, int]:
+    async with AsyncDetectionEngine(args.concurrency, args.per_host, executor=executor) as engine:
+        return await run_crawl(args.input, args.output, engine, refresh=args.refresh)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Check a file of URLs for Stripe and write the results as JSONL.')
+    parser.add_argument('input', help='JSONL or CSV file of URLs')
+    parser.add_argument('output', help='JSONL file to write the results to')
+    parser.add_argument('--concurrency', type=int, help='Pages fetched at the same time')
+    parser.add_argument('--per-host', type=int, help='Pages of one merchant fetched at the same time')
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count(),
+                        help='Processes parsing and scoring pages')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Recheck every site instead of reusing cached results')
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.parse_workers) as executor:
+        counts = asyncio.run(_main(args, executor))
+    print(
+        f"Checked {counts['records']} records in {time.monotonic() - started:.0f}s "
+        f"(resumed after {counts['resumed_from']}): {counts['enabled']} enabled, "
+        f"{counts['disabled']} disabled, {counts['unknown']} unknown"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import ipaddress
+import os
+from functools import lru_cache
+from typing import FrozenSet, Optional, Tuple
+from urllib.parse import urlsplit
+
+_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+PUBLIC_SUFFIX_PATH = os.path.join(_ROOT_DIR, "data", "public_suffix_list.dat")
+
+# Page classes cached apart from the rest of their site; pages of any other
+# class share the site's entry
+PAGE_CLASS_KEYS = frozenset(
+    name.strip() for name in os.environ.get('STRIPE_CACHE_PAGE_CLASSES', 'checkout').split(',') if name.strip()
+)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class PublicSuffixList:
+    """Public suffix rules, in the publicsuffix.org file format."""
+
+    def __init__(self, rules: FrozenSet[str], wildcards: FrozenSet[str], exceptions: FrozenSet[str]):
+        self.rules = rules
+        self.wildcards = wildcards
+        self.exceptions = exceptions
+
+    @classmethod
+    def load(cls, path: str) -> 'PublicSuffixList':
+        rules, wildcards, exceptions = set(), set(), set()
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                rule = line.split(None, 1)[0].lower() if line.strip() else ''
+                if not rule or rule.startswith('//'):
+                    continue
+                try:
+                    # Hosts arrive in their ASCII form, so match rules in it too
+                    rule = rule.encode('idna').decode('ascii')
+                except UnicodeError:
+                    pass
+                if rule.startswith('!'):
+                    exceptions.add(rule[1:])
+                elif rule.startswith('*.'):
+                    wildcards.add(rule[2:])
+                else:
+                    rules.add(rule)
+        return cls(frozenset(rules), frozenset(wildcards), frozenset(exceptions))
+
+    def suffix_length(self, labels: Tuple[str, ...]) -> int:
+        """Number of trailing labels forming the public suffix of a host."""
+        for i in range(len(labels)):
+            candidate = '.'.join(labels[i:])
+            if candidate in self.exceptions:
+                return len(labels) - i - 1
+            if candidate in self.rules or (i + 1 < len(labels) and '.'.join(labels[i + 1:]) in self.wildcards):
+                return len(labels) - i
+        # Implicit "*" rule: an unlisted top-level domain is a public suffix
+        return 1
+
+    def registrable_domain(self, host: str) -> str:
+        """Return the eTLD+1 of a host, or the host itself when it has none."""
+        labels = tuple(host.split('.'))
+        suffix = self.suffix_length(labels)
+        if suffix >= len(labels):
+            return host
+        return '.'.join(labels[-suffix - 1:])
+
+
+_suffixes: Optional[PublicSuffixList] = None
+
+
+def public_suffixes() -> PublicSuffixList:
+    """Return the bundled public suffix list, loading it on first use."""
+    global _suffixes
+    if _suffixes is None:
+        _suffixes = PublicSuffixList.load(PUBLIC_SUFFIX_PATH)
+    return _suffixes
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip('[]'))
+        return True
+    except ValueError:
+        return False
+
+
+@lru_cache(maxsize=4096)
+def site_key(netloc: str, scheme: str = 'https') -> str:
+    """Normalize a URL's network location to its registrable domain.
+
+    Case, a trailing dot, credentials and the scheme's default port are
+    dropped, so https://WWW.Shop.com:443 and http://shop.com share a key.
+    Other ports are kept. IP addresses are used as they are.
+    """
+    host_port = netloc.rsplit('@', 1)[-1].lower()
+    host, port = host_port, None
+    if host_port.startswith('['):
+        end = host_port.find(']')
+        host, rest = host_port[:end + 1], host_port[end + 1:]
+        port = rest[1:] if rest.startswith(':') else None
+    elif ':' in host_port:
+        host, port = host_port.rsplit(':', 1)
+    host = host.rstrip('.')
+    if port and port.isdigit() and int(port) == DEFAULT_PORTS.get(scheme):
+        port = None
+
+    site = host if _is_ip(host) or '.' not in host else public_suffixes().registrable_domain(host)
+    return f"{site}:{port}" if port else site
+
+
+def page_class(url: str) -> str:
+    """Classify a URL as a 'checkout', 'home' or 'product' page."""
+    # The same test analyze_html applies its checkout leniency on
+    if '/checkout' in url.lower():
+        return 'checkout'
+    if urlsplit(url).path.strip('/') == '':
+        return 'home'
+    return 'product'
+
+
+def cache_key(url: str) -> str:
+    """Return the key detection results for a URL are cached under.
+
+    Pages are grouped by registrable domain, with the page class appended
+    for the classes listed in STRIPE_CACHE_PAGE_CLASSES.
+    """
+    parts = urlsplit(url)
+    key = site_key(parts.netloc, parts.scheme.lower() or 'https')
+    page = page_class(url)
+    if page in PAGE_CLASS_KEYS:
+        key = f"{key}#{page}"
+    return key
+
+
+def site_of(key: str) -> str:
+    """Return the site part of a cache key, without its page class."""
+    return key.split('#', 1)[0]
+
+
+def site_of_url(url: str) -> str:
+    """Return the key of a URL's site, whatever the page class."""
+    parts = urlsplit(url)
+    return site_key(parts.netloc, parts.scheme.lower() or 'https')
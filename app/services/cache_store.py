@@ -0,0 +1,227 @@
+"""SQLite-backed persistent tier for the detection and checkout caches.
+
+Run ``python -m app.services.cache_store`` once to import the JSON cache
+files written by earlier versions.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.services.cache_keys import site_key
+
+_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CACHE_DB_PATH = os.environ.get('STRIPE_CACHE_DB', os.path.join(_ROOT_DIR, "data", "cache.sqlite3"))
+
+# Write-behind: pending writes are flushed in one transaction once this many
+# have accumulated, or once the oldest has waited this many seconds, whether
+# or not anything else is written meanwhile
+CACHE_FLUSH_EVERY = int(os.environ.get('STRIPE_CACHE_FLUSH_EVERY', 50))
+CACHE_FLUSH_INTERVAL = float(os.environ.get('STRIPE_CACHE_FLUSH_INTERVAL', 5))
+
+Entry = Dict[str, Any]
+
+_stores: 'weakref.WeakSet[SQLiteStore]' = weakref.WeakSet()
+
+
+class SQLiteStore:
+    """Key/entry table in a SQLite database shared by all worker processes.
+
+    Entries are {'timestamp', 'result'} dictionaries. The database runs in
+    WAL mode so readers never block the writer, lookups go through the
+    primary key index, and writes are buffered and flushed in batches, by
+    the writer once enough have piled up or by a timer once the oldest is
+    flush_interval seconds old. The database is opened on first use, one
+    connection per thread.
+    """
+
+    def __init__(self, path: str, table: str, flush_every: Optional[int] = None,
+                 flush_interval: Optional[float] = None):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table!r}")
+        self.path = path
+        self.table = table
+        self.flush_every = CACHE_FLUSH_EVERY if flush_every is None else flush_every
+        self.flush_interval = CACHE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Optional[Entry]] = {}
+        self._pending_since: Optional[float] = None
+        self._timer: Optional[threading.Timer] = None
+        self._schema_ready = False
+        _stores.add(self)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._schema_ready:
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {self.table} '
+                    '(key TEXT PRIMARY KEY, timestamp REAL NOT NULL, result TEXT NOT NULL)'
+                )
+                self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+        row = self._connection().execute(
+            f'SELECT timestamp, result FROM {self.table} WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'timestamp': row[0], 'result': json.loads(row[1])}
+
+    def set(self, key: str, entry: Entry) -> None:
+        self._buffer(key, entry)
+
+    def delete(self, key: str) -> None:
+        self._buffer(key, None)
+
+    def _buffer(self, key: str, entry: Optional[Entry]) -> None:
+        with self._lock:
+            self._pending[key] = entry
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            due = (len(self._pending) >= self.flush_every
+                   or time.monotonic() - self._pending_since >= self.flush_interval)
+            if not due and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def _flush_on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered changes in a single transaction."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_since = None
+        if not pending:
+            return
+        upserts = [(key, entry['timestamp'], json.dumps(entry['result']))
+                   for key, entry in pending.items() if entry is not None]
+        deletes = [(key,) for key, entry in pending.items() if entry is None]
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                f'INSERT INTO {self.table} (key, timestamp, result) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET timestamp = excluded.timestamp, result = excluded.result',
+                upserts
+            )
+            conn.executemany(f'DELETE FROM {self.table} WHERE key = ?', deletes)
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            # Keep the writes for the next flush, unless newer ones replaced them
+            with self._lock:
+                for key, entry in pending.items():
+                    self._pending.setdefault(key, entry)
+                if self._pending_since is None:
+                    self._pending_since = time.monotonic()
+            print(f"Error saving cache: {e}")
+
+    def items(self) -> Iterator[Tuple[str, Entry]]:
+        """Iterate over every stored entry, pending writes included."""
+        self.flush()
+        rows = self._connection().execute(f'SELECT key, timestamp, result FROM {self.table} ORDER BY key')
+        for key, timestamp, result in rows:
+            yield key, {'timestamp': timestamp, 'result': json.loads(result)}
+
+    def __len__(self) -> int:
+        self.flush()
+        return self._connection().execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+
+@atexit.register
+def _flush_all() -> None:
+    for store in list(_stores):
+        store.flush()
+
+
+def _upgrade_entry(entry: Entry) -> Entry:
+    """Convert an entry saved by the old validation cache to the new layout."""
+    if 'result' in entry:
+        return entry
+    return {
+        'timestamp': entry.get('timestamp', 0),
+        'result': {
+            'stripe_enabled': entry.get('stripe_enabled', False),
+            'confidence': entry.get('confidence', 0),
+            'details': {}
+        }
+    }
+
+
+def migrate_json(json_path: str, store: SQLiteStore, checkout_links: bool = False) -> int:
+    """Import a cache file written by earlier versions into a store.
+
+    Args:
+        json_path: data/validated_sites.json or data/checkout_links.json
+        store: The store to import into; existing keys are overwritten
+        checkout_links: The file holds checkout links, which carry no timestamp.
+            Other files are keyed by network location; their entries are
+            re-keyed by site, keeping the newest where several share one
+
+    Returns:
+        The number of entries imported, 0 when the file is missing or unreadable
+    """
+    if not os.path.exists(json_path):
+        return 0
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except Exception as e:
+        print(f"Error reading {json_path}: {e}")
+        return 0
+
+    imported = time.time()
+    if checkout_links:
+        for key, entry in entries.items():
+            store.set(key, {'timestamp': imported, 'result': entry})
+        store.flush()
+        return len(entries)
+
+    sites: Dict[str, Entry] = {}
+    for netloc, entry in entries.items():
+        entry = _upgrade_entry(entry)
+        key = site_key(netloc, 'http' if netloc.endswith(':80') else 'https')
+        if key not in sites or entry['timestamp'] > sites[key]['timestamp']:
+            sites[key] = entry
+    for key, entry in sites.items():
+        store.set(key, entry)
+    store.flush()
+    return len(sites)
+
+
+def main() -> None:
+    from app.services import checkout_helper, result_cache
+
+    sources = [
+        (os.path.join(_ROOT_DIR, "data", "validated_sites.json"), result_cache.detection_cache.store, False),
+        (os.path.join(_ROOT_DIR, "data", "checkout_links.json"), checkout_helper.checkout_cache, True)
+    ]
+    for json_path, store, checkout_links in sources:
+        count = migrate_json(json_path, store, checkout_links)
+        print(f"Imported {count} entries from {json_path} into {store.path} ({store.table})")
+
+
+if __name__ == '__main__':
+    main()
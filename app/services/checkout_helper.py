@@ -1,23 +1,18 @@
-import json
-import os
-import requests
-from typing import Optional, Dict, Any
-from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
+import time
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlparse
+from app.services import platform_adapters, platforms
+from app.services.cache_keys import site_of_url
+from app.services.cache_store import CACHE_DB_PATH, SQLiteStore
+from app.services.checkout_links import LinkCandidate, extract_candidates, rank_candidates
+from app.services.page_context import PageContext
 from app.services.stripe_detector import is_stripe_enabled
 
-# Cache for direct checkout links
-_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-_CHECKOUT_CACHE_PATH = os.path.join(_ROOT_DIR, "data", "checkout_links.json")
+# Cache for direct checkout links, opened on first use
+checkout_cache = SQLiteStore(CACHE_DB_PATH, 'checkout_links', flush_every=1)
 
-# Load checkout cache if exists
-checkout_cache = {}
-if os.path.exists(_CHECKOUT_CACHE_PATH):
-    try:
-        with open(_CHECKOUT_CACHE_PATH, "r", encoding="utf-8") as f:
-            checkout_cache = json.load(f)
-    except:
-        checkout_cache = {}
+# Runner-up checkout links kept alongside the best one
+CHECKOUT_ALTERNATIVES = 3
 
 def generate_checkout_url(product_url: str, success_url: str = '', cancel_url: str = '') -> Optional[str]:
     """Generate a direct checkout URL for a Stripe-enabled product.
@@ -36,177 +31,113 @@ def generate_checkout_url(product_url: str, success_url: str = '', cancel_url: s
     Returns:
         A direct checkout URL, or None if unable to generate one
     """
+    # Fetch and parse the product page at most once for this request
+    page = PageContext(product_url)
+    
     # Check if product uses Stripe first
-    stripe_check = is_stripe_enabled(product_url)
+    stripe_check = is_stripe_enabled(product_url, page=page)
     if not stripe_check['stripe_enabled']:
         return None
     
     # Check if we have a cached checkout link
-    if product_url in checkout_cache:
-        return checkout_cache[product_url]['checkout_url']
+    cached = checkout_cache.get(product_url)
+    if cached is not None:
+        return cached['result']['checkout_url']
     
     # Try to determine the e-commerce platform
-    platform = _detect_platform(product_url)
+    platform = _detect_platform(product_url, page)
     
     checkout_url = None
+    alternatives = []
     
     if platform == 'shopify':
-        checkout_url = _handle_shopify_checkout(product_url)
+        checkout_url = _handle_shopify_checkout(product_url, page)
     elif platform == 'woocommerce':
-        checkout_url = _handle_woocommerce_checkout(product_url)
+        checkout_url = _handle_woocommerce_checkout(product_url, page)
     else:
-        # Generic approach - try to find direct checkout links
-        checkout_url = _find_checkout_link(product_url)
+        # Generic approach - rank the checkout links found on the page
+        links = find_checkout_links(product_url, page, limit=CHECKOUT_ALTERNATIVES + 1)
+        if links:
+            checkout_url = links[0].url
+            alternatives = [link.url for link in links[1:]]
     
     if checkout_url:
         # Cache the checkout URL
-        checkout_cache[product_url] = {
-            'checkout_url': checkout_url,
-            'platform': platform
-        }
-        
-        # Save cache
-        try:
-            os.makedirs(os.path.dirname(_CHECKOUT_CACHE_PATH), exist_ok=True)
-            with open(_CHECKOUT_CACHE_PATH, "w", encoding="utf-8") as f:
-                json.dump(checkout_cache, f, indent=2)
-        except Exception as e:
-            print(f"Error saving checkout cache: {e}")
+        checkout_cache.set(product_url, {
+            'timestamp': time.time(),
+            'result': {
+                'checkout_url': checkout_url,
+                'platform': platform,
+                'alternatives': alternatives
+            }
+        })
     
     return checkout_url
 
-def _detect_platform(url: str) -> str:
-    """Detect the e-commerce platform used by the website."""
+def _detect_platform(url: str, page: Optional[PageContext] = None) -> str:
+    """Detect the e-commerce platform used by the website.
+    
+    Platforms identified by detection are cached per site, so the page is
+    only sniffed for sites that have not been checked yet.
+    """
+    known = platforms.cached_platform(url)
+    if known is not None:
+        return known['platform'] or 'unknown'
+    page = page or PageContext(url)
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        html = response.text
-        
-        # Check for Shopify
-        if 'Shopify.theme' in html or '/cdn.shopify.com/' in html:
-            return 'shopify'
-        
-        # Check for WooCommerce
-        if 'woocommerce' in html.lower() or 'add-to-cart' in html.lower():
-            return 'woocommerce'
-        
-        # Add more platform detection as needed
-        
-        return 'unknown'
-    except:
+        platform = platforms.identify_platform(page.html)
+    except Exception:
         return 'unknown'
+    # A page cut short may have lost the signatures, so only a full one
+    # shows the site is on no known platform
+    if platform or not page.fetch_info.get('stopped'):
+        platforms.remember_platform(site_of_url(url), platform)
+    return platform or 'unknown'
 
-def _handle_shopify_checkout(url: str) -> Optional[str]:
+def _handle_shopify_checkout(url: str, page: Optional[PageContext] = None) -> Optional[str]:
     """Generate a direct checkout URL for Shopify stores."""
-    try:
-        # Parse URL to get domain
-        parsed = urlparse(url)
-        domain = parsed.netloc
-        
-        # Extract product details
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Look for product JSON
-        for script in soup.find_all('script', type='application/json'):
-            if 'ProductJson' in script.get('id', ''):
-                product_data = json.loads(script.string)
-                variant_id = product_data.get('variants', [{}])[0].get('id')
-                if variant_id:
-                    # Create direct checkout URL
-                    checkout_url = f"https://{domain}/cart/{variant_id}:1"
-                    return checkout_url
-        
-        # Alternative method - find add to cart form
-        form = soup.find('form', action=lambda x: x and '/cart/add' in x)
-        if form:
-            variant_input = form.find('input', {'name': 'id'})
-            if variant_input and variant_input.get('value'):
-                variant_id = variant_input['value']
-                checkout_url = f"https://{domain}/cart/{variant_id}:1"
-                return checkout_url
-    except Exception as e:
-        print(f"Error generating Shopify checkout: {e}")
-    
-    return None
+    return _platform_checkout(url, 'shopify', page)
 
-def _handle_woocommerce_checkout(url: str) -> Optional[str]:
+def _handle_woocommerce_checkout(url: str, page: Optional[PageContext] = None) -> Optional[str]:
     """Generate a direct checkout URL for WooCommerce stores."""
+    return _platform_checkout(url, 'woocommerce', page)
+
+def _platform_checkout(url: str, platform: str, page: Optional[PageContext] = None) -> Optional[str]:
+    """Build a platform checkout URL from the product's IDs.
+    
+    The IDs come from the platform's JSON endpoint when it knows the
+    product, and from the product page otherwise.
+    """
     try:
-        # Get the page content
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find add to cart form
-        add_to_cart_form = soup.find('form', {'class': 'cart'})
-        if add_to_cart_form:
-            product_id = None
-            # Look for product ID input
-            product_input = add_to_cart_form.find('input', {'name': 'add-to-cart'})
-            if product_input:
-                product_id = product_input.get('value')
-            
-            if product_id:
-                # Create direct checkout URL
-                base_url = f"{urlparse(url).scheme}://{urlparse(url).netloc}"
-                checkout_url = f"{base_url}/checkout/?add-to-cart={product_id}&quantity=1"
-                return checkout_url
+        ids = platform_adapters.resolve_product(url, platform, page)
+        if ids is not None:
+            return platform_adapters.checkout_url(url, platform, ids)
     except Exception as e:
-        print(f"Error generating WooCommerce checkout: {e}")
+        print(f"Error generating {platform} checkout: {e}")
     
     return None
 
-def _find_checkout_link(url: str) -> Optional[str]:
-    """Generic method to find checkout links on a product page."""
+def find_checkout_links(url: str, page: Optional[PageContext] = None, limit: Optional[int] = None) -> List[LinkCandidate]:
+    """Rank the links on a product page that may lead to checkout.
+    
+    Args:
+        url: URL of the product page
+        page: Request-scoped context to read the page from
+        limit: Return at most this many links
+        
+    Returns:
+        The candidates, best first; empty when none is found or the page
+        cannot be fetched
+    """
     try:
-        # Get the page content
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = (page or PageContext(url)).soup(partial=True)
         base_url = f"{urlparse(url).scheme}://{urlparse(url).netloc}"
-        
-        # Look for common checkout or buy now buttons
-        buy_selectors = [
-            {'tag': 'a', 'text': ['buy now', 'checkout', 'purchase']},
-            {'tag': 'button', 'text': ['buy now', 'checkout', 'purchase']},
-            {'tag': 'a', 'class': ['buy', 'checkout', 'purchase', 'btn-buy']},
-            {'tag': 'button', 'class': ['buy', 'checkout', 'purchase', 'btn-buy']},
-        ]
-        
-        for selector in buy_selectors:
-            tag = selector['tag']
-            
-            # Check by text content
-            if 'text' in selector:
-                for text in selector['text']:
-                    elements = soup.find_all(tag, string=lambda s: s and text.lower() in s.lower())
-                    for element in elements:
-                        if tag == 'a' and element.get('href'):
-                            return urljoin(base_url, element['href'])
-                        elif tag == 'button' and element.get('onclick'):
-                            # Try to extract URL from onclick
-                            onclick = element['onclick']
-                            if 'location' in onclick and 'http' in onclick:
-                                url_match = re.search(r'(["\'])(?:http|/).*?\1', onclick)
-                                if url_match:
-                                    url_str = url_match.group(0).strip('"\'')
-                                    return urljoin(base_url, url_str)
-            
-            # Check by class
-            if 'class' in selector:
-                for class_name in selector['class']:
-                    elements = soup.find_all(tag, class_=lambda c: c and class_name.lower() in c.lower())
-                    for element in elements:
-                        if tag == 'a' and element.get('href'):
-                            return urljoin(base_url, element['href'])
-        
-        # Look for checkout forms
-        checkout_forms = soup.find_all('form', action=lambda a: a and ('checkout' in a.lower() or 'cart' in a.lower()))
-        if checkout_forms:
-            return urljoin(base_url, checkout_forms[0]['action'])
-    
+        return rank_candidates(extract_candidates(soup, base_url), limit)
     except Exception as e:
         print(f"Error finding checkout link: {e}")
-    
-    return None
\ No newline at end of file
+        return []
+
+def _find_checkout_link(url: str, page: Optional[PageContext] = None) -> Optional[str]:
+    """Generic method to find checkout links on a product page."""
+    links = find_checkout_links(url, page, limit=1)
+    return links[0].url if links else None
@@ -0,0 +1,119 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+from bs4 import BeautifulSoup, Tag
+
+# Hosts serving Stripe-hosted checkout and payment link pages
+STRIPE_CHECKOUT_HOSTS = ('checkout.stripe.com', 'buy.stripe.com')
+
+# Weights of the signals a candidate is scored on; for each kind of signal
+# only the strongest matching term counts
+TEXT_TERMS = {'buy now': 3.0, 'checkout': 3.0, 'check out': 3.0, 'purchase': 2.0, 'buy': 1.0}
+CLASS_TERMS = {'checkout': 2.0, 'btn-buy': 2.0, 'buy': 1.5, 'purchase': 1.5}
+# Whole URL path segments; they only add to the other signals, since plenty
+# of navigation links point at /cart without leading to checkout
+PATH_TERMS = {'checkout': 2.0, 'buy': 1.5, 'cart': 1.0}
+STRIPE_HOST_WEIGHT = 5.0
+FORM_WEIGHT = 1.0
+
+# URL in a button's onclick handler, such as location.href='/checkout'
+ONCLICK_URL_RE = re.compile(r'(["\'])((?:https?:)?/.*?)\1')
+
+IGNORED_SCHEMES = ('javascript:', 'mailto:', 'tel:', '#')
+
+
+@dataclass
+class LinkCandidate:
+    """A link on a product page that may lead to checkout."""
+    url: str
+    # 'anchor', 'button' (onclick) or 'form' (action)
+    source: str
+    text: str = ''
+    classes: List[str] = field(default_factory=list)
+    stripe_hosted: bool = False
+    score: float = 0.0
+
+
+def _best_match(value: str, terms: Dict[str, float]) -> float:
+    return max((weight for term, weight in terms.items() if term in value), default=0.0)
+
+
+def score_candidate(candidate: LinkCandidate) -> float:
+    """Score a candidate from its text, classes, URL shape and host.
+
+    A link whose URL path is its only signal scores zero.
+    """
+    text = candidate.text.lower()
+    classes = [name.lower() for name in candidate.classes]
+    segments = urlsplit(candidate.url).path.lower().split('/')
+
+    score = _best_match(text, TEXT_TERMS)
+    score += max((_best_match(name, CLASS_TERMS) for name in classes), default=0.0)
+    if candidate.stripe_hosted:
+        score += STRIPE_HOST_WEIGHT
+    if candidate.source == 'form':
+        score += FORM_WEIGHT
+    if not score:
+        return 0.0
+    return score + max((weight for term, weight in PATH_TERMS.items() if term in segments), default=0.0)
+
+
+def _candidate(source: str, target: Optional[str], base_url: str, tag: Tag) -> Optional[LinkCandidate]:
+    if not isinstance(target, str) or not target.strip() or target.strip().lower().startswith(IGNORED_SCHEMES):
+        return None
+    classes = tag.attrs.get('class', [])
+    if isinstance(classes, str):
+        classes = classes.split()
+    url = urljoin(base_url, target.strip())
+    candidate = LinkCandidate(
+        url=url,
+        source=source,
+        text=tag.get_text(' ', strip=True) if source != 'form' else '',
+        classes=list(classes),
+        stripe_hosted=(urlsplit(url).hostname or '') in STRIPE_CHECKOUT_HOSTS
+    )
+    candidate.score = score_candidate(candidate)
+    return candidate
+
+
+def extract_candidates(soup: BeautifulSoup, base_url: str) -> List[LinkCandidate]:
+    """Walk the parsed page once and collect every possible checkout link.
+
+    Anchors, buttons whose onclick handler navigates to a URL, and forms
+    posting to a cart or checkout are collected in document order, scored,
+    and kept when they show any checkout signal besides their URL.
+    """
+    candidates = []
+    for tag in soup.descendants:
+        if not isinstance(tag, Tag):
+            continue
+        name = tag.name
+        candidate = None
+        if name == 'a':
+            candidate = _candidate('anchor', tag.attrs.get('href'), base_url, tag)
+        elif name == 'button':
+            onclick = tag.attrs.get('onclick')
+            if isinstance(onclick, str) and 'location' in onclick:
+                match = ONCLICK_URL_RE.search(onclick)
+                candidate = _candidate('button', match.group(2) if match else None, base_url, tag)
+        elif name == 'form':
+            action = tag.attrs.get('action')
+            if isinstance(action, str) and ('checkout' in action.lower() or 'cart' in action.lower()):
+                candidate = _candidate('form', action, base_url, tag)
+        if candidate is not None and candidate.score > 0:
+            candidates.append(candidate)
+    return candidates
+
+
+def rank_candidates(candidates: List[LinkCandidate], limit: Optional[int] = None) -> List[LinkCandidate]:
+    """Order candidates best first, keeping the best-scored one per URL.
+
+    Ties keep document order, so the first of equally good links wins.
+    """
+    best: Dict[str, LinkCandidate] = {}
+    for candidate in candidates:
+        if candidate.url not in best or candidate.score > best[candidate.url].score:
+            best[candidate.url] = candidate
+    ranked = sorted(best.values(), key=lambda candidate: -candidate.score)
+    return ranked[:limit] if limit is not None else ranked
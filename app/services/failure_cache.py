@@ -0,0 +1,133 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import aiohttp
+import requests
+
+# Wait before re-checking a failing site; doubles with every consecutive failure
+ERROR_BACKOFF = float(os.environ.get('STRIPE_ERROR_BACKOFF', 30))
+ERROR_BACKOFF_MAX = float(os.environ.get('STRIPE_ERROR_BACKOFF_MAX', 3600))
+
+# Consecutive failures after which a site's circuit opens, and for how long
+BREAKER_THRESHOLD = int(os.environ.get('STRIPE_BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.environ.get('STRIPE_BREAKER_COOLDOWN', 1800))
+
+# Failing sites tracked at most; the least recently failed are forgotten first
+FAILURE_CACHE_MAX_ENTRIES = 10000
+
+# Errors reaching the site at all, as opposed to errors about one page
+HOST_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError
+)
+
+# Error statuses meaning the site refuses us or is down, not that a page is missing
+HOST_FAILURE_STATUSES = frozenset({403, 429})
+
+
+def _error_status(error: BaseException) -> Optional[int]:
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) is not None:
+        return response.status_code
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status
+    return None
+
+
+def is_host_failure(error: BaseException) -> bool:
+    """Tell whether an error should count against the whole site.
+
+    Connection errors, timeouts and 403, 429 and 5xx responses do. Any other
+    error, such as a 404 for one product page, only fails that check.
+    """
+    status = _error_status(error)
+    if status is not None:
+        return status in HOST_FAILURE_STATUSES or status >= 500
+    return isinstance(error, HOST_ERRORS)
+
+
+class FailureCache:
+    """Error tier kept apart from the detection results.
+
+    Every check failing on the site as a whole (see is_host_failure) pushes
+    its next attempt back exponentially.
+    After BREAKER_THRESHOLD consecutive failures the site's circuit opens and
+    checks fail fast for BREAKER_COOLDOWN seconds; the first check after that
+    is a trial, and one success closes the circuit and clears the site.
+    """
+
+    def __init__(self, backoff: Optional[float] = None, backoff_max: Optional[float] = None,
+                 threshold: Optional[int] = None, cooldown: Optional[float] = None,
+                 max_entries: int = FAILURE_CACHE_MAX_ENTRIES):
+        self.backoff = ERROR_BACKOFF if backoff is None else backoff
+        self.backoff_max = ERROR_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.threshold = BREAKER_THRESHOLD if threshold is None else threshold
+        self.cooldown = BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._fast_failures = 0
+
+    def blocked(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return why a site must not be checked now, or None if it may be.
+
+        Returns:
+            The last error, the seconds until the next attempt is allowed,
+            and whether the circuit is 'open' or the site is in 'backoff'
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            retry_after = entry['retry_at'] - time.time()
+            if retry_after <= 0:
+                return None
+            self._fast_failures += 1
+            return {
+                'error': entry['error'],
+                'retry_after': round(retry_after, 1),
+                'circuit': 'open' if entry['failures'] >= self.threshold else 'backoff',
+                'failures': entry['failures']
+            }
+
+    def record_failure(self, key: str, error: Exception) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None) or {'failures': 0}
+            entry['failures'] += 1
+            if entry['failures'] >= self.threshold:
+                delay = self.cooldown
+            else:
+                delay = min(self.backoff * 2 ** (entry['failures'] - 1), self.backoff_max)
+            entry['retry_at'] = time.time() + delay
+            entry['error'] = str(error)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_success(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring.
+
+        Returns:
+            Sites currently failing, how many of them have an open circuit,
+            and how many checks were answered without contacting the site
+        """
+        with self._lock:
+            open_circuits = sum(1 for entry in self._entries.values() if entry['failures'] >= self.threshold)
+            return {
+                'failing': len(self._entries),
+                'open_circuits': open_circuits,
+                'fast_failures': self._fast_failures
+            }
@@ -0,0 +1,223 @@
+import asyncio
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Outbound fetches running at the same time, overall and against one host
+FETCH_MAX_CONCURRENCY = int(os.environ.get('HTTP_MAX_CONCURRENCY', 64))
+FETCH_PER_HOST_CONCURRENCY = int(os.environ.get('HTTP_PER_HOST_CONCURRENCY', 4))
+# Requests per second started against one host; 0 disables the rate limit
+FETCH_PER_HOST_RATE = float(os.environ.get('HTTP_PER_HOST_RATE', 5))
+
+
+class _Ticket:
+    """A waiting fetch; wake, if set, is called once it is granted a slot."""
+    __slots__ = ('granted', 'wake')
+
+    def __init__(self, wake: Optional[Callable[[], None]] = None):
+        self.granted = False
+        self.wake = wake
+
+
+class _Host:
+    __slots__ = ('active', 'next_at', 'waiters')
+
+    def __init__(self):
+        self.active = 0
+        self.next_at = 0.0
+        self.waiters: Deque[_Ticket] = deque()
+
+
+class FetchScheduler:
+    """Admission control for outbound fetches, shared by every thread.
+
+    Threads wait with acquire() and coroutines with acquire_async(), so
+    the blocking and the asyncio fetch paths share the same limits.
+
+    A fetch waits for a slot before it starts. Slots are bounded overall and
+    per host, requests to one host are spaced by its rate limit, and a host
+    that asked us to back off with Retry-After gets no slot until the delay
+    has passed. When a slot frees up, waiting hosts take turns, so one host
+    with a long queue cannot starve the others.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, per_host: Optional[int] = None,
+                 rate: Optional[float] = None):
+        self.max_concurrency = FETCH_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        self.per_host = FETCH_PER_HOST_CONCURRENCY if per_host is None else per_host
+        rate = FETCH_PER_HOST_RATE if rate is None else rate
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._cond = threading.Condition()
+        self._hosts: Dict[str, _Host] = {}
+        # Hosts with waiting fetches, in the order they get their next turn
+        self._turns: 'OrderedDict[str, None]' = OrderedDict()
+        # Idle hosts kept only for their rate limit or Retry-After, by expiry
+        self._expiring: List[Tuple[float, str]] = []
+        self._active = 0
+        self._counters = {'granted': 0, 'waited': 0, 'deferred': 0}
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    def acquire(self, url: str) -> str:
+        """Block until the URL's host may be fetched; returns the host to release."""
+        host = self.host_of(url)
+        ticket = _Ticket()
+        with self._cond:
+            delay = self._enqueue(host, ticket)
+            if not ticket.granted:
+                self._counters['waited'] += 1
+                while not ticket.granted:
+                    self._cond.wait(delay)
+                    delay = self._dispatch()
+        return host
+
+    async def acquire_async(self, url: str) -> str:
+        """Wait for the URL's host without blocking the event loop; see acquire."""
+        host = self.host_of(url)
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        ticket = _Ticket(lambda: loop.call_soon_threadsafe(woken.set))
+        with self._cond:
+            delay = self._enqueue(host, ticket)
+            if ticket.granted:
+                return host
+            self._counters['waited'] += 1
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(woken.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                woken.clear()
+                with self._cond:
+                    if not ticket.granted:
+                        delay = self._dispatch()
+                    if ticket.granted:
+                        return host
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket.granted:
+                    self.release(host)
+                else:
+                    self._withdraw(host, ticket)
+            raise
+
+    def release(self, host: str) -> None:
+        with self._cond:
+            state = self._hosts[host]
+            state.active -= 1
+            self._active -= 1
+            if not state.active and not state.waiters:
+                self._forget(host, state)
+            if self._dispatch() is not None:
+                # The free slot is held back by a rate limit, which waiters
+                # blocked on concurrency alone are not timing
+                self._wake_waiters()
+
+    def defer(self, host: str, seconds: float) -> None:
+        """Hold back new fetches of a host, as asked by a Retry-After header."""
+        with self._cond:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _Host()
+            state.next_at = max(state.next_at, time.monotonic() + seconds)
+            self._counters['deferred'] += 1
+            if not state.active and not state.waiters:
+                self._forget(host, state)
+
+    def _wake_waiters(self) -> None:
+        """Have every waiting fetch dispatch again and pick up its next delay."""
+        self._cond.notify_all()
+        for host in self._turns:
+            for ticket in self._hosts[host].waiters:
+                if ticket.wake is not None:
+                    ticket.wake()
+
+    def _enqueue(self, host: str, ticket: _Ticket) -> Optional[float]:
+        self._prune()
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host()
+        state.waiters.append(ticket)
+        self._turns.setdefault(host)
+        return self._dispatch()
+
+    def _withdraw(self, host: str, ticket: _Ticket) -> None:
+        """Take back a fetch that stopped waiting before it got a slot."""
+        state = self._hosts[host]
+        state.waiters.remove(ticket)
+        if not state.waiters:
+            self._turns.pop(host, None)
+            if not state.active:
+                self._forget(host, state)
+
+    def _forget(self, host: str, state: _Host) -> None:
+        """Drop an idle host now, or once its rate limit or delay has passed."""
+        if state.next_at <= time.monotonic():
+            del self._hosts[host]
+        else:
+            heapq.heappush(self._expiring, (state.next_at, host))
+
+    def _prune(self) -> None:
+        """Drop the idle hosts whose rate limit or delay has passed."""
+        now = time.monotonic()
+        while self._expiring and self._expiring[0][0] <= now:
+            _, host = heapq.heappop(self._expiring)
+            state = self._hosts.get(host)
+            if state is not None and not state.active and not state.waiters and state.next_at <= now:
+                del self._hosts[host]
+
+    def _dispatch(self) -> Optional[float]:
+        """Hand free slots to waiting hosts in turn.
+
+        Returns:
+            Seconds until a waiting host is next allowed to start, or None
+            when every waiting host is held back by concurrency alone
+        """
+        now = time.monotonic()
+        soonest = None
+        granted = False
+        for host in list(self._turns):
+            if self._active >= self.max_concurrency:
+                break
+            state = self._hosts[host]
+            if state.active >= self.per_host:
+                continue
+            if state.next_at > now:
+                wait = state.next_at - now
+                soonest = wait if soonest is None else min(soonest, wait)
+                continue
+            ticket = state.waiters.popleft()
+            ticket.granted = True
+            if ticket.wake is not None:
+                ticket.wake()
+            state.active += 1
+            self._active += 1
+            state.next_at = now + self.interval
+            self._counters['granted'] += 1
+            granted = True
+            # Served hosts go to the back of the line
+            del self._turns[host]
+            if state.waiters:
+                self._turns[host] = None
+        if granted:
+            self._cond.notify_all()
+        return soonest
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for monitoring, with the fetches running and waiting now."""
+        with self._cond:
+            self._prune()
+            return dict(
+                self._counters,
+                active=self._active,
+                waiting=sum(len(state.waiters) for state in self._hosts.values()),
+                hosts_waiting=len(self._turns),
+                hosts_tracked=len(self._hosts)
+            )
@@ -0,0 +1,66 @@
+import os
+from typing import List, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+
+# BeautifulSoup tree builders in order of preference. html.parser ships with
+# Python; lxml and html5lib are used when they are installed.
+PARSER_BACKENDS = ['lxml', 'html.parser', 'html5lib']
+
+# Elements checkout discovery needs; partial parses drop everything else
+CHECKOUT_TAGS = ['script', 'form', 'a', 'meta', 'img', 'input', 'button']
+
+# Preferred backend, or 'auto' for the fastest one available
+HTML_PARSER_BACKEND = os.environ.get('HTML_PARSER_BACKEND', 'auto')
+
+_available_backends: Optional[List[str]] = None
+
+
+def available_backends() -> List[str]:
+    """Return the parser backends that can be used in this environment."""
+    global _available_backends
+    if _available_backends is None:
+        backends = []
+        for backend in PARSER_BACKENDS:
+            try:
+                BeautifulSoup('<p></p>', backend)
+            except Exception:
+                continue
+            backends.append(backend)
+        _available_backends = backends
+    return _available_backends
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """Pick the backend to parse with.
+
+    Args:
+        backend: Requested backend, defaults to HTML_PARSER_BACKEND. A
+            backend that is not installed falls back to the fastest
+            available one.
+    """
+    backend = backend or HTML_PARSER_BACKEND
+    available = available_backends()
+    if backend in available:
+        return backend
+    if backend != 'auto' and backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend: {backend}")
+    return available[0]
+
+
+def parse_html(html: str, backend: Optional[str] = None, partial: bool = False) -> BeautifulSoup:
+    """Parse a page with the configured backend.
+
+    Args:
+        html: The page content
+        backend: Parser backend to use instead of the configured one
+        partial: Keep only the CHECKOUT_TAGS elements and their contents,
+            which is much lighter for checkout-link discovery
+
+    Returns:
+        The parsed tree
+    """
+    backend = resolve_backend(backend)
+    # html5lib does not support partial parsing and ignores the strainer
+    if partial and backend != 'html5lib':
+        return BeautifulSoup(html, backend, parse_only=SoupStrainer(CHECKOUT_TAGS))
+    return BeautifulSoup(html, backend)
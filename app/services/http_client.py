@@ -0,0 +1,365 @@
+import codecs
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from urllib3.util import Retry, make_headers
+from app.services.fetch_scheduler import FetchScheduler
+
+# Connection pooling: number of hosts kept pooled, and connections per host
+POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 200))
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))
+
+# Uniform (connect, read) timeouts in seconds
+CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 15))
+
+# Retries for connection errors and transient server errors
+MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF', 0.5))
+RETRY_STATUSES = (500, 502, 504)
+# Statuses retried through the scheduler, which holds the host back for the
+# Retry-After delay; longer delays than this are not waited for
+SCHEDULER_RETRY_STATUSES = (429, 503)
+MAX_RETRY_AFTER = float(os.environ.get('HTTP_MAX_RETRY_AFTER', 60))
+
+# Limits applied while downloading a page body
+MAX_BODY_BYTES = int(os.environ.get('STRIPE_MAX_BODY_BYTES', 5 * 1024 * 1024))
+FETCH_DEADLINE = float(os.environ.get('STRIPE_FETCH_DEADLINE', 15))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    # gzip and deflate always, br when a brotli decoder is installed
+    'Accept-Encoding': make_headers(accept_encoding=True)['accept-encoding'],
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+Timeout = Union[float, Tuple[float, float]]
+
+_adapter: Optional[HTTPAdapter] = None
+_adapter_lock = threading.Lock()
+_local = threading.local()
+
+# Every blocking fetch waits here for its turn against the host
+scheduler = FetchScheduler()
+
+
+def _shared_adapter() -> HTTPAdapter:
+    """Return the adapter, and so the connection pools, shared by all threads."""
+    global _adapter
+    if _adapter is None:
+        with _adapter_lock:
+            if _adapter is None:
+                retries = Retry(
+                    total=MAX_RETRIES,
+                    backoff_factor=RETRY_BACKOFF,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset(['GET', 'HEAD']),
+                    # Retry-After is handled by the scheduler, see get()
+                    respect_retry_after_header=False,
+                    raise_on_status=False
+                )
+                _adapter = HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS,
+                    pool_maxsize=POOL_MAXSIZE,
+                    max_retries=retries
+                )
+    return _adapter
+
+
+def get_session() -> requests.Session:
+    """Return this thread's session.
+
+    Sessions are not safe to share between threads, so each thread gets its
+    own, but they all mount the same adapter and therefore reuse the same
+    per-host keep-alive connection pools.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(DEFAULT_HEADERS)
+        adapter = _shared_adapter()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+def retry_after(response: requests.Response, attempt: int) -> float:
+    """Seconds to wait before retrying a 429 or 503 response.
+
+    Uses the Retry-After header, in seconds or as an HTTP date, and falls
+    back to exponential backoff when the header is missing or invalid.
+    """
+    value = response.headers.get('Retry-After', '').strip()
+    if value.isdigit():
+        return float(value)
+    if value:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return RETRY_BACKOFF * 2 ** attempt
+
+
+def _release_on_close(response: requests.Response, host: str) -> None:
+    """Keep the host's scheduler slot until a streamed response is closed."""
+    close = response.close
+    released = threading.Event()
+
+    def close_and_release() -> None:
+        try:
+            close()
+        finally:
+            if not released.is_set():
+                released.set()
+                scheduler.release(host)
+
+    response.close = close_and_release
+
+
+def get(url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[Timeout] = None,
+        stream: bool = False, **kwargs: Any) -> requests.Response:
+    """Fetch a URL through the scheduler and the shared connection pools.
+
+    429 and 503 responses hold the host back for their Retry-After delay
+    and are retried up to MAX_RETRIES times, unless the delay exceeds
+    MAX_RETRY_AFTER.
+
+    Args:
+        url: The URL to fetch
+        headers: Headers to send on top of DEFAULT_HEADERS
+        timeout: Seconds, or a (connect, read) tuple, defaults to
+            (CONNECT_TIMEOUT, READ_TIMEOUT)
+        stream: Leave the body unread so it can be consumed incrementally;
+            the caller must close the response, which also frees its
+            scheduler slot
+
+    Returns:
+        The response, whatever its status code
+    """
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    attempt = 0
+    while True:
+        host = scheduler.acquire(url)
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout, stream=stream, **kwargs)
+        except BaseException:
+            scheduler.release(host)
+            raise
+        if response.status_code not in SCHEDULER_RETRY_STATUSES:
+            break
+        delay = retry_after(response, attempt)
+        scheduler.defer(host, min(delay, MAX_RETRY_AFTER))
+        if attempt >= MAX_RETRIES or delay > MAX_RETRY_AFTER:
+            break
+        response.close()
+        scheduler.release(host)
+        attempt += 1
+
+    if stream:
+        _release_on_close(response, host)
+    else:
+        scheduler.release(host)
+    return response
+
+
+class BodyReader:
+    """Decode a response body incrementally while enforcing download limits.
+
+    Shared by the blocking and the asyncio fetch paths: feed it the raw
+    chunks as they arrive and stop reading once feed() returns True.
+    """
+
+    def __init__(self, encoding: Optional[str] = None, stop: Optional[Callable[[str], bool]] = None,
+                 max_bytes: Optional[int] = None, deadline: Optional[float] = None):
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._stop = stop
+        self._max_bytes = MAX_BODY_BYTES if max_bytes is None else max_bytes
+        self._deadline_at = time.monotonic() + (FETCH_DEADLINE if deadline is None else deadline)
+        self._chunks = []
+        self.received = 0
+        self.stopped: Optional[str] = None
+
+    @property
+    def remaining(self) -> float:
+        """Seconds left before the deadline."""
+        return self._deadline_at - time.monotonic()
+
+    def time_out(self) -> None:
+        """Record that the deadline passed while waiting for the next chunk."""
+        self.stopped = 'deadline'
+
+    def feed(self, chunk: bytes) -> bool:
+        """Take the next raw chunk; returns True when reading should stop."""
+        if not chunk:
+            return False
+        chunk = chunk[:self._max_bytes - self.received]
+        self.received += len(chunk)
+        text = self._decoder.decode(chunk)
+        self._chunks.append(text)
+
+        if self._stop is not None and self._stop(text):
+            self.stopped = 'stop'
+        elif self.received >= self._max_bytes:
+            self.stopped = 'max_bytes'
+        elif time.monotonic() >= self._deadline_at:
+            self.stopped = 'deadline'
+        return self.stopped is not None
+
+    def finish(self, url: str) -> Tuple[str, Dict[str, Any]]:
+        """Return the text received and a summary of how reading ended.
+
+        Raises:
+            TimeoutError: When the deadline passed before any content arrived
+        """
+        if not self.stopped:
+            self._chunks.append(self._decoder.decode(b'', final=True))
+        elif not self.received:
+            raise TimeoutError(f"No content received from {url} before the deadline")
+        return ''.join(self._chunks), {'bytes': self.received, 'stopped': self.stopped}
+
+
+def cache_validators(headers: Mapping[str, str]) -> Dict[str, str]:
+    """Pick the headers a response can later be revalidated with."""
+    validators = {}
+    if headers.get('ETag'):
+        validators['etag'] = headers['ETag']
+    if headers.get('Last-Modified'):
+        validators['last_modified'] = headers['Last-Modified']
+    return validators
+
+
+def conditional_headers(validators: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """Build the request headers that ask for a page only if it changed."""
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def _iter_body(response: requests.Response, reader: BodyReader) -> Iterator[bytes]:
+    """Yield a streamed body as it arrives, never waiting past the reader's deadline.
+
+    Each read returns whatever the server has sent so far instead of filling
+    a whole chunk, and the socket timeout is cut to the time left, so a
+    server trickling bytes cannot hold the download open past the deadline.
+    """
+    raw = response.raw
+    sock = getattr(getattr(raw, 'connection', None), 'sock', None)
+    # urllib3 before 2.1 has no read1(); read() waits for a full chunk, so
+    # there the deadline is only checked between chunks
+    read = getattr(raw, 'read1', None) or raw.read
+    while True:
+        remaining = reader.remaining
+        if remaining <= 0:
+            reader.time_out()
+            return
+        if sock is not None:
+            sock.settimeout(min(READ_TIMEOUT, remaining))
+        try:
+            chunk = read(STREAM_CHUNK_SIZE, decode_content=True)
+        except ReadTimeoutError as e:
+            if remaining <= READ_TIMEOUT:
+                reader.time_out()
+                return
+            raise requests.ConnectionError(e)
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        if not chunk:
+            return
+        yield chunk
+
+
+def download_text(url: str, stop: Optional[Callable[[str], bool]] = None,
+                  max_bytes: Optional[int] = None, deadline: Optional[float] = None,
+                  headers: Optional[Dict[str, str]] = None) -> Tuple[requests.Response, str, Dict[str, Any]]:
+    """Stream a page body and decode it incrementally.
+
+    Args:
+        url: The URL to fetch
+        stop: Called with each decoded chunk; returning True ends the
+            download early
+        max_bytes: Stop after this many bytes, defaults to MAX_BODY_BYTES
+        deadline: Total seconds allowed, defaults to FETCH_DEADLINE
+        headers: Headers to send on top of DEFAULT_HEADERS, such as
+            conditional_headers()
+
+    Returns:
+        The closed response, the text received, and a summary with the
+        byte count, why the download stopped ('stop', 'max_bytes',
+        'deadline', or None when the whole body was read), the response's
+        cache validators if it has any, and not_modified for a 304
+
+    Raises:
+        requests.HTTPError: For error responses
+        TimeoutError: When the deadline passes before any content arrives
+    """
+    deadline = FETCH_DEADLINE if deadline is None else deadline
+    response = get(url, headers=headers, timeout=(CONNECT_TIMEOUT, min(READ_TIMEOUT, deadline)), stream=True)
+    try:
+        response.raise_for_status()
+        if response.status_code == 304:
+            text, info = '', {'bytes': 0, 'stopped': None, 'not_modified': True}
+        else:
+            # The deadline covers the whole download, headers included, but
+            # not the time spent waiting for a scheduler slot
+            reader = BodyReader(response.encoding, stop, max_bytes, deadline - response.elapsed.total_seconds())
+            for chunk in _iter_body(response, reader):
+                if reader.feed(chunk):
+                    break
+            text, info = reader.finish(url)
+    finally:
+        response.close()
+
+    validators = cache_validators(response.headers)
+    if validators:
+        info['validators'] = validators
+    return response, text, info
+
+
+def connection_stats() -> Dict[str, Any]:
+    """Report connection reuse for the hosts currently held in the pools.
+
+    Returns:
+        Totals of requests sent and connections opened, the number of
+        requests that reused a kept-alive connection, and the same figures
+        per host
+    """
+    pools = _shared_adapter().poolmanager.pools
+    hosts = {}
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        host = f"{pool.scheme}://{pool.host}:{pool.port}"
+        stats = hosts.setdefault(host, {'requests': 0, 'connections': 0})
+        stats['requests'] += pool.num_requests
+        stats['connections'] += pool.num_connections
+    for stats in hosts.values():
+        stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+
+    total_requests = sum(stats['requests'] for stats in hosts.values())
+    total_connections = sum(stats['connections'] for stats in hosts.values())
+    return {
+        'pools': len(hosts),
+        'requests': total_requests,
+        'connections': total_connections,
+        'reused': max(total_requests - total_connections, 0),
+        'hosts': hosts
+    }
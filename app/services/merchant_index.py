@@ -0,0 +1,223 @@
+"""Precomputed index of known merchants, answered without any network I/O.
+
+The index is a sorted table of fixed-width records, memory-mapped and
+searched by bisection, so a lookup touches a handful of pages and loading
+it costs nothing however many merchants it holds. Build it from the
+persistent detection cache with::
+
+    python -m app.services.merchant_index build [--max-age DAYS] [--output PATH] [--if-missing]
+
+The index is built on each deployment from that deployment's own cache, so
+no index ships with the code: run the build with --if-missing before the
+workers start (the development server does it itself), and periodically
+to pick up new results. Rebuilding replaces the file atomically; running
+workers notice the new file and switch to it without a restart.
+"""
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+MERCHANT_INDEX_PATH = os.environ.get(
+    'STRIPE_MERCHANT_INDEX', os.path.join(_ROOT_DIR, "data", "known_merchants.idx")
+)
+# Only results checked within this many days are indexed
+MERCHANT_INDEX_MAX_AGE_DAYS = 30
+# Seconds between checks for a rebuilt index file
+MERCHANT_INDEX_RELOAD_INTERVAL = float(os.environ.get('STRIPE_MERCHANT_INDEX_RELOAD', 30))
+
+MAGIC = b'KMIDX001'
+HEADER = struct.Struct('<8sI')
+# key, status, confidence, platform, checked at (unix time)
+RECORD = struct.Struct('<64sBf16sI')
+KEY_SIZE = 64
+
+STATUS_CODES = {'disabled': 0, 'enabled': 1}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+class MerchantIndex:
+    """Read-only view of one index file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if stat.st_size < HEADER.size:
+                raise ValueError(f"{path} is not a merchant index")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or len(self._map) != HEADER.size + self.count * RECORD.size:
+            raise ValueError(f"{path} is not a merchant index")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _key_at(self, i: int) -> bytes:
+        offset = HEADER.size + i * RECORD.size
+        return self._map[offset:offset + KEY_SIZE]
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the indexed status of a cache key, or None if it is unknown."""
+        encoded = key.encode('utf-8')
+        if len(encoded) > KEY_SIZE:
+            return None
+        target = encoded.ljust(KEY_SIZE, b'\0')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or self._key_at(lo) != target:
+            return None
+        _, status, confidence, platform, checked_at = RECORD.unpack_from(self._map, HEADER.size + lo * RECORD.size)
+        return {
+            'status': STATUS_NAMES[status],
+            'confidence': round(confidence, 2),
+            'platform': platform.rstrip(b'\0').decode('utf-8') or None,
+            'checked_at': checked_at
+        }
+
+
+class KnownMerchants:
+    """The current index, swapped for a rebuilt one when the file changes.
+
+    A missing or unreadable file simply means no merchant is known.
+    """
+
+    def __init__(self, path: str = MERCHANT_INDEX_PATH, reload_interval: float = MERCHANT_INDEX_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._index: Optional[MerchantIndex] = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[MerchantIndex]:
+        """Return the index, reopening the file if it was replaced."""
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload()
+        return self._index
+
+    def reload(self) -> None:
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._index = None
+                return
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if self._index is not None and self._index.identity == identity:
+                return
+            try:
+                # Lookups still running on the old map keep it alive until they finish
+                self._index = MerchantIndex(self.path)
+            except (OSError, ValueError) as e:
+                print(f"Error loading merchant index: {e}")
+                self._index = None
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        index = self.current()
+        return index.lookup(key) if index is not None else None
+
+
+def write_index(path: str, records: Iterable[Tuple[str, str, float, Optional[str], int]]) -> int:
+    """Write an index file atomically.
+
+    Args:
+        path: Where to write the index
+        records: (key, status, confidence, platform, checked_at) tuples;
+            keys longer than the key field are skipped
+
+    Returns:
+        The number of records written
+    """
+    rows: List[Tuple[bytes, int, float, bytes, int]] = []
+    for key, status, confidence, platform, checked_at in records:
+        encoded = key.encode('utf-8')
+        if len(encoded) > KEY_SIZE or status not in STATUS_CODES:
+            continue
+        rows.append((encoded, STATUS_CODES[status], confidence, (platform or '').encode('utf-8')[:16], int(checked_at)))
+    rows.sort(key=lambda row: row[0].ljust(KEY_SIZE, b'\0'))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Per process, as several workers may build the same index at once
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(rows)))
+        for row in rows:
+            f.write(RECORD.pack(*row))
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def records_from_cache(entries: Iterable[Tuple[str, Dict[str, Any]]], max_age: Optional[float] = None,
+                       now: Optional[float] = None) -> Iterable[Tuple[str, str, float, Optional[str], int]]:
+    """Pick index records from persistent detection cache entries.
+
+    Args:
+        entries: (key, entry) pairs from the detection store
+        max_age: Skip results last checked more than this many seconds ago
+
+    Yields:
+        (key, status, confidence, platform, checked_at) for every
+        successful detection
+    """
+    from app.services.stripe_detector import result_status
+
+    now = time.time() if now is None else now
+    for key, entry in entries:
+        result = entry['result']
+        status = result_status(result)
+        if status == 'unknown' or (max_age is not None and now - entry['timestamp'] > max_age):
+            continue
+        platform = result.get('details', {}).get('platform')
+        yield key, status, result.get('confidence', 0), platform, entry['timestamp']
+
+
+def build_index(path: str = MERCHANT_INDEX_PATH, max_age_days: float = MERCHANT_INDEX_MAX_AGE_DAYS,
+                if_missing: bool = False) -> Optional[int]:
+    """Build the index from the persistent detection cache.
+
+    Args:
+        path: Index file to write
+        max_age_days: Only index results checked within this many days
+        if_missing: Leave an existing index file alone
+
+    Returns:
+        The number of merchants written, or None when the file was kept
+    """
+    if if_missing and os.path.exists(path):
+        return None
+    from app.services import result_cache
+
+    records = records_from_cache(result_cache.detection_cache.store.items(), max_age=max_age_days * 86400)
+    return write_index(path, records)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Build the known-merchant index from the detection cache.')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build = subcommands.add_parser('build', help='Build the index from the persistent detection cache')
+    build.add_argument('--output', default=MERCHANT_INDEX_PATH, help='Index file to write')
+    build.add_argument('--max-age', type=float, default=MERCHANT_INDEX_MAX_AGE_DAYS,
+                       help='Only index results checked within this many days')
+    build.add_argument('--if-missing', action='store_true', help='Keep an existing index instead of rebuilding it')
+    args = parser.parse_args(argv)
+
+    count = build_index(args.output, args.max_age, args.if_missing)
+    if count is None:
+        print(f"Kept the existing index {args.output}")
+    else:
+        print(f"Wrote {count} merchants to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
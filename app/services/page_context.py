@@ -0,0 +1,83 @@
+from typing import Any, Dict, Optional
+import requests
+from bs4 import BeautifulSoup
+from app.services import http_client
+from app.services.html_parser import parse_html
+from app.services.page_features import PageFeatures, extract_features
+
+
+class PageContext:
+    """Request-scoped view of one page, fetched and parsed at most once.
+
+    Detection, platform identification and checkout-link extraction all read
+    the page through the same context, so one request downloads the page a
+    single time and shares the response, the HTML and the parsed trees. A
+    failed fetch is remembered and raised again instead of being retried.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._response: Optional[requests.Response] = None
+        self._html: Optional[str] = None
+        self._fetch_info: Dict[str, Any] = {}
+        self._error: Optional[Exception] = None
+        self._soup: Optional[BeautifulSoup] = None
+        self._partial_soup: Optional[BeautifulSoup] = None
+        self._features: Optional[PageFeatures] = None
+
+    def _fetch(self) -> None:
+        if self._error is not None:
+            raise self._error
+        if self._html is not None:
+            return
+        try:
+            self._response, self._html, self._fetch_info = http_client.download_text(self.url)
+        except Exception as e:
+            self._error = e
+            raise
+
+    @property
+    def fetched(self) -> bool:
+        """Whether the page has been downloaded already."""
+        return self._html is not None
+
+    @property
+    def response(self) -> requests.Response:
+        """The (closed) response the page was served with."""
+        self._fetch()
+        return self._response
+
+    @property
+    def html(self) -> str:
+        """The page content, downloaded on first use."""
+        self._fetch()
+        return self._html
+
+    @property
+    def fetch_info(self) -> Dict[str, Any]:
+        """Byte count and stop reason of the download."""
+        self._fetch()
+        return self._fetch_info
+
+    def soup(self, partial: bool = False) -> BeautifulSoup:
+        """Return the parsed page, parsing it on first use.
+
+        Args:
+            partial: Accept a partial parse holding only the checkout
+                elements; the full tree is returned when it already exists
+        """
+        if self._soup is not None:
+            return self._soup
+        if partial:
+            if self._partial_soup is None:
+                self._partial_soup = parse_html(self.html, partial=True)
+            return self._partial_soup
+        self._soup = parse_html(self.html)
+        return self._soup
+
+    @property
+    def features(self) -> PageFeatures:
+        """Detector features of the fully parsed page."""
+        if self._features is None:
+            self._features = extract_features(self.soup())
+        return self._features
@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+from bs4 import BeautifulSoup, Tag
+
+
+@dataclass
+class PageFeatures:
+    """Compact record of the parts of a page the Stripe detectors look at.
+
+    Strings are kept in document order and with their original case, so the
+    detectors can apply exactly the checks they used to run on the tree.
+    """
+    # (src, type, body) of every <script>
+    scripts: List[Tuple[str, str, Optional[str]]] = field(default_factory=list)
+    # (action, string values of data-* attributes) of every <form>
+    forms: List[Tuple[str, List[str]]] = field(default_factory=list)
+    # href of every <a> that has one
+    hrefs: List[str] = field(default_factory=list)
+    # content of every <meta>
+    meta_contents: List[str] = field(default_factory=list)
+    # (src, alt) of every <img>
+    images: List[Tuple[str, str]] = field(default_factory=list)
+    # id, class and data- values of every <div>, <span> and <iframe>
+    container_tokens: List[str] = field(default_factory=list)
+    # data-processor values of every <form> and <div>
+    data_processors: List[str] = field(default_factory=list)
+    # data-json values of every element
+    data_json: List[str] = field(default_factory=list)
+    # Names of data-* attributes used anywhere on the page
+    data_attributes: Set[str] = field(default_factory=set)
+    # Class tokens used anywhere on the page
+    class_tokens: Set[str] = field(default_factory=set)
+    # name of every <input> and <div>
+    field_names: List[str] = field(default_factory=list)
+
+    @property
+    def json_scripts(self) -> List[str]:
+        """Bodies of the scripts with a JSON type, such as JSON-LD blobs."""
+        return [body for _, script_type, body in self.scripts if 'json' in script_type and body]
+
+
+def extract_features(soup: BeautifulSoup) -> PageFeatures:
+    """Walk the parsed tree once and collect the features of every detector."""
+    features = PageFeatures()
+    for tag in soup.descendants:
+        if not isinstance(tag, Tag):
+            continue
+        name = tag.name
+        attrs: Dict[str, object] = tag.attrs
+        classes = attrs.get('class', [])
+        if isinstance(classes, str):
+            classes = classes.split()
+
+        for attr_name, attr_value in attrs.items():
+            if attr_name.startswith('data-'):
+                features.data_attributes.add(attr_name)
+        features.class_tokens.update(classes)
+        if isinstance(attrs.get('data-json'), str):
+            features.data_json.append(attrs['data-json'])
+
+        if name == 'script':
+            features.scripts.append((attrs.get('src', ''), attrs.get('type') or '', tag.string))
+        elif name == 'form':
+            data_values = [
+                value for attr_name, value in attrs.items()
+                if attr_name.startswith('data-') and isinstance(value, str)
+            ]
+            features.forms.append((attrs.get('action', ''), data_values))
+        elif name == 'a':
+            if 'href' in attrs:
+                features.hrefs.append(attrs['href'])
+        elif name == 'meta':
+            features.meta_contents.append(attrs.get('content', ''))
+        elif name == 'img':
+            features.images.append((attrs.get('src', ''), attrs.get('alt', '')))
+
+        if name in ('div', 'span', 'iframe'):
+            features.container_tokens.append(attrs.get('id', ''))
+            features.container_tokens.append(' '.join(classes))
+            features.container_tokens.append(str(attrs.get('data-', '')))
+        if name in ('form', 'div') and isinstance(attrs.get('data-processor'), str):
+            features.data_processors.append(attrs['data-processor'])
+        if name in ('input', 'div') and attrs.get('name'):
+            features.field_names.append(attrs['name'])
+    return features
@@ -0,0 +1,238 @@
+"""Product and variant IDs from the storefront platforms' own JSON endpoints.
+
+Shopify serves every product as a small JSON document at
+/products/<handle>.js, and WooCommerce serves its catalog through the Store
+API at /wp-json/wc/store/v1/products. Both are much lighter than the
+product page, so adapters try them first and only scrape the page when the
+endpoint is missing or does not know the product, or when the page has
+been downloaded already.
+"""
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from bs4 import BeautifulSoup
+from app.services import http_client
+from app.services.page_context import PageContext
+
+# Product JSON documents fetched at the same time by a batch resolution
+ADAPTER_WORKERS = int(os.environ.get('PLATFORM_ADAPTER_WORKERS', 8))
+
+# Products asked for in one Store API request
+WOOCOMMERCE_BATCH_SIZE = 100
+
+
+@dataclass
+class ProductIds:
+    """What a platform needs to put a product in a cart."""
+    product_id: Optional[str]
+    variant_id: Optional[str] = None
+    # 'json' when read from the platform endpoint, 'html' when scraped
+    source: str = 'json'
+
+
+def _fetch_json(url: str) -> Any:
+    """Return the decoded JSON at a URL, or None when there is none."""
+    try:
+        response = http_client.get(url, headers={'Accept': 'application/json'})
+        if response.status_code != 200:
+            return None
+        return response.json()
+    except Exception as e:
+        print(f"Error fetching {url}: {e}")
+        return None
+
+
+def _store_url(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _loads(text: Optional[str]) -> Any:
+    try:
+        return json.loads(text or '')
+    except ValueError:
+        return None
+
+
+class ShopifyAdapter:
+    platform = 'shopify'
+
+    @staticmethod
+    def handle(url: str) -> Optional[str]:
+        """The decoded product handle in a /products/<handle> or /collections/.../products/<handle> URL."""
+        segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+        if 'products' in segments[:-1]:
+            return unquote(segments[segments.index('products') + 1])
+        return None
+
+    def _from_json(self, url: str, data: Any) -> Optional[ProductIds]:
+        if not isinstance(data, dict):
+            return None
+        variants = [v for v in data.get('variants') or [] if isinstance(v, dict) and v.get('id')]
+        requested = parse_qs(urlsplit(url).query).get('variant', [None])[0]
+        variant = next((v for v in variants if str(v.get('id')) == requested), None)
+        if variant is None:
+            variant = next((v for v in variants if v.get('available', True)), variants[0] if variants else None)
+        if variant is None:
+            return None
+        return ProductIds(str(data['id']) if data.get('id') else None, str(variant['id']))
+
+    def resolve_many(self, urls: List[str]) -> Dict[str, Optional[ProductIds]]:
+        """Read each product's /products/<handle>.js, several at a time."""
+        endpoints = {}
+        for url in urls:
+            handle = self.handle(url)
+            if handle:
+                endpoints[url] = f"{_store_url(url)}/products/{quote(handle)}.js"
+        resolved: Dict[str, Optional[ProductIds]] = {url: None for url in urls}
+        if not endpoints:
+            return resolved
+        with ThreadPoolExecutor(max_workers=min(ADAPTER_WORKERS, len(endpoints))) as executor:
+            documents = executor.map(_fetch_json, endpoints.values())
+            for url, data in zip(endpoints, documents):
+                resolved[url] = self._from_json(url, data)
+        return resolved
+
+    def from_html(self, url: str, soup: BeautifulSoup) -> Optional[ProductIds]:
+        """Read the IDs from the product page's ProductJson script or cart form."""
+        for script in soup.find_all('script', type='application/json'):
+            if 'ProductJson' in script.get('id', ''):
+                ids = self._from_json(url, _loads(script.string))
+                if ids is not None:
+                    return ProductIds(ids.product_id, ids.variant_id, 'html')
+
+        form = soup.find('form', action=lambda x: x and '/cart/add' in x)
+        if form:
+            variant_input = form.find('input', {'name': 'id'})
+            if variant_input and variant_input.get('value'):
+                return ProductIds(None, variant_input['value'], 'html')
+        return None
+
+    def checkout_url(self, url: str, ids: ProductIds) -> str:
+        return f"https://{urlsplit(url).netloc}/cart/{ids.variant_id}:1"
+
+
+class WooCommerceAdapter:
+    platform = 'woocommerce'
+
+    @staticmethod
+    def slug(url: str) -> Optional[str]:
+        """The decoded product slug in a /product/<slug>/ URL."""
+        segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+        if 'product' in segments[:-1]:
+            return unquote(segments[segments.index('product') + 1])
+        return None
+
+    @staticmethod
+    def _from_json(data: Dict[str, Any]) -> Optional[ProductIds]:
+        if not data.get('id'):
+            return None
+        variations = data.get('variations') or []
+        variant_id = str(variations[0]['id']) if variations and variations[0].get('id') else None
+        return ProductIds(str(data['id']), variant_id)
+
+    def resolve_many(self, urls: List[str]) -> Dict[str, Optional[ProductIds]]:
+        """Look products up by slug, one Store API request per store and batch."""
+        by_store: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+        for url in urls:
+            slug = self.slug(url)
+            if slug:
+                by_store[_store_url(url)][slug].append(url)
+
+        resolved: Dict[str, Optional[ProductIds]] = {url: None for url in urls}
+        batches: List[Tuple[str, Dict[str, List[str]]]] = []
+        for store, slugs in by_store.items():
+            names = list(slugs)
+            for i in range(0, len(names), WOOCOMMERCE_BATCH_SIZE):
+                batch = names[i:i + WOOCOMMERCE_BATCH_SIZE]
+                endpoint = (f"{store}/wp-json/wc/store/v1/products"
+                            f"?slug={quote(','.join(batch), safe=',')}&per_page={len(batch)}")
+                batches.append((endpoint, {slug: slugs[slug] for slug in batch}))
+        if not batches:
+            return resolved
+
+        with ThreadPoolExecutor(max_workers=min(ADAPTER_WORKERS, len(batches))) as executor:
+            for (_, slugs), products in zip(batches, executor.map(_fetch_json, [endpoint for endpoint, _ in batches])):
+                if not isinstance(products, list):
+                    continue
+                for product in products:
+                    # WordPress stores non-ASCII slugs percent-encoded
+                    slug = product.get('slug') if isinstance(product, dict) else None
+                    slug = unquote(slug) if isinstance(slug, str) else None
+                    if slug in slugs:
+                        ids = self._from_json(product)
+                        for url in slugs[slug]:
+                            resolved[url] = ids
+        return resolved
+
+    def from_html(self, url: str, soup: BeautifulSoup) -> Optional[ProductIds]:
+        """Read the product ID from the page's add-to-cart form."""
+        add_to_cart_form = soup.find('form', {'class': 'cart'})
+        if add_to_cart_form:
+            product_input = add_to_cart_form.find('input', {'name': 'add-to-cart'})
+            if product_input and product_input.get('value'):
+                return ProductIds(product_input['value'], source='html')
+        return None
+
+    def checkout_url(self, url: str, ids: ProductIds) -> str:
+        return f"{_store_url(url)}/checkout/?add-to-cart={ids.variant_id or ids.product_id}&quantity=1"
+
+
+ADAPTERS = {adapter.platform: adapter for adapter in (ShopifyAdapter(), WooCommerceAdapter())}
+
+
+def _scrape(adapter: Any, url: str, page: PageContext) -> Optional[ProductIds]:
+    try:
+        return adapter.from_html(url, page.soup(partial=True))
+    except Exception as e:
+        print(f"Error reading {adapter.platform} product page {url}: {e}")
+        return None
+
+
+def resolve_products(urls: List[str], platform: str,
+                     pages: Optional[Dict[str, PageContext]] = None) -> Dict[str, Optional[ProductIds]]:
+    """Resolve the product and variant IDs of many products of one platform.
+
+    Pages already downloaded are scraped first, since that costs no request.
+    The other products are looked up at the platform's JSON endpoint, in as
+    few requests as it allows, and those it cannot resolve are scraped from
+    their pages after all.
+
+    Args:
+        urls: Product page URLs
+        platform: 'shopify' or 'woocommerce'
+        pages: Request-scoped contexts to scrape pages from, by URL
+
+    Returns:
+        The IDs of every URL, None where neither source had them
+    """
+    adapter = ADAPTERS.get(platform)
+    if adapter is None:
+        return {url: None for url in urls}
+    pages = pages or {}
+    resolved: Dict[str, Optional[ProductIds]] = {}
+    for url in urls:
+        page = pages.get(url)
+        if page is not None and page.fetched:
+            resolved[url] = _scrape(adapter, url, page)
+    scraped = set(resolved)
+    lookups = [url for url in urls if resolved.get(url) is None]
+    resolved.update(adapter.resolve_many(lookups) if lookups else {})
+    for url in lookups:
+        if resolved[url] is None and url not in scraped:
+            resolved[url] = _scrape(adapter, url, pages.get(url) or PageContext(url))
+    return {url: resolved[url] for url in urls}
+
+
+def resolve_product(url: str, platform: str, page: Optional[PageContext] = None) -> Optional[ProductIds]:
+    """Resolve one product's IDs; see resolve_products."""
+    return resolve_products([url], platform, {url: page} if page is not None else None)[url]
+
+
+def checkout_url(url: str, platform: str, ids: ProductIds) -> str:
+    """Build the platform's direct checkout URL for resolved IDs."""
+    return ADAPTERS[platform].checkout_url(url, ids)
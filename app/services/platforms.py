@@ -0,0 +1,41 @@
+from typing import Any, Dict, FrozenSet, Optional
+from app.services import result_cache
+from app.services.cache_keys import site_of, site_of_url
+from app.services.signatures import scan_signatures
+
+# Platforms told apart by their signatures, in order of precedence, with the
+# signature tag that identifies each. Shopify and WooCommerce have stricter
+# tags than the plain name the Stripe heuristics look for.
+PLATFORMS = (
+    ('shopify', 'shopify_store'),
+    ('woocommerce', 'woocommerce_store'),
+    ('bigcommerce', 'bigcommerce'),
+    ('webflow', 'webflow')
+)
+
+
+def platform_from_hits(hits: FrozenSet[str]) -> Optional[str]:
+    """Name the e-commerce platform whose signatures a page carries, if any."""
+    for platform, tag in PLATFORMS:
+        if tag in hits:
+            return platform
+    return None
+
+
+def identify_platform(html: str) -> Optional[str]:
+    """Name the e-commerce platform a page is served by, if any."""
+    return platform_from_hits(scan_signatures(html))
+
+
+def remember_platform(key: str, platform: Optional[str]) -> None:
+    """Record the platform of the site a cache key belongs to.
+
+    None is recorded too, so sites on no known platform are not sniffed
+    again either.
+    """
+    result_cache.platform_cache.set(site_of(key), {'platform': platform})
+
+
+def cached_platform(url: str) -> Optional[Dict[str, Any]]:
+    """Return {'platform': name or None} for the URL's site, or None if unknown."""
+    return result_cache.platform_cache.get(site_of_url(url))
@@ -1,86 +1,251 @@
-from typing import List, Dict, Any
-from app.services.stripe_detector import is_stripe_enabled
-from urllib.parse import urlparse
-import json
+from typing import Iterator, List, Dict, Any, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from app.services import result_cache
+from app.services.stripe_detector import cache_key, error_result, get_cached_result, is_stripe_enabled, result_status
 import os
 import time
 
-# Cache file path for validated products
-_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-_CACHE_PATH = os.path.join(_ROOT_DIR, "data", "validated_sites.json")
+# Domains validated in parallel per request, and seconds allowed for a whole batch
+VALIDATION_WORKERS = int(os.environ.get('VALIDATION_WORKERS', 16))
+VALIDATION_DEADLINE = float(os.environ.get('VALIDATION_DEADLINE', 60))
 
-# Load cache if it exists
-site_validation_cache = {}
-if os.path.exists(_CACHE_PATH):
-    try:
-        with open(_CACHE_PATH, "r", encoding="utf-8") as f:
-            site_validation_cache = json.load(f)
-    except:
-        # If loading fails, start with empty cache
-        site_validation_cache = {}
-
-def validate_products(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def validate_products(products: List[Dict[str, Any]], max_workers: Optional[int] = None,
+                      deadline: Optional[float] = None) -> List[Dict[str, Any]]:
     """Filter a list of products to only those using Stripe for payment.
     
+    Products are grouped by domain and every uncached domain is checked once,
+    in parallel, before the verdicts are fanned back out to the products.
+    
     Args:
         products: List of product dictionaries, each containing at least a 'url' key
+        max_workers: Domains checked at the same time, defaults to VALIDATION_WORKERS
+        deadline: Seconds allowed for the whole batch, defaults to
+            VALIDATION_DEADLINE; domains still unchecked by then are left out
         
     Returns:
-        Filtered list of products that use Stripe for payment
+        Filtered list of products that use Stripe for payment, in input order
     """
-    # Make sure cache directory exists
-    os.makedirs(os.path.dirname(_CACHE_PATH), exist_ok=True)
+    verdicts, pending = _group_by_domain(products)
+    fresh = set()
+    for domain, result, _ in _check_domains(pending, max_workers, deadline):
+        verdicts[domain] = result
+        fresh.add(domain)
     
-    stripe_products = []
-    for product in products:
-        # Skip products without URLs
-        if 'url' not in product:
-            continue
+    # Save cache after processing
+    result_cache.detection_cache.flush()
             
-        url = product['url']
-        domain = urlparse(url).netloc
-        
-        # Check if domain is in cache
-        if domain in site_validation_cache:
-            cache_entry = site_validation_cache[domain]
-            # Use cache if less than 24 hours old
-            if time.time() - cache_entry['timestamp'] < 86400:
-                if cache_entry['stripe_enabled']:
-                    stripe_products.append(product)
-                continue
-        
-        # Check for Stripe integration
-        result = is_stripe_enabled(url)
+    return _collect_stripe_products(products, verdicts, fresh)
+
+def iter_product_verdicts(products: List[Dict[str, Any]], max_workers: Optional[int] = None,
+                          deadline: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Validate products and yield each verdict as soon as it is known.
+    
+    Products of cached domains come first, in input order, followed by the
+    products of each checked domain as its check completes.
+    
+    Args:
+        products: List of product dictionaries, each containing at least a 'url' key
+        max_workers: Domains checked at the same time, defaults to VALIDATION_WORKERS
+        deadline: Seconds allowed for the whole batch, defaults to
+            VALIDATION_DEADLINE; products of domains still unchecked by then
+            get no verdict
         
-        # Update cache
-        site_validation_cache[domain] = {
-            'stripe_enabled': result['stripe_enabled'],
-            'confidence': result['confidence'],
-            'timestamp': time.time()
+    Yields:
+        One 'product' record per product with a verdict, holding its index
+        in the input, the product, the verdict and whether it came from the
+        'cache' or a live 'check', then a final 'summary' record with totals
+    """
+    started = time.monotonic()
+    verdicts, pending = _group_by_domain(products)
+    domains = {index: cache_key(product['url']) for index, product in enumerate(products) if 'url' in product}
+    totals = {'products': 0, 'stripe_enabled': 0}
+    
+    def record(index: int, verdict: Dict[str, Any], source: str) -> Dict[str, Any]:
+        totals['products'] += 1
+        totals['stripe_enabled'] += bool(verdict['stripe_enabled'])
+        return {
+            'type': 'product',
+            'index': index,
+            'stripe_enabled': verdict['stripe_enabled'],
+            'status': result_status(verdict),
+            'confidence': verdict['confidence'],
+            'source': source,
+            'product': products[index]
         }
+    
+    waiting: Dict[str, List[int]] = {}
+    for index, domain in domains.items():
+        if domain in verdicts:
+            yield record(index, verdicts[domain], 'cache')
+        else:
+            waiting.setdefault(domain, []).append(index)
+    checked = 0
+    for domain, verdict, _ in _check_domains(pending, max_workers, deadline):
+        checked += 1
+        indexes = waiting[domain]
+        # The first product of a freshly checked domain gets its stripe_info
+        if verdict['stripe_enabled']:
+            _annotate_product(products[indexes[0]], verdict)
+        for index in indexes:
+            yield record(index, verdict, 'check')
+    
+    result_cache.detection_cache.flush()
+    yield {
+        'type': 'summary',
+        'total': len(products),
+        'validated': totals['products'],
+        'stripe_enabled': totals['stripe_enabled'],
+        'domains_checked': checked,
+        'domains_unchecked': len(pending) - checked,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+
+def validate_urls(urls: List[str], max_workers: Optional[int] = None,
+                  deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Check many URLs, each site once.
+    
+    URLs sharing a cache key share one check; cached sites are answered
+    without a fetch and the others are checked in parallel.
+    
+    Args:
+        urls: The URLs to check
+        max_workers: Sites checked at the same time, defaults to VALIDATION_WORKERS
+        deadline: Seconds allowed for the whole batch, defaults to
+            VALIDATION_DEADLINE; sites still unchecked by then are
+            reported as 'unknown'
         
-        # Save to disk occasionally (every 10 new validations)
-        if len(site_validation_cache) % 10 == 0:
-            try:
-                with open(_CACHE_PATH, "w", encoding="utf-8") as f:
-                    json.dump(site_validation_cache, f, indent=2)
-            except Exception as e:
-                print(f"Error saving cache: {e}")
+    Returns:
+        One result per URL, in input order, with the URL, its verdict,
+        whether it came from the 'cache' or a live 'check', and the
+        milliseconds the check took
+    """
+    verdicts, pending = _group_by_domain([{'url': url} for url in urls])
+    timings = {domain: 0.0 for domain in verdicts}
+    for domain, result, elapsed in _check_domains(pending, max_workers, deadline):
+        verdicts[domain] = result
+        timings[domain] = elapsed
+    
+    result_cache.detection_cache.flush()
+    
+    results = []
+    for url in urls:
+        domain = cache_key(url)
+        verdict = verdicts.get(domain)
+        if verdict is None:
+            verdict = error_result(TimeoutError('Validation deadline passed before the site was checked'))
+        results.append({
+            'url': url,
+            'stripe_enabled': verdict['stripe_enabled'],
+            'status': result_status(verdict),
+            'confidence': verdict['confidence'],
+            'source': 'check' if domain in pending else 'cache',
+            'elapsed_ms': round(timings.get(domain, 0.0) * 1000, 1),
+            'details': verdict.get('details', {})
+        })
+    return results
+
+def batch_limits(max_workers: Any = None, deadline: Any = None) -> Tuple[int, float]:
+    """Check the worker count and deadline a client asked for.
+    
+    Args:
+        max_workers: Domains to check at the same time, or None
+        deadline: Seconds allowed for the whole batch, or None
+        
+    Returns:
+        The values to use, capped at VALIDATION_WORKERS and
+        VALIDATION_DEADLINE and defaulting to them
         
-        # Add to results if Stripe-enabled
-        if result['stripe_enabled']:
-            # Add Stripe information to the product
-            product['stripe_info'] = {
-                'confidence': result['confidence'],
-                'validated_at': int(time.time())
-            }
-            stripe_products.append(product)
+    Raises:
+        ValueError: When max_workers is not a positive integer or deadline
+            not a positive number
+    """
+    if max_workers is None:
+        max_workers = VALIDATION_WORKERS
+    elif isinstance(max_workers, bool) or not isinstance(max_workers, int) or max_workers < 1:
+        raise ValueError('max_workers must be a positive integer')
+    if deadline is None:
+        deadline = VALIDATION_DEADLINE
+    elif isinstance(deadline, bool) or not isinstance(deadline, (int, float)) or not 0 < deadline < float('inf'):
+        raise ValueError('deadline must be a positive number of seconds')
+    return min(max_workers, VALIDATION_WORKERS), min(float(deadline), VALIDATION_DEADLINE)
+
+def _timed_check(url: str) -> Tuple[Dict[str, Any], float]:
+    started = time.monotonic()
+    result = is_stripe_enabled(url)
+    return result, time.monotonic() - started
+
+def _check_domains(pending: Dict[str, str], max_workers: Optional[int] = None,
+                   deadline: Optional[float] = None) -> Iterator[Tuple[str, Dict[str, Any], float]]:
+    """Check one URL per domain in parallel.
     
-    # Save cache after processing
+    Yields:
+        (domain, result, seconds the check took) in completion order, until
+        every domain is checked or the deadline passes
+    """
+    if not pending:
+        return
+    workers = max(1, min(max_workers or VALIDATION_WORKERS, len(pending)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='validate')
+    futures = {executor.submit(_timed_check, url): domain for domain, url in pending.items()}
+    done = 0
     try:
-        with open(_CACHE_PATH, "w", encoding="utf-8") as f:
-            json.dump(site_validation_cache, f, indent=2)
-    except Exception as e:
-        print(f"Error saving cache: {e}")
-            
-    return stripe_products
\ No newline at end of file
+        for future in as_completed(futures, timeout=deadline or VALIDATION_DEADLINE):
+            result, elapsed = future.result()
+            done += 1
+            yield futures[future], result, elapsed
+    except FuturesTimeout:
+        print(f"Validation deadline passed, {len(pending) - done} domains left unchecked")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _group_by_domain(products: List[Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """Split the products' domains into cached verdicts and domains to check.
+    
+    Returns:
+        The fresh cached verdicts by domain, and one URL per domain that
+        still has to be checked
+    """
+    verdicts = {}
+    pending = {}
+    for product in products:
+        # Skip products without URLs
+        if 'url' not in product:
+            continue
+        domain = cache_key(product['url'])
+        if domain in verdicts or domain in pending:
+            continue
+        cache_entry = get_cached_result(domain, refresh_url=product['url'])
+        if cache_entry is not None:
+            verdicts[domain] = cache_entry
+        else:
+            pending[domain] = product['url']
+    return verdicts, pending
+
+def _collect_stripe_products(products: List[Dict[str, Any]], verdicts: Dict[str, Dict[str, Any]],
+                             fresh: Set[str]) -> List[Dict[str, Any]]:
+    """Return the Stripe-enabled products in input order.
+    
+    The first product of each freshly checked domain gets its stripe_info,
+    as it did when products were checked one at a time.
+    """
+    stripe_products = []
+    fresh = set(fresh)
+    for product in products:
+        if 'url' not in product:
+            continue
+        domain = cache_key(product['url'])
+        verdict = verdicts.get(domain)
+        if verdict is None or not verdict['stripe_enabled']:
+            continue
+        if domain in fresh:
+            fresh.discard(domain)
+            _annotate_product(product, verdict)
+        stripe_products.append(product)
+    return stripe_products
+
+def _annotate_product(product: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """Add Stripe information to a validated product."""
+    product['stripe_info'] = {
+        'confidence': result['confidence'],
+        'validated_at': int(time.time())
+    }
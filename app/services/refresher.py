@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Threads refreshing stale cache entries in the background
+REFRESH_WORKERS = int(os.environ.get('STRIPE_REFRESH_WORKERS', 4))
+# Refreshes waiting at most; further keys are not queued until there is room
+REFRESH_QUEUE_MAX = int(os.environ.get('STRIPE_REFRESH_QUEUE_MAX', 10000))
+
+
+class RefreshPool:
+    """Deduplicated, prioritized background refreshes.
+
+    Each key is queued at most once. Asking again for a key that is already
+    waiting raises its priority instead, so the keys requested most often
+    while stale are refreshed first. Worker threads start on first use.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queued: Optional[int] = None):
+        self.workers = REFRESH_WORKERS if workers is None else workers
+        self.max_queued = REFRESH_QUEUE_MAX if max_queued is None else max_queued
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[int, int, str]] = []
+        self._queued: Dict[str, Tuple[Callable[[], Any], int]] = {}
+        self._running = set()
+        self._order = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._counters = {'queued': 0, 'deduplicated': 0, 'dropped': 0, 'completed': 0, 'failed': 0}
+
+    def submit(self, key: str, fn: Callable[[], Any]) -> bool:
+        """Queue a refresh unless one is already waiting or running for the key.
+
+        Returns:
+            True when the refresh was queued, False when it was merged into
+            a pending one or the queue is full
+        """
+        with self._cond:
+            if key in self._queued:
+                queued_fn, requests = self._queued[key]
+                self._queued[key] = (queued_fn, requests + 1)
+                heapq.heappush(self._heap, (-(requests + 1), next(self._order), key))
+                self._counters['deduplicated'] += 1
+                return False
+            if key in self._running:
+                self._counters['deduplicated'] += 1
+                return False
+            if len(self._queued) >= self.max_queued:
+                self._counters['dropped'] += 1
+                return False
+            self._queued[key] = (fn, 1)
+            heapq.heappush(self._heap, (-1, next(self._order), key))
+            self._counters['queued'] += 1
+            self._start_workers()
+            self._cond.notify()
+            return True
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f'cache-refresh-{len(self._threads)}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next(self) -> Tuple[str, Callable[[], Any]]:
+        with self._cond:
+            while True:
+                while not self._heap:
+                    self._cond.wait()
+                priority, _, key = heapq.heappop(self._heap)
+                queued = self._queued.get(key)
+                # Skip heap entries superseded by a later priority bump
+                if queued is None or -priority != queued[1]:
+                    continue
+                del self._queued[key]
+                self._running.add(key)
+                return key, queued[0]
+
+    def _work(self) -> None:
+        while True:
+            key, fn = self._next()
+            try:
+                fn()
+                outcome = 'completed'
+            except Exception as e:
+                print(f"Error refreshing {key}: {e}")
+                outcome = 'failed'
+            with self._cond:
+                self._running.discard(key)
+                self._counters[outcome] += 1
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until nothing is queued or running; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queued and not self._running, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring, with the current queue length."""
+        with self._cond:
+            return dict(self._counters, pending=len(self._queued), running=len(self._running))
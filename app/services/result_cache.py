@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.services.cache_store import CACHE_DB_PATH, SQLiteStore
+
+# How long a detection result stays fresh, in seconds, and how long it may
+# still be served while a background refresh replaces it
+CACHE_TTL = float(os.environ.get('STRIPE_CACHE_TTL', 86400))
+CACHE_HARD_TTL = float(os.environ.get('STRIPE_CACHE_HARD_TTL', 3 * 86400))
+
+# Merchants rarely change platforms, so identified platforms are kept longer
+PLATFORM_CACHE_TTL = float(os.environ.get('STRIPE_PLATFORM_CACHE_TTL', 30 * 86400))
+
+# Caps on the in-process tier; the least recently used entries go first
+CACHE_MAX_ENTRIES = int(os.environ.get('STRIPE_CACHE_MAX_ENTRIES', 10000))
+CACHE_MAX_BYTES = int(os.environ.get('STRIPE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+Entry = Dict[str, Any]
+
+
+def entry_size(entry: Entry) -> int:
+    """Approximate size of a cache entry in bytes, as serialized."""
+    return len(json.dumps(entry, separators=(',', ':'), default=str))
+
+
+class LRUCache:
+    """Thread-safe in-process LRU bounded by entry count and total size."""
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries: 'OrderedDict[str, Tuple[Entry, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, entry: Entry) -> None:
+        size = entry_size(entry)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                self.evictions += 1
+                return
+            self._entries[key] = (entry, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _discard(self, key: str) -> None:
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self.bytes -= item[1]
+
+
+class TieredCache:
+    """In-process LRU in front of an optional persistent store.
+
+    Entries are {'timestamp', 'result'} dictionaries and share one policy in
+    both tiers: fresh up to ``ttl`` seconds old, stale but still servable up
+    to ``hard_ttl``, and dropped after that. A persistent hit is promoted to
+    the in-process tier.
+    """
+
+    def __init__(self, memory: Optional[LRUCache] = None, store: Optional[SQLiteStore] = None,
+                 ttl: Optional[float] = None, hard_ttl: Optional[float] = None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.store = store
+        self.ttl = CACHE_TTL if ttl is None else ttl
+        self.hard_ttl = max(self.ttl, CACHE_HARD_TTL if hard_ttl is None else hard_ttl)
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'store_hits': 0, 'stale_hits': 0, 'misses': 0, 'expired': 0}
+
+    def _age(self, entry: Entry) -> float:
+        return time.time() - entry['timestamp']
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def lookup(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """Return the cached result for a key and whether it is stale.
+
+        Returns:
+            (result, stale), or None when nothing servable is cached
+        """
+        entry = self.memory.get(key)
+        tier = 'memory_hits'
+        if entry is not None and self._age(entry) >= self.hard_ttl:
+            self.memory.delete(key)
+            self._count('expired')
+            entry = None
+        if entry is None and self.store is not None:
+            entry = self.store.get(key)
+            tier = 'store_hits'
+            if entry is not None:
+                if self._age(entry) >= self.hard_ttl:
+                    entry = None
+                else:
+                    self.memory.set(key, entry)
+        if entry is None:
+            self._count('misses')
+            return None
+
+        stale = self._age(entry) >= self.ttl
+        self._count('stale_hits' if stale else tier)
+        return entry['result'], stale
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for a key if it is still fresh."""
+        hit = self.lookup(key)
+        if hit is None or hit[1]:
+            return None
+        return hit[0]
+
+    def set(self, key: str, result: Any) -> None:
+        """Cache a result in both tiers."""
+        entry = {'timestamp': time.time(), 'result': result}
+        self.memory.set(key, entry)
+        if self.store is not None:
+            self.store.set(key, entry)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def flush(self) -> None:
+        """Write pending entries to the persistent tier."""
+        if self.store is not None:
+            self.store.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for monitoring.
+
+        Returns:
+            Fresh hits per tier, stale hits, misses, expired entries
+            dropped, evictions from the in-process tier, and its current
+            entry count and size
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats['hits'] = stats['memory_hits'] + stats['store_hits'] + stats['stale_hits']
+        stats['evictions'] = self.memory.evictions
+        stats['entries'] = len(self.memory)
+        stats['bytes'] = self.memory.bytes
+        return stats
+
+
+# Detection results by site, shared by is_stripe_enabled and validate_products
+detection_cache = TieredCache(LRUCache(), SQLiteStore(CACHE_DB_PATH, 'detection'))
+
+# E-commerce platform by site, written by detection and read by checkout
+platform_cache = TieredCache(LRUCache(), SQLiteStore(CACHE_DB_PATH, 'platforms'), ttl=PLATFORM_CACHE_TTL)
@@ -0,0 +1,290 @@
+import hashlib
+import re
+from typing import Any, Dict, FrozenSet, List, Optional, Pattern, Sequence, Tuple
+
+# Text signatures used by the Stripe detectors. Every pattern is written in
+# lower case and matched against the lower-cased document, which replaces the
+# per-pattern re.IGNORECASE searches the detectors used to run.
+STRIPE_SIGNATURES: Dict[str, List[str]] = {
+    'stripe_js': [
+        r'https://js\.stripe\.com/v3',
+        r'stripe\.com/v3',
+        r'stripe\(.*\)',
+        r'stripe-js',
+        r'loadstripe',
+        r'stripeelements',
+        r'stripe\.initialize',
+        r'stripe_payment_elements',
+        r'stripepromise'
+    ],
+    'stripe_checkout': [
+        r'redirecttocheckout',
+        r'stripe\.redirecttocheckout',
+        r'checkout\.stripe\.com',
+        r'pay\.stripe\.com',
+        r'billing\.stripe\.com',
+        r'stripe_checkout'
+    ],
+    'stripe_elements': [
+        r'stripe\.elements\(\)',
+        r'elements\(',
+        r'card-element',
+        r'cardelement',
+        r'paymentelement',
+        r'stripeelement',
+        r'stripe-card-element',
+        r'data-stripe',
+        r'card_element',
+        r'payment-element',
+        r'stripe-elements'
+    ],
+    'payment_request_button': [
+        r'paymentrequestbutton',
+        r'paymentrequest',
+        r'payment-request-button',
+        r'payment_request',
+        r'apple-pay',
+        r'google-pay',
+        r'stripe-payment-request'
+    ],
+    'stripe_keywords': [
+        r'stripe\.js',
+        r'stripe integration',
+        r'stripe gateway',
+        r'stripe api',
+        r'stripe token',
+        r'stripe payment',
+        r'credit card.{0,30}(?:details|information|number|cvv|cvc)',
+        r'payment method.{0,30}stripe',
+        r'stripe_version'
+    ],
+    # Plain substrings used by the platform heuristics
+    'mentions_stripe': [r'stripe'],
+    'mentions_payment': [r'payment'],
+    'shopify': [r'shopify'],
+    'woocommerce': [r'woocommerce'],
+    'woocommerce_stripe': [r'wc-stripe', r'stripe_checkout'],
+    'bigcommerce': [r'bigcommerce'],
+    'webflow': [r'webflow'],
+    # Stricter marks of the platform serving a page, used to identify it
+    'shopify_store': [r'shopify\.theme', r'cdn\.shopify\.com'],
+    'woocommerce_store': [r'woocommerce', r'add-to-cart'],
+    # Words any DOM-based detector needs to find before it can score, used
+    # to bound what the tree could still add to the text-only scores
+    'mentions_pay': [r'pay'],
+    'mentions_card': [r'card'],
+    'mentions_checkout': [r'checkout'],
+    'mentions_card_field': [r'cc-', r'credit'],
+    'checkout_indicator': [
+        r'checkout-container',
+        r'checkout_page',
+        r'checkout-section',
+        r'order summary',
+        r'payment information',
+        r'billing information',
+        r'card information'
+    ]
+}
+
+# Signatures that settle detection on their own. A page containing either
+# one scores above the confidence threshold whatever else it contains, so a
+# download can stop as soon as one of them has been seen.
+DECISIVE_SIGNATURES: Dict[str, List[str]] = {
+    'decisive': [
+        r'js\.stripe\.com/v3',
+        r'checkout\.stripe\.com'
+    ]
+}
+
+
+_SPECIAL_CHARS = set('.^$*+?{}[]()|')
+_QUANTIFIERS = set('*+?{')
+
+
+def _literal_prefix(pattern: str) -> Tuple[str, bool]:
+    """Return the literal text every match of ``pattern`` must start with.
+
+    The second item is True when the pattern is nothing but that literal.
+    """
+    literal = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            token, width = pattern[i + 1], 2
+        elif char in _SPECIAL_CHARS or char == '\\':
+            break
+        else:
+            token, width = char, 1
+        # A quantified character is optional, so it cannot be part of the prefix
+        if i + width < len(pattern) and pattern[i + width] in _QUANTIFIERS:
+            break
+        literal.append(token)
+        i += width
+    return ''.join(literal), i == len(pattern)
+
+
+def _trie_regex(words: Sequence[str]) -> str:
+    """Build a regex matching any of ``words`` with shared prefixes merged."""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        optional = '' in node
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        group = '(?:' + '|'.join(branches) + ')'
+        return group + '?' if optional else group
+
+    return build(trie)
+
+
+class SignatureScanner:
+    """Match many tagged regex signatures against a document in one pass.
+
+    Every signature must start with a literal prefix. The prefixes are merged
+    into a single trie-shaped regex that finds candidate offsets, and only
+    the signatures sharing a prefix with the candidate are verified there.
+    Once a tag is hit its signatures are dropped from the candidate regex, so
+    the walk over the text stays monotonic and each tag is reported exactly
+    as separate searches over the whole document would report it.
+    """
+
+    def __init__(self, signatures: Dict[str, Sequence[str]]):
+        self._patterns: List[str] = []
+        tags_by_pattern: Dict[str, set] = {}
+        for tag, patterns in signatures.items():
+            for pattern in patterns:
+                if pattern not in tags_by_pattern:
+                    tags_by_pattern[pattern] = set()
+                    self._patterns.append(pattern)
+                tags_by_pattern[pattern].add(tag)
+
+        self._tags = [frozenset(tags_by_pattern[p]) for p in self._patterns]
+        self._prefixes: List[str] = []
+        # Pure literals are verified by the prefix check alone
+        self._verifiers: List[Optional[Pattern]] = []
+        for pattern in self._patterns:
+            prefix, is_literal = _literal_prefix(pattern)
+            if not prefix:
+                raise ValueError(f"Signature has no literal prefix: {pattern!r}")
+            self._prefixes.append(prefix)
+            self._verifiers.append(None if is_literal else re.compile(pattern))
+        self.all_tags: FrozenSet[str] = frozenset(signatures)
+        self._matchers: Dict[FrozenSet[str], Optional[Pattern]] = {}
+
+    def _matcher(self, remaining: FrozenSet[str]) -> Optional[Pattern]:
+        """Return the candidate regex for the signatures still of interest."""
+        if remaining not in self._matchers:
+            prefixes = {
+                prefix for prefix, tags in zip(self._prefixes, self._tags)
+                if tags & remaining
+            }
+            # The number of distinct remaining-tag sets seen in practice is
+            # small, but never let the memo grow without bound
+            if len(self._matchers) >= 1024:
+                self._matchers.clear()
+            self._matchers[remaining] = re.compile(_trie_regex(sorted(prefixes))) if prefixes else None
+        return self._matchers[remaining]
+
+    def scan(self, text: str, lowered: bool = False) -> FrozenSet[str]:
+        """Return the set of tags with at least one matching signature.
+
+        Args:
+            text: Document to scan
+            lowered: Set when ``text`` has already been lower-cased
+        """
+        if not lowered:
+            text = text.lower()
+
+        hits = set()
+        remaining = self.all_tags
+        pos = 0
+        while remaining:
+            matcher = self._matcher(remaining)
+            if matcher is None:
+                break
+            candidate = matcher.search(text, pos)
+            if not candidate:
+                break
+            pos = candidate.start()
+            matched = set()
+            for prefix, tags, verifier in zip(self._prefixes, self._tags, self._verifiers):
+                if not tags & remaining or not text.startswith(prefix, pos):
+                    continue
+                if verifier is None or verifier.match(text, pos):
+                    matched |= tags
+            hits |= matched
+            remaining = remaining - matched
+            pos += 1
+        return frozenset(hits)
+
+
+class StreamingScanner:
+    """Scan a document chunk by chunk for literal signatures.
+
+    The last characters of each chunk are carried over to the next one, so
+    signatures split across a chunk boundary are still found.
+    """
+
+    def __init__(self, signatures: Dict[str, Sequence[str]]):
+        lengths = []
+        for patterns in signatures.values():
+            for pattern in patterns:
+                prefix, is_literal = _literal_prefix(pattern)
+                if not is_literal:
+                    raise ValueError(f"Streaming signatures must be literals: {pattern!r}")
+                lengths.append(len(prefix))
+        self._scanner = SignatureScanner(signatures)
+        self._overlap = max(lengths, default=1) - 1
+        self._tail = ''
+        self.hits: FrozenSet[str] = frozenset()
+
+    def feed(self, chunk: str) -> FrozenSet[str]:
+        """Scan the next chunk and return every tag hit so far."""
+        text = self._tail + chunk.lower()
+        self.hits = self.hits | self._scanner.scan(text, lowered=True)
+        self._tail = text[-self._overlap:] if self._overlap else ''
+        return self.hits
+
+
+_SCANNER = SignatureScanner(STRIPE_SIGNATURES)
+
+
+def scan_signatures(html: str) -> FrozenSet[str]:
+    """Scan an HTML document once for every Stripe detector signature."""
+    return _SCANNER.scan(html)
+
+
+# Markup that payment detection depends on: script sources, form actions and
+# JSON-LD blocks. Matched on the raw text, so no parse is needed.
+_SCRIPT_SRC = re.compile(r'<script\b[^>]*?\bsrc\s*=\s*["\']?([^"\'\s>]+)', re.IGNORECASE)
+_FORM_ACTION = re.compile(r'<form\b[^>]*?\baction\s*=\s*["\']?([^"\'\s>]+)', re.IGNORECASE)
+_JSON_LD = re.compile(r'<script\b[^>]*application/ld\+json[^>]*>(.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def content_fingerprint(url: str, html: str) -> str:
+    """Return a short digest of the payment-relevant markup of a page.
+
+    Two downloads with the same script sources, form actions and JSON-LD
+    blocks, fetched from the same kind of URL, get the same fingerprint.
+    Other text changes do not affect it.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(b'checkout' if '/checkout' in url.lower() else b'page')
+    for pattern in (_SCRIPT_SRC, _FORM_ACTION):
+        digest.update(b'\x00')
+        for value in pattern.findall(html):
+            digest.update(value.encode('utf-8', 'replace') + b'\x01')
+    digest.update(b'\x00')
+    for block in _JSON_LD.findall(html):
+        digest.update(_WHITESPACE.sub(' ', block).strip().encode('utf-8', 'replace') + b'\x01')
+    return digest.hexdigest()
@@ -0,0 +1,103 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+class _Call:
+    """One in-flight computation that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent computations of the same key across threads.
+
+    The first caller for a key runs the computation; callers arriving while
+    it is in flight block until it finishes and share its result, or its
+    exception. Nothing is kept once the computation ends, so results must be
+    cached by the caller, whose cache can be consulted through ``lookup``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any], lookup: Optional[Callable[[], Any]] = None) -> Any:
+        """Return the result for a key, computing it at most once at a time.
+
+        Args:
+            key: What the computation is coalesced on
+            fn: Computes the result, called by the first caller only
+            lookup: Returns a cached result, or None; checked first and
+                checked again by the caller about to run fn, so a result
+                stored just after the first check is not computed twice
+
+        Returns:
+            The cached result, or the result fn returned for this or a
+            concurrent caller
+        """
+        if lookup is not None:
+            cached = lookup()
+            if cached is not None:
+                self._count_hit()
+                return cached
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            cached = lookup() if lookup is not None else None
+            if cached is not None:
+                self._count_hit()
+                call.result = cached
+            else:
+                with self._lock:
+                    self._misses += 1
+                call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _count_hit(self) -> None:
+        with self._lock:
+            self._hits += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring.
+
+        Returns:
+            Cache hits, misses that ran the computation, callers that
+            waited on another caller's computation, and keys in flight
+        """
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._calls)
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._hits = self._misses = self._coalesced = 0
@@ -1,368 +1,648 @@
-import re
-import requests
+import os
 import json
-from urllib.parse import urlparse
 from bs4 import BeautifulSoup
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Callable, FrozenSet, List, Optional, Tuple, Union
+from app.services import http_client
+from app.services.html_parser import parse_html
+from app.services.page_context import PageContext
+from app.services.page_features import PageFeatures, extract_features
+from app.services.signatures import DECISIVE_SIGNATURES, StreamingScanner, content_fingerprint, scan_signatures
+from app.services import result_cache
+from app.services.cache_keys import cache_key
+from app.services.failure_cache import FailureCache, is_host_failure
+from app.services.merchant_index import KnownMerchants
+from app.services.platforms import platform_from_hits, remember_platform
+from app.services.refresher import RefreshPool
+from app.services.single_flight import SingleFlight
 
-# Cache of already checked sites
-site_cache = {}
+# Concurrent checks of the same site share one fetch and detection
+detection_flight = SingleFlight()
 
-def is_stripe_enabled(url: str) -> Dict[str, Any]:
+# Stale results are served at once and refreshed on these background workers
+refresh_pool = RefreshPool()
+
+# Sites whose checks keep failing are backed off, then failed fast
+failure_cache = FailureCache()
+
+# Precomputed answers for well-known merchants, checked before any fetch
+known_merchants = KnownMerchants()
+
+# Confidence above which a page counts as Stripe-enabled
+CONFIDENCE_THRESHOLD = 0.15  # Lower threshold to catch more potential matches
+# Minimum confidence reported for checkout pages with any Stripe signal
+CHECKOUT_MIN_CONFIDENCE = 0.4
+
+# Decide from raw-text signatures before parsing whenever they are conclusive
+TIERED_DETECTION = os.environ.get('STRIPE_TIERED_DETECTION', '').lower() in ('1', 'true', 'yes')
+
+def is_stripe_enabled(url: str, tiered: Optional[bool] = None, page: Optional[PageContext] = None) -> Dict[str, Any]:
     """Determine if a website uses Stripe for payment processing.
     
     Args:
         url: The URL of the product or website to check
+        tiered: Skip parsing when the text signatures are conclusive,
+            defaults to the STRIPE_TIERED_DETECTION setting
+        page: Request-scoped context to read the page from, so callers
+            that need the page afterwards share one download and parse
         
     Returns:
         Dictionary with results including:
         - stripe_enabled: Boolean indicating if Stripe was detected
+        - status: 'enabled', 'disabled', or 'unknown' when the site could
+          not be checked
         - confidence: Float between 0-1 indicating confidence level
         - details: Additional information about detection
     """
+    if tiered is None:
+        tiered = TIERED_DETECTION
+    
     # Normalize URL to get domain
-    parsed = urlparse(url)
-    domain = parsed.netloc
+    domain = cache_key(url)
+    
+    # Check cache first, and join a check of the same site already in flight
+    return detection_flight.do(
+        domain,
+        lambda: _check_site(url, domain, tiered, page),
+        lookup=lambda: get_cached_result(domain, refresh_url=url)
+    )
+
+def _check_site(url: str, domain: str, tiered: bool, page: Optional[PageContext],
+                previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fetch and analyze a page, caching the result under its domain.
     
-    # Check cache first
-    if domain in site_cache:
-        cache_entry = site_cache[domain]
-        # If entry is less than 24 hours old, return it
-        if time.time() - cache_entry['timestamp'] < 86400:
-            return cache_entry['result']
+    Args:
+        previous: The result being refreshed; its validators make the fetch
+            conditional, and it is carried over without scoring when the
+            server reports the page unchanged or its fingerprint matches
+    """
+    # Fail fast while a site is backing off after errors
+    blocked = blocked_result(domain)
+    if blocked is not None:
+        return blocked
     
     try:
-        # Fetch the page with a more realistic browser user-agent
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        }
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        html = response.text
-        soup = BeautifulSoup(html, 'html.parser')
+        if page is not None:
+            html, fetch_info = page.html, page.fetch_info
+        else:
+            validators = previous.get('details', {}).get('fetch', {}).get('validators') if previous else None
+            html, fetch_info = _download_page(url, validators)
         
-        # Detection methods and their confidence weights
-        detection_results = {
-            'stripe_js': _detect_stripe_js(html, soup),
-            'stripe_checkout': _detect_stripe_checkout(html, soup),
-            'stripe_elements': _detect_stripe_elements(html, soup),
-            'stripe_links': _detect_stripe_links(html, soup),
-            'payment_request_button': _detect_payment_request_button(html, soup),
-            'stripe_keywords': _detect_stripe_keywords(html, soup),
-            'stripe_json_data': _detect_stripe_json_data(html, soup),
-            'stripe_metadata': _detect_stripe_metadata(soup)
-        }
-        
-        # For popular e-commerce platforms, check for known Stripe implementations
-        platform_check = _check_popular_platforms(url, soup, html)
-        if platform_check > 0:
-            detection_results['platform_specific'] = platform_check
-            
-        # Calculate overall confidence
-        confidence = sum(detection_results.values()) / len(detection_results)
+        if fetch_info.get('not_modified'):
+            result = _carried_over_result(previous, fetch_info, revalidated_at=int(time.time()))
+        else:
+            fingerprint = content_fingerprint(url, html)
+            if previous is not None and previous.get('details', {}).get('fingerprint') == fingerprint:
+                result = _carried_over_result(previous, fetch_info)
+            else:
+                result = analyze_html(url, html, tiered=tiered, page=page)
+                result['details'].update(fetch=fetch_info, fingerprint=fingerprint, result_source='recomputed')
         
-        # Determine if Stripe is enabled based on confidence threshold
-        stripe_enabled = confidence > 0.15  # Lower threshold to catch more potential matches
+        # Cache the result
+        store_result(domain, result)
+        failure_cache.record_success(domain)
         
-        # If we're on a checkout page, be more lenient
-        if '/checkout' in url.lower() and any(val > 0 for val in detection_results.values()):
-            stripe_enabled = True
-            confidence = max(confidence, 0.4)  # Set minimum confidence for checkout pages
+        return result
+    
+    except Exception as e:
+        # Failures go to their own tier, so they never read as "no Stripe";
+        # only those of the site as a whole back it off
+        if is_host_failure(e):
+            failure_cache.record_failure(domain, e)
+        return error_result(e)
+
+def _carried_over_result(previous: Dict[str, Any], fetch_info: Dict[str, Any], **details: Any) -> Dict[str, Any]:
+    """Reuse a previous result for a page whose relevant content is unchanged."""
+    previous_details = previous.get('details', {})
+    previous_fetch = previous_details.get('fetch', {})
+    fetch_info = dict(fetch_info)
+    if 'validators' not in fetch_info and previous_fetch.get('validators'):
+        fetch_info['validators'] = previous_fetch['validators']
+    details = dict(previous_details, fetch=fetch_info, result_source='carried_over', **details)
+    return dict(previous, details=details)
+
+def get_cached_result(key: str, refresh_url: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Return the cached detection result for a key.
+    
+    The detection cache is consulted first, then the known-merchant index.
+    
+    Args:
+        key: The cache key
+        refresh_url: URL to re-check the site from; when given, a stale
+            result is returned as well and a background refresh is queued.
+            So is an index answer older than the cache TTL.
         
-        result = {
-            'stripe_enabled': stripe_enabled,
-            'confidence': round(confidence, 2),
-            'details': {
-                'detection_methods': detection_results,
-                'timestamp': int(time.time())
-            }
+    Returns:
+        The result, or None when nothing usable is cached
+    """
+    if refresh_url is None:
+        result = result_cache.detection_cache.get(key)
+    else:
+        hit = result_cache.detection_cache.lookup(key)
+        result = None
+        if hit is not None:
+            result, stale = hit
+            if stale:
+                schedule_refresh(key, refresh_url)
+    if result is None:
+        result = known_merchant_result(key)
+        # The index keeps results far longer than the cache would
+        if (result is not None and refresh_url is not None
+                and time.time() - result['details']['timestamp'] >= result_cache.detection_cache.ttl):
+            schedule_refresh(key, refresh_url)
+    return result
+
+def known_merchant_result(key: str) -> Optional[Dict[str, Any]]:
+    """Build a result from the known-merchant index, if the key is in it."""
+    known = known_merchants.lookup(key)
+    if known is None:
+        return None
+    return {
+        'stripe_enabled': known['status'] == 'enabled',
+        'status': known['status'],
+        'confidence': known['confidence'],
+        'details': {
+            'platform': known['platform'],
+            'result_source': 'known_merchant_index',
+            'timestamp': known['checked_at']
         }
-        
-        # Cache the result
-        site_cache[domain] = {
-            'timestamp': time.time(),
-            'result': result
+    }
+
+def schedule_refresh(key: str, url: str) -> bool:
+    """Queue a background re-check of a site, once however often it is asked for."""
+    return refresh_pool.submit(key, lambda: refresh_site(key, url))
+
+def refresh_site(key: str, url: str) -> Dict[str, Any]:
+    """Re-check a site, asking the server for the page only if it changed.
+    
+    The cached result, fresh or stale, supplies the ETag and Last-Modified
+    values to revalidate with; a 304 extends it without any parsing.
+    """
+    hit = result_cache.detection_cache.lookup(key)
+    previous, stale = hit if hit is not None else (None, True)
+    return detection_flight.do(
+        key,
+        lambda: _check_site(url, key, TIERED_DETECTION, None, previous),
+        # A stale entry may have been refreshed by another caller meanwhile
+        lookup=(lambda: result_cache.detection_cache.get(key)) if stale else None
+    )
+
+def cut_short(result: Dict[str, Any]) -> bool:
+    """Tell whether a result comes from a page whose download ended early
+    without finding Stripe, so the rest of the page was never looked at."""
+    stopped = result.get('details', {}).get('fetch', {}).get('stopped')
+    return stopped in ('deadline', 'max_bytes') and not result['stripe_enabled']
+
+def store_result(key: str, result: Dict[str, Any]) -> None:
+    """Cache a detection result, and the platform it identified for the site.
+
+    A page cut short without finding Stripe is not cached and is reported
+    'unknown' instead of 'disabled'. A site on no known platform is only
+    recorded from a page read in full, for the same reason.
+    """
+    if cut_short(result):
+        result['status'] = 'unknown'
+    else:
+        result_cache.detection_cache.set(key, result)
+    details = result.get('details', {})
+    if details.get('platform') or ('platform' in details and not details.get('fetch', {}).get('stopped')):
+        remember_platform(key, details['platform'])
+
+def error_result(error: Exception) -> Dict[str, Any]:
+    """Build the response returned when a page could not be checked."""
+    return {
+        'stripe_enabled': False,
+        'status': 'unknown',
+        'confidence': 0,
+        'details': {
+            'error': str(error),
+            'timestamp': int(time.time())
         }
+    }
+
+def blocked_result(key: str) -> Optional[Dict[str, Any]]:
+    """Build the response for a failing site that must not be checked yet.
+    
+    Returns:
+        An 'unknown' result carrying the last error and when the site will
+        be tried again, or None when the site may be checked
+    """
+    blocked = failure_cache.blocked(key)
+    if blocked is None:
+        return None
+    return {
+        'stripe_enabled': False,
+        'status': 'unknown',
+        'confidence': 0,
+        'details': dict(blocked, timestamp=int(time.time()))
+    }
+
+def result_status(result: Dict[str, Any]) -> str:
+    """Return 'enabled', 'disabled' or 'unknown' for a detection result."""
+    if 'status' in result:
+        return result['status']
+    if result.get('details', {}).get('error'):
+        return 'unknown'
+    return 'enabled' if result['stripe_enabled'] else 'disabled'
+
+def _download_page(url: str, validators: Optional[Dict[str, str]] = None) -> Tuple[str, Dict[str, Any]]:
+    """Stream a page, stopping as soon as its answer is settled.
+    
+    The body is scanned for the decisive signatures chunk by chunk and the
+    download stops at the first hit, or at the http_client size and time
+    limits.
+    
+    Args:
+        url: The page to download
+        validators: Cache validators of the previous download; the server
+            may then answer 304 without a body
+    
+    Returns:
+        The downloaded text and a summary of how the download ended
+    """
+    scanner = StreamingScanner(DECISIVE_SIGNATURES)
+    _, html, fetch_info = http_client.download_text(
+        url,
+        stop=lambda text: bool(scanner.feed(text)),
+        headers=http_client.conditional_headers(validators) or None
+    )
+    if fetch_info['stopped'] == 'stop':
+        fetch_info['stopped'] = 'decisive_signature'
+    return html, fetch_info
+
+def analyze_html(url: str, html: str, tiered: bool = False, parser: Optional[str] = None,
+                 page: Optional[PageContext] = None) -> Dict[str, Any]:
+    """Score an already downloaded page for Stripe usage.
+    
+    In tiered mode the raw-text signatures are scored first and the page is
+    only parsed when they cannot settle the answer on their own.
+    
+    Args:
+        url: The URL the page was fetched from
+        html: The page content
+        tiered: Return early when the text signatures are decisive
+        parser: HTML parser backend, defaults to HTML_PARSER_BACKEND
+        page: Context holding this page, whose parsed tree is reused
         
-        return result
+    Returns:
+        Detection result in the format returned by is_stripe_enabled, with
+        details['tier'] set to 'text' or 'dom' depending on what decided it.
+        A 'text' result reports the lowest confidence the page could score,
+        with details['confidence_bounds'] giving the full range
+    """
+    # Scan the raw text once for the signatures of every detector
+    hits = scan_signatures(html)
     
-    except Exception as e:
-        return {
-            'stripe_enabled': False,
-            'confidence': 0,
-            'details': {
-                'error': str(e),
-                'timestamp': int(time.time())
-            }
+    if tiered:
+        decided = _decide_from_text(url, html, hits)
+        if decided:
+            decided['details']['platform'] = platform_from_hits(hits)
+            return decided
+    
+    # Walk the tree once for the features the DOM checks need
+    if page is not None:
+        features = page.features
+    else:
+        features = extract_features(parse_html(html, parser))
+    detection_results = _score_detectors(url, html, features, hits)
+    
+    # Calculate overall confidence
+    confidence = _average_confidence(detection_results)
+    
+    # Determine if Stripe is enabled based on confidence threshold
+    stripe_enabled = confidence > CONFIDENCE_THRESHOLD
+    
+    # If we're on a checkout page, be more lenient
+    if '/checkout' in url.lower() and any(val > 0 for val in detection_results.values()):
+        stripe_enabled = True
+        confidence = max(confidence, CHECKOUT_MIN_CONFIDENCE)
+    
+    result = _build_result(stripe_enabled, confidence, detection_results, 'dom')
+    result['details']['platform'] = platform_from_hits(hits)
+    return result
+
+def _score_detectors(url: str, html: str, features: PageFeatures, hits: FrozenSet[str]) -> Dict[str, float]:
+    """Run every detector against the page and collect their scores."""
+    # Detection methods and their confidence weights
+    detection_results = {
+        'stripe_js': _detect_stripe_js(html, features, hits),
+        'stripe_checkout': _detect_stripe_checkout(html, features, hits),
+        'stripe_elements': _detect_stripe_elements(html, features, hits),
+        'stripe_links': _detect_stripe_links(html, features),
+        'payment_request_button': _detect_payment_request_button(html, features, hits),
+        'stripe_keywords': _detect_stripe_keywords(html, features, hits),
+        'stripe_json_data': _detect_stripe_json_data(html, features),
+        'stripe_metadata': _detect_stripe_metadata(features)
+    }
+    
+    # For popular e-commerce platforms, check for known Stripe implementations
+    platform_check = _check_popular_platforms(url, features, html, hits)
+    if platform_check > 0:
+        detection_results['platform_specific'] = platform_check
+    
+    return detection_results
+
+def _average_confidence(detection_results: Dict[str, float]) -> float:
+    """Average the detector scores into an overall confidence."""
+    return sum(detection_results.values()) / len(detection_results)
+
+def _build_result(stripe_enabled: bool, confidence: float, detection_results: Dict[str, float], tier: str) -> Dict[str, Any]:
+    """Assemble the response returned for a scored page."""
+    return {
+        'stripe_enabled': stripe_enabled,
+        'status': 'enabled' if stripe_enabled else 'disabled',
+        'confidence': round(confidence, 2),
+        'details': {
+            'detection_methods': detection_results,
+            'tier': tier,
+            'timestamp': int(time.time())
         }
+    }
 
-def _detect_stripe_js(html: str, soup: BeautifulSoup) -> float:
+def _dom_upper_bounds(hits: FrozenSet[str], lower: Dict[str, float]) -> Dict[str, float]:
+    """Highest score each detector could reach once the tree is inspected.
+    
+    A DOM check can only fire when the words it looks for appear somewhere
+    in the raw text, so the text hits bound what parsing could still add.
+    """
+    stripe = 'mentions_stripe' in hits
+    pay = 'mentions_pay' in hits
+    card = 'mentions_card' in hits
+    checkout = 'mentions_checkout' in hits
+    
+    upper = dict(lower)
+    if not lower['stripe_js']:
+        upper['stripe_js'] = 0.9 if stripe else 0.8 if pay else 0.0
+    if not lower['stripe_checkout']:
+        upper['stripe_checkout'] = 1.0 if stripe else 0.0
+    if not lower['stripe_elements']:
+        upper['stripe_elements'] = 0.7 if (stripe or pay or card or checkout) else 0.0
+    upper['stripe_links'] = 1.0 if stripe else 0.0
+    if pay:
+        upper['stripe_keywords'] = 0.8
+    elif not lower['stripe_keywords'] and stripe:
+        upper['stripe_keywords'] = 0.7
+    upper['stripe_json_data'] = 1.0 if stripe else 0.4 if (pay or checkout) else 0.0
+    upper['stripe_metadata'] = 0.7 if (stripe or pay or checkout) else 0.5 if card else 0.0
+    return upper
+
+def _bounded_confidence(scores: Dict[str, float], platform_scores: List[float], pick: Callable[[List[float]], float]) -> float:
+    """Pick the lowest or highest confidence over the possible platform scores."""
+    candidates = []
+    for platform_score in platform_scores:
+        detection_results = dict(scores)
+        if platform_score > 0:
+            detection_results['platform_specific'] = platform_score
+        candidates.append(_average_confidence(detection_results))
+    return pick(candidates)
+
+def _decide_from_text(url: str, html: str, hits: FrozenSet[str]) -> Optional[Dict[str, Any]]:
+    """Settle detection from the raw-text signatures alone, if possible.
+    
+    Scoring the detectors without any DOM evidence gives a lower bound on
+    every score, and _dom_upper_bounds gives the matching upper bound. The
+    page is positive when even the lower bound clears the threshold and
+    negative when the upper bound cannot, which matches the full result.
+    Hits such as js.stripe.com/v3 or checkout.stripe.com always settle it.
+    
+    Only the verdict is exact: the confidence reported is the lower bound,
+    and details['confidence_bounds'] holds the range the full score lies in.
+    
+    Returns:
+        The detection result, or None when the tree has to be inspected
+    """
+    no_dom = PageFeatures()
+    lower = _score_detectors(url, html, no_dom, hits)
+    lower_platform = lower.pop('platform_specific', 0.0)
+    upper = _dom_upper_bounds(hits, lower)
+    
+    upper_platform = lower_platform
+    if 'mentions_card' in hits or 'mentions_card_field' in hits or 'mentions_pay' in hits:
+        upper_platform = _check_popular_platforms(url, PageFeatures(field_names=['payment']), html, hits)
+    platform_scores = [lower_platform, upper_platform]
+    
+    lower_confidence = _bounded_confidence(lower, platform_scores, min)
+    upper_confidence = _bounded_confidence(upper, platform_scores, max)
+    
+    detection_results = dict(lower)
+    if lower_platform > 0:
+        detection_results['platform_specific'] = lower_platform
+    
+    if '/checkout' in url.lower():
+        if any(val > 0 for val in detection_results.values()):
+            bounds = (max(lower_confidence, CHECKOUT_MIN_CONFIDENCE), max(upper_confidence, CHECKOUT_MIN_CONFIDENCE))
+            return _build_text_result(True, bounds, detection_results)
+        if upper_platform > 0 or any(val > 0 for val in upper.values()):
+            return None
+    
+    bounds = (lower_confidence, upper_confidence)
+    if lower_confidence > CONFIDENCE_THRESHOLD:
+        return _build_text_result(True, bounds, detection_results)
+    if upper_confidence <= CONFIDENCE_THRESHOLD:
+        return _build_text_result(False, bounds, detection_results)
+    return None
+
+def _build_text_result(stripe_enabled: bool, bounds: Tuple[float, float],
+                       detection_results: Dict[str, float]) -> Dict[str, Any]:
+    """Assemble the response for a page settled from the text signatures."""
+    result = _build_result(stripe_enabled, bounds[0], detection_results, 'text')
+    result['details']['confidence_bounds'] = [round(bound, 2) for bound in bounds]
+    return result
+
+PageInput = Union[BeautifulSoup, PageFeatures]
+
+def _as_features(page: PageInput) -> PageFeatures:
+    """Accept either a parsed tree or already extracted page features."""
+    if isinstance(page, PageFeatures):
+        return page
+    return extract_features(page)
+
+def _detect_stripe_js(html: str, page: PageInput, hits: Optional[FrozenSet[str]] = None) -> float:
     """Check for Stripe.js inclusion"""
-    stripe_js_patterns = [
-        r'https://js\.stripe\.com/v3',
-        r'stripe\.com/v3',
-        r'Stripe\(.*\)',
-        r'stripe-js',
-        r'loadStripe',
-        r'stripeElements',
-        r'stripe\.initialize',
-        r'stripe_payment_elements',
-        r'stripePromise'
-    ]
-    
-    for pattern in stripe_js_patterns:
-        if re.search(pattern, html, re.IGNORECASE):
-            return 1.0
+    if hits is None:
+        hits = scan_signatures(html)
+    if 'stripe_js' in hits:
+        return 1.0
     
     # Check script tags
-    for script in soup.find_all('script'):
-        src = script.get('src', '')
+    for src, _, body in _as_features(page).scripts:
         if src and ('stripe' in src.lower() or 'pay' in src.lower()):
             return 0.8
             
         # Check script content
-        if script.string and 'stripe' in script.string.lower():
+        if body and 'stripe' in body.lower():
             return 0.9
     
     return 0.0
 
-def _detect_stripe_checkout(html: str, soup: BeautifulSoup) -> float:
+def _detect_stripe_checkout(html: str, page: PageInput, hits: Optional[FrozenSet[str]] = None) -> float:
     """Check for Stripe Checkout"""
-    checkout_patterns = [
-        r'redirectToCheckout',
-        r'stripe\.redirectToCheckout',
-        r'checkout\.stripe\.com',
-        r'pay\.stripe\.com',
-        r'billing\.stripe\.com',
-        r'stripe_checkout'
-    ]
-    
-    for pattern in checkout_patterns:
-        if re.search(pattern, html, re.IGNORECASE):
-            return 1.0
+    if hits is None:
+        hits = scan_signatures(html)
+    if 'stripe_checkout' in hits:
+        return 1.0
     
     # Check for checkout form with data attributes
-    checkout_forms = soup.find_all(['form', 'div'], attrs={'data-processor': re.compile('stripe', re.IGNORECASE)})
-    if checkout_forms:
+    if any('stripe' in processor.lower() for processor in _as_features(page).data_processors):
         return 1.0
     
     return 0.0
 
-def _detect_stripe_elements(html: str, soup: BeautifulSoup) -> float:
+def _detect_stripe_elements(html: str, page: PageInput, hits: Optional[FrozenSet[str]] = None) -> float:
     """Check for Stripe Elements"""
-    elements_patterns = [
-        r'stripe\.elements\(\)',
-        r'Elements\(',
-        r'card-element',
-        r'CardElement',
-        r'PaymentElement',
-        r'StripeElement',
-        r'stripe-card-element',
-        r'data-stripe',
-        r'card_element',
-        r'payment-element',
-        r'stripe-elements'
-    ]
-    
-    for pattern in elements_patterns:
-        if re.search(pattern, html, re.IGNORECASE):
-            return 1.0
+    if hits is None:
+        hits = scan_signatures(html)
+    if 'stripe_elements' in hits:
+        return 1.0
     
     # Check for div elements that might be Stripe Elements containers
-    for div in soup.find_all(['div', 'span', 'iframe']):
-        div_id = div.get('id', '').lower()
-        div_class = ' '.join(div.get('class', [])).lower()
-        div_data = str(div.get('data-', '')).lower()
-        
-        if any(term in div_id or term in div_class or term in div_data 
-               for term in ['card', 'stripe', 'payment', 'checkout']):
+    for token in _as_features(page).container_tokens:
+        token = token.lower()
+        if any(term in token for term in ['card', 'stripe', 'payment', 'checkout']):
             return 0.7
     
     return 0.0
 
-def _detect_stripe_links(html: str, soup: BeautifulSoup) -> float:
+def _detect_stripe_links(html: str, page: PageInput) -> float:
     """Check for Stripe-related links or forms"""
+    features = _as_features(page)
+    
     # Check form actions
-    for form in soup.find_all('form'):
-        action = form.get('action', '')
+    for action, data_values in features.forms:
         if 'stripe' in action.lower():
             return 1.0
         
         # Check form data attributes
-        for attr_name, attr_value in form.attrs.items():
-            if attr_name.startswith('data-') and ('stripe' in attr_value.lower() if isinstance(attr_value, str) else False):
-                return 0.9
+        if any('stripe' in value.lower() for value in data_values):
+            return 0.9
     
     # Check links
-    for a in soup.find_all('a', href=True):
-        if 'stripe' in a['href'].lower():
+    for href in features.hrefs:
+        if 'stripe' in href.lower():
             return 0.7
     
     return 0.0
 
-def _detect_payment_request_button(html: str, soup: BeautifulSoup) -> float:
+def _detect_payment_request_button(html: str, page: PageInput, hits: Optional[FrozenSet[str]] = None) -> float:
     """Check for Stripe Payment Request Button"""
-    prb_patterns = [
-        r'paymentRequestButton',
-        r'PaymentRequest',
-        r'payment-request-button',
-        r'payment_request',
-        r'apple-pay',
-        r'google-pay',
-        r'stripe-payment-request'
-    ]
-    
-    for pattern in prb_patterns:
-        if re.search(pattern, html, re.IGNORECASE):
-            return 1.0
+    if hits is None:
+        hits = scan_signatures(html)
+    if 'payment_request_button' in hits:
+        return 1.0
     
     return 0.0
 
-def _detect_stripe_keywords(html: str, soup: BeautifulSoup) -> float:
+def _detect_stripe_keywords(html: str, page: PageInput, hits: Optional[FrozenSet[str]] = None) -> float:
     """Check for Stripe-related keywords in content"""
-    keyword_patterns = [
-        # Stripe-specific terminology
-        r'stripe\.js',
-        r'stripe integration',
-        r'stripe gateway',
-        r'stripe api',
-        r'stripe token',
-        r'stripe payment',
-        r'credit card.{0,30}(details|information|number|cvv|cvc)', 
-        r'payment method.{0,30}stripe',
-        r'stripe_version'
-    ]
+    if hits is None:
+        hits = scan_signatures(html)
+    features = _as_features(page)
     
     # Check meta tags for payment hints
-    for meta in soup.find_all('meta'):
-        content = meta.get('content', '').lower()
+    for content in features.meta_contents:
+        content = content.lower()
         if 'payment' in content and any(word in content for word in ['method', 'gateway', 'processor', 'stripe']):
             return 0.8
     
     # Check for specific patterns
-    for pattern in keyword_patterns:
-        if re.search(pattern, html, re.IGNORECASE):
-            return 0.6
+    if 'stripe_keywords' in hits:
+        return 0.6
     
     # Look for payment icons or images
-    for img in soup.find_all('img'):
-        src = img.get('src', '').lower()
-        alt = img.get('alt', '').lower()
-        if 'stripe' in src or 'stripe' in alt:
+    for src, alt in features.images:
+        if 'stripe' in src.lower() or 'stripe' in alt.lower():
             return 0.7
     
     return 0.0
 
-def _detect_stripe_json_data(html: str, soup: BeautifulSoup) -> float:
+def _search_json(obj: Any, search_term: str) -> bool:
+    """Recursively search decoded JSON for keys or strings containing a term"""
+    if isinstance(obj, dict):
+        return any(_search_json(v, search_term) for v in obj.values()) or \
+               any(search_term in k.lower() for k in obj.keys() if isinstance(k, str))
+    elif isinstance(obj, list):
+        return any(_search_json(item, search_term) for item in obj)
+    elif isinstance(obj, str):
+        return search_term in obj.lower()
+    return False
+
+def _detect_stripe_json_data(html: str, page: PageInput) -> float:
     """Look for Stripe information in JSON data on the page"""
+    features = _as_features(page)
+    
     # Find JSON data in script tags
-    for script in soup.find_all('script', type=lambda t: t and ('json' in t or 'application/ld+json' in t)):
-        if not script.string:
-            continue
-            
+    for blob in features.json_scripts:
         try:
-            data = json.loads(script.string)
-            
-            # Recursively search for Stripe-related strings in the JSON
-            def search_json(obj, search_term):
-                if isinstance(obj, dict):
-                    return any(search_json(v, search_term) for v in obj.values()) or \
-                           any(search_term in k.lower() for k in obj.keys() if isinstance(k, str))
-                elif isinstance(obj, list):
-                    return any(search_json(item, search_term) for item in obj)
-                elif isinstance(obj, str):
-                    return search_term in obj.lower()
-                return False
-                
-            if search_json(data, 'stripe'):
+            data = json.loads(blob)
+            if _search_json(data, 'stripe'):
                 return 1.0
-            if search_json(data, 'payment') or search_json(data, 'checkout'):
+            if _search_json(data, 'payment') or _search_json(data, 'checkout'):
                 return 0.4
         except:
             # Not valid JSON or other error
             pass
     
     # Check for JSON in data attributes
-    for elem in soup.find_all(attrs={"data-json": True}):
+    for blob in features.data_json:
         try:
-            data = json.loads(elem["data-json"])
-            if search_json(data, 'stripe'):
+            data = json.loads(blob)
+            if _search_json(data, 'stripe'):
                 return 1.0
         except:
             pass
             
     return 0.0
 
-def _detect_stripe_metadata(soup: BeautifulSoup) -> float:
+def _detect_stripe_metadata(page: PageInput) -> float:
     """Check for Stripe metadata in HTML attributes"""
-    # Look for data attributes related to payments
-    payment_data_elements = soup.find_all(lambda tag: any(attr.startswith('data-') and (
-        'payment' in attr.lower() or 
-        'stripe' in attr.lower() or
-        'checkout' in attr.lower()
-    ) for attr in tag.attrs))
+    features = _as_features(page)
     
-    if payment_data_elements:
+    # Look for data attributes related to payments
+    if any('payment' in attr.lower() or 'stripe' in attr.lower() or 'checkout' in attr.lower()
+           for attr in features.data_attributes):
         return 0.7
     
     # Check for Stripe-specific class naming patterns
-    stripe_class_elements = soup.find_all(class_=lambda c: c and any(
-        pattern in c.lower() for pattern in [
-            'stripe', 'payment', 'checkout', 'card-', 'pay-'
-        ]
-    ))
-    
-    if stripe_class_elements:
+    if any(pattern in token.lower()
+           for token in features.class_tokens
+           for pattern in ['stripe', 'payment', 'checkout', 'card-', 'pay-']):
         return 0.5
         
     return 0.0
 
-def _check_popular_platforms(url: str, soup: BeautifulSoup, html: str) -> float:
+def _check_popular_platforms(url: str, page: PageInput, html: str, hits: Optional[FrozenSet[str]] = None) -> float:
     """Check for known e-commerce platforms that commonly use Stripe"""
+    if hits is None:
+        hits = scan_signatures(html)
+    mentions_stripe = 'mentions_stripe' in hits
+    
     # Check for Shopify with Stripe
-    if ('shopify' in html.lower() or 'cdn.shopify.com' in html) and \
-       ('stripe' in html.lower() or 'payment' in html.lower()):
+    if 'shopify' in hits and (mentions_stripe or 'mentions_payment' in hits):
         return 0.8
         
     # Check for WooCommerce with Stripe
-    if 'woocommerce' in html.lower():
-        if 'wc-stripe' in html.lower() or 'stripe_checkout' in html.lower():
+    if 'woocommerce' in hits:
+        if 'woocommerce_stripe' in hits:
             return 0.9
             
     # Check for BigCommerce with Stripe
-    if 'bigcommerce' in html.lower() and 'stripe' in html.lower():
+    if 'bigcommerce' in hits and mentions_stripe:
         return 0.8
         
     # Check for Webflow with Stripe
-    if 'webflow' in html.lower() and 'stripe' in html.lower():
+    if 'webflow' in hits and mentions_stripe:
         return 0.8
     
     # Check if the site is a SaaS checkout page (like Eight Sleep, Casper, etc.)
-    checkout_indicators = [
-        'checkout-container', 
-        'checkout_page',
-        'checkout-section',
-        'order summary',
-        'payment information',
-        'billing information',
-        'card information'
-    ]
-    
-    if '/checkout' in url.lower() and any(indicator in html.lower() for indicator in checkout_indicators):
+    if '/checkout' in url.lower() and 'checkout_indicator' in hits:
         # If it's a checkout page with payment fields, there's a good chance it uses Stripe
-        payment_fields = soup.find_all(['input', 'div'], attrs={
-            'name': lambda n: n and any(term in n.lower() for term in ['card', 'cc-', 'credit', 'payment'])
-        })
-        if payment_fields:
+        if any(term in name.lower()
+               for name in _as_features(page).field_names
+               for term in ['card', 'cc-', 'credit', 'payment']):
             return 0.6
             
     # Final check for Stripe in any form
-    if 'stripe' in html.lower():
+    if mentions_stripe:
         return 0.5
             
     return 0.0
\ No newline at end of file
@@ -1,11 +1,17 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+import json
 import os
-from app.services.stripe_detector import is_stripe_enabled
-from app.services.product_validator import validate_products
+import time
+from app.services import http_client, merchant_index, result_cache
+from app.services.stripe_detector import is_stripe_enabled, detection_flight, failure_cache, refresh_pool, result_status
+from app.services.product_validator import batch_limits, iter_product_verdicts, validate_products, validate_urls
 from app.services.checkout_helper import generate_checkout_url
 
 app = Flask(__name__)
 
+# Most URLs accepted by one /api/validate-urls request
+MAX_BATCH_URLS = int(os.environ.get('VALIDATION_MAX_URLS', 500))
+
 @app.route('/api/validate-url', methods=['POST'])
 def validate_url():
     """Check if a single URL uses Stripe for payments"""
@@ -17,24 +23,65 @@ def validate_url():
     return jsonify({
         'url': data['url'],
         'stripe_enabled': result['stripe_enabled'],
+        'status': result_status(result),
         'confidence': result['confidence'],
         'details': result.get('details', {})
     })
 
+@app.route('/api/validate-urls', methods=['POST'])
+def validate_url_batch():
+    """Check many URLs for Stripe in one round trip"""
+    data = request.get_json()
+    urls = data.get('urls') if data else None
+    if not isinstance(urls, list) or not all(isinstance(url, str) and url for url in urls):
+        return jsonify({'error': 'A list of URLs is required'}), 400
+    if len(urls) > MAX_BATCH_URLS:
+        return jsonify({'error': f'At most {MAX_BATCH_URLS} URLs can be checked at once'}), 400
+    try:
+        max_workers, deadline = batch_limits(data.get('max_workers'), data.get('deadline'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    started = time.monotonic()
+    results = validate_urls(urls, max_workers=max_workers, deadline=deadline)
+    return jsonify({
+        'total': len(urls),
+        'stripe_enabled': sum(1 for result in results if result['stripe_enabled']),
+        'checked': sum(1 for result in results if result['source'] == 'check'),
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+        'results': results
+    })
+
 @app.route('/api/filter-products', methods=['POST'])
 def filter_products():
     """Filter a list of products to only those using Stripe"""
     data = request.get_json()
     if not data or 'products' not in data:
         return jsonify({'error': 'Product list is required'}), 400
+    try:
+        max_workers, deadline = batch_limits(data.get('max_workers'), data.get('deadline'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    filtered = validate_products(data['products'])
+    if _wants_ndjson():
+        # One JSON line per verdict as soon as it is known, then a summary
+        records = iter_product_verdicts(data['products'], max_workers=max_workers, deadline=deadline)
+        lines = (json.dumps(record) + '\n' for record in records)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    
+    filtered = validate_products(data['products'], max_workers=max_workers, deadline=deadline)
     return jsonify({
         'total': len(data['products']),
         'stripe_enabled': len(filtered),
         'products': filtered
     })
 
+def _wants_ndjson() -> bool:
+    """Whether the client asked for a streamed NDJSON response"""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
 @app.route('/api/checkout', methods=['POST'])
 def create_checkout():
     """Generate a checkout URL for a Stripe-enabled product"""
@@ -55,5 +102,19 @@ def create_checkout():
         'checkout_url': checkout_url
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Report cache, coalescing, connection reuse and fetch scheduling counters"""
+    return jsonify({
+        'cache': result_cache.detection_cache.stats(),
+        'detection': detection_flight.stats(),
+        'refresh': refresh_pool.stats(),
+        'failures': failure_cache.stats(),
+        'http': http_client.connection_stats(),
+        'scheduler': http_client.scheduler.stats()
+    })
+
 if __name__ == '__main__':
+    # Deployments run the same build before starting their workers
+    merchant_index.build_index(if_missing=True)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,37 @@
+const axios = require('axios');
+
+module.exports = {
+  name: 'stripe-batch-detector',
+  description: 'Detect which of many websites or products use Stripe for payments, in one call',
+  inputSchema: {
+    type: 'object',
+    properties: {
+      urls: {
+        type: 'array',
+        description: 'The URLs to check for Stripe integration',
+        items: {
+          type: 'string'
+        }
+      }
+    },
+    required: ['urls']
+  },
+  async handler({ urls }) {
+    try {
+      const response = await axios.post('http://localhost:5000/api/validate-urls', {
+        urls
+      });
+      return response.data;
+    } catch (error) {
+      return {
+        results: urls.map(url => ({
+          url,
+          stripe_enabled: false,
+          status: 'unknown',
+          confidence: 0
+        })),
+        error: error.message
+      };
+    }
+  }
+};
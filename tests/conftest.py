@@ -0,0 +1,18 @@
+import pytest
+import app.services.checkout_helper as checkout_helper
+import app.services.result_cache as result_cache
+import app.services.stripe_detector as stripe_detector
+from app.services.cache_store import SQLiteStore
+from app.services.failure_cache import FailureCache
+from app.services.result_cache import PLATFORM_CACHE_TTL, LRUCache, TieredCache
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    """Point every shared cache at a database of the test's own."""
+    path = str(tmp_path / 'cache.sqlite3')
+    monkeypatch.setattr(result_cache, 'detection_cache', TieredCache(LRUCache(), SQLiteStore(path, 'detection')))
+    monkeypatch.setattr(result_cache, 'platform_cache',
+                        TieredCache(LRUCache(), SQLiteStore(path, 'platforms'), ttl=PLATFORM_CACHE_TTL))
+    monkeypatch.setattr(checkout_helper, 'checkout_cache', SQLiteStore(path, 'checkout_links', flush_every=1))
+    monkeypatch.setattr(stripe_detector, 'failure_cache', FailureCache())
@@ -0,0 +1,102 @@
+"""Local stub merchant server serving canned responses to the tests."""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# A route answers with (status, headers, body), or with a callable taking
+# the request handler and returning that tuple. A body given as an iterable
+# of byte chunks is sent chunk by chunk, and needs a Content-Length header
+Response = Tuple[int, Dict[str, str], Union[str, bytes, Iterable[bytes]]]
+Route = Union[Response, Callable[[BaseHTTPRequestHandler], Response]]
+
+
+class StubServer:
+    """Serve canned pages on localhost with optional per-path delays.
+
+    Use as a context manager; ``url(path)`` builds URLs pointing at it and
+    ``requests`` records (method, path, headers) for every request served.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, Route]] = None, delays: Optional[Dict[str, float]] = None):
+        self.routes: Dict[str, Route] = dict(routes or {})
+        self.delays: Dict[str, float] = dict(delays or {})
+        self.requests: List[Tuple[str, str, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def do_POST(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def url(self, path: str = '/') -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def hits(self, path: str) -> int:
+        with self._lock:
+            return sum(1 for _, served, _ in self.requests if served == path)
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        length = int(handler.headers.get('Content-Length') or 0)
+        if length:
+            handler.rfile.read(length)
+        with self._lock:
+            self.requests.append((handler.command, handler.path, dict(handler.headers)))
+        path = handler.path.split('?', 1)[0]
+        delay = self.delays.get(handler.path, self.delays.get(path, 0))
+        if delay:
+            time.sleep(delay)
+
+        route = self.routes.get(handler.path, self.routes.get(path))
+        if route is None:
+            status, headers, body = 404, {}, 'Not found'
+        elif callable(route):
+            status, headers, body = route(handler)
+        else:
+            status, headers, body = route
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        handler.send_response(status)
+        headers = dict(headers)
+        headers.setdefault('Content-Type', 'text/html; charset=utf-8')
+        if isinstance(body, bytes):
+            headers['Content-Length'] = str(len(body))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        if handler.command == 'HEAD':
+            return
+        if isinstance(body, bytes):
+            handler.wfile.write(body)
+            return
+        try:
+            for chunk in body:
+                handler.wfile.write(chunk)
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def __enter__(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+import pytest
+import app.services.http_client as http_client
+import app.services.result_cache as result_cache
+import app.services.stripe_detector as stripe_detector
+from app.services.fetch_scheduler import FetchScheduler
+from app.services.async_detector import (
+    AsyncDetectionEngine,
+    is_stripe_enabled_sync,
+    validate_products_async,
+    validate_products_sync
+)
+from tests.stub_server import StubServer
+
+STRIPE_HTML = """
+<html><head><script src="https://js.stripe.com/v3/"></script></head>
+<body><div id="card-element"></div><script>Stripe('pk_test_123').elements();</script></body></html>
+"""
+
+PLAIN_HTML = "<html><body><p>Just a blog about gardening.</p></body></html>"
+
+
+@pytest.fixture(autouse=True)
+def unthrottled_fetches(monkeypatch):
+    monkeypatch.setattr(http_client, 'scheduler', FetchScheduler(rate=0))
+
+
+def _tracking_route(body, delay):
+    """Route that sleeps and records the peak number of requests in flight."""
+    state = {'active': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def route(handler):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(delay)
+        with lock:
+            state['active'] -= 1
+        return 200, {}, body
+
+    return route, state
+
+
+def test_sync_wrapper_detects_stripe():
+    with StubServer({'/': (200, {}, STRIPE_HTML)}) as server:
+        result = is_stripe_enabled_sync(server.url('/'))
+
+    assert result['stripe_enabled'] is True
+    assert result['details']['fetch']['stopped'] == 'decisive_signature'
+
+
+def test_sync_wrapper_reports_fetch_errors():
+    with StubServer() as server:
+        result = is_stripe_enabled_sync(server.url('/missing'))
+
+    assert result['stripe_enabled'] is False
+    assert '404' in result['details']['error']
+    # A missing page says nothing about the site, so it is not backed off
+    assert stripe_detector.failure_cache.blocked(f'127.0.0.1:{server.port}') is None
+
+
+def test_async_fetches_honour_retry_after_through_the_shared_scheduler():
+    statuses = iter([429, 200])
+
+    def limited(handler):
+        status = next(statuses)
+        return status, {'Retry-After': '1'} if status == 429 else {}, STRIPE_HTML if status == 200 else 'slow down'
+
+    with StubServer({'/': limited}) as server:
+        started = time.monotonic()
+        result = is_stripe_enabled_sync(server.url('/'))
+
+        assert server.hits('/') == 2
+
+    assert result['stripe_enabled'] is True
+    assert time.monotonic() - started >= 1
+    assert http_client.scheduler.stats()['deferred'] == 1
+    assert http_client.scheduler.stats()['active'] == 0
+
+
+def test_async_fetches_count_against_the_shared_limits(monkeypatch):
+    monkeypatch.setattr(http_client, 'scheduler', FetchScheduler(max_concurrency=10, per_host=10, rate=10))
+    with StubServer({'/page': (200, {}, PLAIN_HTML)}) as server:
+        async def check_all():
+            async with AsyncDetectionEngine(max_concurrency=10, per_host_concurrency=10) as engine:
+                return await asyncio.gather(*(engine.check_site(server.url(f'/page?n={n}'), f'key{n}') for n in range(4)))
+
+        started = time.monotonic()
+        asyncio.run(check_all())
+
+    # Four requests to one host at ten per second are spread over 0.3s
+    assert time.monotonic() - started >= 0.3
+    assert http_client.scheduler.stats()['granted'] == 4
+
+
+def test_trickling_pages_are_cut_at_the_fetch_deadline(monkeypatch):
+    monkeypatch.setattr(http_client, 'FETCH_DEADLINE', 0.5)
+
+    def trickle():
+        yield PLAIN_HTML[:20].encode('utf-8')
+        for _ in range(200):
+            time.sleep(0.05)
+            yield b' '
+
+    with StubServer({'/': (200, {'Content-Length': '100000'}, trickle())}) as server:
+        started = time.monotonic()
+        result = is_stripe_enabled_sync(server.url('/'))
+
+    assert time.monotonic() - started < 1.5
+    assert result['details']['fetch']['stopped'] == 'deadline'
+    assert result['status'] == 'unknown'
+    assert result_cache.detection_cache.get(f'127.0.0.1:{server.port}') is None
+
+
+def test_per_host_limit_bounds_requests_in_flight():
+    route, state = _tracking_route(PLAIN_HTML, 0.1)
+    with StubServer({'/page': route}) as server:
+        async def check_all():
+            async with AsyncDetectionEngine(max_concurrency=10, per_host_concurrency=2) as engine:
+                results = await asyncio.gather(*(engine.is_stripe_enabled(server.url(f'/page?n={n}')) for n in range(6)))
+                # The domain's slots go once no check holds or waits for them
+                assert engine._host_limits == {}
+                return results
+
+        results = asyncio.run(check_all())
+
+    assert all(result['stripe_enabled'] is False for result in results)
+    assert state['peak'] == 2
+
+
+def test_global_limit_bounds_requests_across_hosts():
+    route, state = _tracking_route(PLAIN_HTML, 0.1)
+    with StubServer({'/': route}) as first, StubServer({'/': route}) as second:
+        urls = [first.url(f'/?n={n}') for n in range(3)] + [second.url(f'/?n={n}') for n in range(3)]
+
+        async def check_all():
+            async with AsyncDetectionEngine(max_concurrency=2, per_host_concurrency=4) as engine:
+                return await asyncio.gather(*(engine.is_stripe_enabled(url) for url in urls))
+
+        asyncio.run(check_all())
+
+    assert state['peak'] == 2
+
+
+def test_slow_merchants_are_checked_concurrently():
+    delays = {'/': 0.3}
+    with StubServer({'/': (200, {}, PLAIN_HTML)}, delays) as first, \
+            StubServer({'/': (200, {}, STRIPE_HTML)}, delays) as second:
+        products = [{'url': first.url('/')}, {'url': second.url('/')}]
+        started = time.monotonic()
+        stripe_products = validate_products_sync(products)
+        elapsed = time.monotonic() - started
+
+    assert stripe_products == [products[1]]
+    assert elapsed < 0.55
+
+
+def test_validate_products_checks_each_domain_once_in_input_order():
+    with StubServer({'/a': (200, {}, STRIPE_HTML), '/b': (200, {}, STRIPE_HTML)}) as server:
+        products = [{'url': server.url('/a'), 'name': 'A'}, {'name': 'no url'}, {'url': server.url('/b'), 'name': 'B'}]
+        stripe_products = asyncio.run(validate_products_async(products))
+
+        assert server.hits('/a') + server.hits('/b') == 1
+
+    assert [product['name'] for product in stripe_products] == ['A', 'B']
+    assert 'stripe_info' in stripe_products[0]
+    assert result_cache.detection_cache.get(f'127.0.0.1:{server.port}')['stripe_enabled'] is True
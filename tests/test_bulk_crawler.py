@@ -0,0 +1,117 @@
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import app.services.http_client as http_client
+import app.services.result_cache as result_cache
+from app.services.async_detector import AsyncDetectionEngine
+from app.services.bulk_crawler import read_urls, run_crawl, save_checkpoint
+from app.services.cache_keys import cache_key
+from app.services.fetch_scheduler import FetchScheduler
+from tests.stub_server import StubServer
+
+STRIPE_HTML = """
+<html><head><script src="https://js.stripe.com/v3/"></script></head>
+<body><div id="card-element"></div><script>Stripe('pk_test_123').elements();</script></body></html>
+"""
+
+PLAIN_HTML = "<html><body><p>Just a blog about gardening.</p></body></html>"
+
+
+@pytest.fixture(autouse=True)
+def unthrottled_fetches(monkeypatch):
+    monkeypatch.setattr(http_client, 'scheduler', FetchScheduler(rate=0))
+
+
+def _crawl(input_path, output_path, **kwargs):
+    async def crawl():
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            async with AsyncDetectionEngine(executor=executor) as engine:
+                return await run_crawl(str(input_path), str(output_path), engine, **kwargs)
+    return asyncio.run(crawl())
+
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_read_urls_from_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / 'urls.jsonl'
+    jsonl.write_text('{"url": "https://a.com"}\n"https://b.com"\n\n{"name": "no url"}\nnot json\n')
+    assert list(read_urls(str(jsonl))) == ['https://a.com', 'https://b.com', None, None]
+
+    with_header = tmp_path / 'with_header.csv'
+    with_header.write_text('name,url\nA,https://a.com\nB,\n')
+    assert list(read_urls(str(with_header))) == ['https://a.com', None]
+
+    without_header = tmp_path / 'without_header.csv'
+    without_header.write_text('https://a.com,A\nhttps://b.com,B\n')
+    assert list(read_urls(str(without_header))) == ['https://a.com', 'https://b.com']
+
+
+def test_crawl_writes_results_in_order_and_fills_the_cache(tmp_path):
+    with StubServer({'/a': (200, {}, STRIPE_HTML), '/b': (200, {}, STRIPE_HTML)}) as shop, \
+            StubServer({'/': (200, {}, PLAIN_HTML)}) as blog:
+        urls = [shop.url('/a'), blog.url('/'), None, shop.url('/b')]
+        input_path = tmp_path / 'urls.jsonl'
+        input_path.write_text(''.join(json.dumps({'url': url}) + '\n' for url in urls))
+        output_path = tmp_path / 'results.jsonl'
+
+        counts = _crawl(input_path, output_path, checkpoint_every=1)
+
+        # Pages of a site being checked wait for that check
+        assert shop.hits('/a') + shop.hits('/b') == 1
+
+    lines = _lines(output_path)
+    assert [line['url'] for line in lines] == [shop.url('/a'), blog.url('/'), shop.url('/b')]
+    assert [line['status'] for line in lines] == ['enabled', 'disabled', 'enabled']
+    assert counts == {'records': 4, 'enabled': 2, 'disabled': 1, 'unknown': 0, 'resumed_from': 0}
+    assert result_cache.detection_cache.get(cache_key(shop.url('/a')))['stripe_enabled'] is True
+    assert not (tmp_path / 'results.jsonl.checkpoint').exists()
+
+
+def test_refresh_rechecks_each_site_once_per_run(tmp_path):
+    with StubServer({'/a': (200, {}, STRIPE_HTML), '/b': (200, {}, STRIPE_HTML)}) as shop:
+        key = cache_key(shop.url('/a'))
+        # A result from an earlier run, still fresh
+        result_cache.detection_cache.set(key, {'stripe_enabled': False, 'status': 'disabled', 'confidence': 0,
+                                              'details': {'timestamp': 0}})
+        input_path = tmp_path / 'urls.jsonl'
+        input_path.write_text(''.join(json.dumps(shop.url(path)) + '\n' for path in ('/a', '/b', '/a')))
+        output_path = tmp_path / 'results.jsonl'
+
+        # One URL at a time, so later pages come after the refresh is done
+        _crawl(input_path, output_path, window=1, refresh=True)
+
+        assert shop.hits('/a') + shop.hits('/b') == 1
+
+    assert [line['status'] for line in _lines(output_path)] == ['enabled'] * 3
+
+
+def test_crawl_resumes_from_its_checkpoint(tmp_path):
+    with StubServer({'/': (200, {}, STRIPE_HTML)}) as first, StubServer({'/': (200, {}, PLAIN_HTML)}) as second:
+        input_path = tmp_path / 'urls.csv'
+        input_path.write_text(f'url\n{first.url("/")}\n{second.url("/")}\n')
+        output_path = tmp_path / 'results.jsonl'
+        done = b'{"url": "done"}\n'
+        # A crash left a half-written line after the last checkpoint
+        output_path.write_bytes(done + b'{"url": "partial')
+        save_checkpoint(str(output_path) + '.checkpoint', str(input_path), 1, len(done))
+
+        counts = _crawl(input_path, output_path)
+
+        assert first.hits('/') == 0
+        assert second.hits('/') == 1
+
+    assert [line['url'] for line in _lines(output_path)] == ['done', second.url('/')]
+    assert counts['resumed_from'] == 1
+
+
+def test_checkpoint_of_another_input_is_rejected(tmp_path):
+    input_path = tmp_path / 'urls.jsonl'
+    input_path.write_text('"https://a.com"\n')
+    output_path = tmp_path / 'results.jsonl'
+    save_checkpoint(str(output_path) + '.checkpoint', str(tmp_path / 'other.jsonl'), 1, 0)
+
+    with pytest.raises(ValueError):
+        _crawl(input_path, output_path)
@@ -0,0 +1,97 @@
+import json
+import sqlite3
+import time
+import app.services.result_cache as result_cache
+from app.services.cache_keys import cache_key
+from app.services.cache_store import SQLiteStore, migrate_json
+from app.services.stripe_detector import get_cached_result
+
+
+def _entry(value):
+    return {'timestamp': time.time(), 'result': value}
+
+
+def _rows(path, table):
+    with sqlite3.connect(path) as conn:
+        if not conn.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (table,)).fetchone():
+            return 0
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_writes_are_buffered_and_flushed_in_batches(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    store = SQLiteStore(path, 'detection', flush_every=3, flush_interval=60)
+    store.set('a.example.com', _entry(1))
+    store.set('b.example.com', _entry(2))
+
+    assert store.get('a.example.com')['result'] == 1
+    assert _rows(path, 'detection') == 0
+
+    store.set('c.example.com', _entry(3))
+    assert _rows(path, 'detection') == 3
+
+
+def test_idle_buffered_writes_are_flushed_after_the_interval(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    store = SQLiteStore(path, 'detection', flush_every=100, flush_interval=0.2)
+    store.set('a.example.com', _entry(1))
+    assert _rows(path, 'detection') == 0
+
+    # Nothing else is written, yet the entry reaches the database
+    deadline = time.monotonic() + 2
+    while _rows(path, 'detection') == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert store._timer is None
+
+
+def test_stores_in_separate_processes_see_flushed_writes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    writer = SQLiteStore(path, 'detection', flush_every=1)
+    reader = SQLiteStore(path, 'detection')
+    writer.set('shop.example.com', _entry({'stripe_enabled': True}))
+
+    assert reader.get('shop.example.com')['result'] == {'stripe_enabled': True}
+    writer.delete('shop.example.com')
+    assert reader.get('shop.example.com') is None
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_migrate_json_imports_both_legacy_cache_files(tmp_path):
+    validated = tmp_path / 'validated_sites.json'
+    validated.write_text(json.dumps({
+        'legacy.example.com': {'stripe_enabled': True, 'confidence': 0.4, 'timestamp': 1700000000}
+    }))
+    links = tmp_path / 'checkout_links.json'
+    links.write_text(json.dumps({
+        'https://shop.example.com/p': {'checkout_url': 'https://shop.example.com/cart/1:1', 'platform': 'shopify'}
+    }))
+    path = str(tmp_path / 'cache.sqlite3')
+    detection = SQLiteStore(path, 'detection')
+    checkout_links = SQLiteStore(path, 'checkout_links')
+
+    assert migrate_json(str(validated), detection) == 1
+    assert migrate_json(str(links), checkout_links, checkout_links=True) == 1
+    assert migrate_json(str(tmp_path / 'missing.json'), detection) == 0
+
+    assert detection.get('example.com') == {
+        'timestamp': 1700000000,
+        'result': {'stripe_enabled': True, 'confidence': 0.4, 'details': {}}
+    }
+    assert checkout_links.get('https://shop.example.com/p')['result']['platform'] == 'shopify'
+
+
+def test_migrated_entries_are_keyed_like_new_results(tmp_path):
+    validated = tmp_path / 'validated_sites.json'
+    now = time.time()
+    validated.write_text(json.dumps({
+        'www.shop.com:443': {'stripe_enabled': False, 'confidence': 0.1, 'timestamp': now - 60},
+        'shop.com': {'stripe_enabled': True, 'confidence': 0.6, 'timestamp': now}
+    }))
+
+    assert migrate_json(str(validated), result_cache.detection_cache.store) == 1
+
+    result = get_cached_result(cache_key('https://www.shop.com/products/mug'))
+    assert result['stripe_enabled'] is True
+    assert result['confidence'] == 0.6
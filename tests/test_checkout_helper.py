@@ -0,0 +1,46 @@
+import app.services.checkout_helper as checkout_helper
+from app.services.checkout_helper import generate_checkout_url
+from tests.stub_server import StubServer
+
+SHOPIFY_STRIPE_HTML = """
+<html><head>
+<script src="https://js.stripe.com/v3/"></script>
+<script>Shopify.theme = {"name": "Dawn"};</script>
+</head><body>
+<script type="application/json" id="ProductJson-product-template">{"variants": [{"id": 4242}]}</script>
+<form action="/cart/add"><input type="hidden" name="id" value="4242"></form>
+</body></html>
+"""
+
+GENERIC_STRIPE_HTML = """
+<html><head><script src="https://js.stripe.com/v3/"></script></head>
+<body><a class="btn" href="/buy/widget">Buy now</a></body></html>
+"""
+
+
+def test_generate_checkout_url_fetches_the_page_once():
+    with StubServer({'/products/widget': (200, {}, SHOPIFY_STRIPE_HTML)}) as server:
+        checkout_url = generate_checkout_url(server.url('/products/widget'))
+
+        assert checkout_url == f'https://127.0.0.1:{server.port}/cart/4242:1'
+        assert server.hits('/products/widget') == 1
+        # The IDs are read from the page in hand, not from the JSON endpoint
+        assert server.hits('/products/widget.js') == 0
+
+
+def test_generate_checkout_url_shares_the_page_with_generic_discovery():
+    with StubServer({'/widget': (200, {}, GENERIC_STRIPE_HTML)}) as server:
+        checkout_url = generate_checkout_url(server.url('/widget'))
+
+        assert checkout_url == server.url('/buy/widget')
+        assert server.hits('/widget') == 1
+
+
+def test_generate_checkout_url_keeps_alternative_links():
+    html = GENERIC_STRIPE_HTML.replace('</body>', '<a href="/checkout">Checkout</a></body>')
+    with StubServer({'/widget': (200, {}, html)}) as server:
+        checkout_url = generate_checkout_url(server.url('/widget'))
+
+    cached = checkout_helper.checkout_cache.get(server.url('/widget'))['result']
+    assert checkout_url == server.url('/checkout')
+    assert cached['alternatives'] == [server.url('/buy/widget')]
@@ -0,0 +1,91 @@
+from app.services.checkout_links import extract_candidates, rank_candidates
+from app.services.html_parser import parse_html
+
+BASE = 'https://shop.example.com'
+
+PAGE_HTML = """
+<html><body>
+<nav><a href="/">Home</a><a href="/cart">Cart</a><a href="#top">Buy now</a></nav>
+<a class="product-link" href="/products/other">Purchase the other widget</a>
+<div class="actions">
+  <button onclick="window.location.href='/checkout?item=7'">Buy <span>now</span></button>
+  <a class="btn btn-buy" href="https://buy.stripe.com/test_abc">Pay with card</a>
+  <form action="/cart/add" method="post"><input name="id" value="7"></form>
+  <a href="mailto:sales@example.com">Checkout questions?</a>
+</div>
+</body></html>
+"""
+
+
+def _ranked(html):
+    return rank_candidates(extract_candidates(parse_html(html, partial=True), BASE))
+
+
+def test_collects_anchors_buttons_and_forms_with_their_features():
+    candidates = extract_candidates(parse_html(PAGE_HTML), BASE)
+
+    assert [(candidate.source, candidate.url) for candidate in candidates] == [
+        ('anchor', f'{BASE}/products/other'),
+        ('button', f'{BASE}/checkout?item=7'),
+        ('anchor', 'https://buy.stripe.com/test_abc'),
+        ('form', f'{BASE}/cart/add')
+    ]
+    button = candidates[1]
+    assert button.text == 'Buy now'
+    assert candidates[2].stripe_hosted is True
+    assert candidates[2].classes == ['btn', 'btn-buy']
+
+
+def test_ranks_stripe_hosted_and_checkout_links_first():
+    ranked = _ranked(PAGE_HTML)
+
+    assert [candidate.url for candidate in ranked] == [
+        'https://buy.stripe.com/test_abc',
+        f'{BASE}/checkout?item=7',
+        f'{BASE}/products/other',
+        f'{BASE}/cart/add'
+    ]
+    assert ranked[0].score > ranked[1].score > ranked[2].score == ranked[3].score
+
+
+def test_best_link_wins_over_earlier_weaker_ones():
+    html = """
+    <a href="/products/gift-card">Purchase a gift card</a>
+    <a class="button" href="/checkout/start">Checkout</a>
+    """
+    assert _ranked(html)[0].url == f'{BASE}/checkout/start'
+
+
+def test_equally_good_links_keep_document_order_and_duplicates_collapse():
+    html = """
+    <a href="/buy/first">Buy now</a>
+    <a href="/buy/second">Buy now</a>
+    <a class="checkout" href="/buy/first">Buy now</a>
+    """
+    ranked = _ranked(html)
+
+    assert [candidate.url for candidate in ranked] == [f'{BASE}/buy/first', f'{BASE}/buy/second']
+    assert ranked[0].classes == ['checkout']
+
+
+def test_pages_without_checkout_signals_have_no_candidates():
+    assert _ranked('<a href="/about">About us</a><button>Menu</button>') == []
+
+
+def test_a_url_path_alone_is_no_checkout_signal():
+    html = """
+    <header><a href="/cart">Cart</a><a href="/pages/buy">Stores</a></header>
+    <a href="/blog/buyers-guide">Our favourite picks</a>
+    """
+    assert _ranked(html) == []
+
+
+def test_path_terms_match_whole_segments():
+    html = """
+    <a href="/buyers-guide">Buy guide</a>
+    <a href="/buy/widget">Buy guide</a>
+    """
+    ranked = _ranked(html)
+
+    assert [candidate.url for candidate in ranked] == [f'{BASE}/buy/widget', f'{BASE}/buyers-guide']
+    assert ranked[0].score > ranked[1].score
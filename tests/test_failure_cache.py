@@ -0,0 +1,91 @@
+import aiohttp
+import pytest
+import requests
+import app.services.stripe_detector as stripe_detector
+from app.services.failure_cache import FailureCache, is_host_failure
+from app.services.stripe_detector import is_stripe_enabled, result_status
+from tests.stub_server import StubServer
+
+
+@pytest.fixture(autouse=True)
+def quick_breaker(monkeypatch):
+    monkeypatch.setattr(stripe_detector, 'failure_cache', FailureCache(backoff=60, threshold=3, cooldown=600))
+
+
+def test_backoff_doubles_until_the_circuit_opens():
+    failures = FailureCache(backoff=10, backoff_max=25, threshold=4, cooldown=600)
+    delays = []
+    for _ in range(4):
+        failures.record_failure('down.example.com', TimeoutError('timed out'))
+        delays.append(failures.blocked('down.example.com'))
+
+    assert [round(blocked['retry_after']) for blocked in delays] == [10, 20, 25, 600]
+    assert [blocked['circuit'] for blocked in delays] == ['backoff', 'backoff', 'backoff', 'open']
+    assert delays[-1]['error'] == 'timed out'
+    assert failures.stats() == {'failing': 1, 'open_circuits': 1, 'fast_failures': 4}
+
+    failures.record_success('down.example.com')
+    assert failures.blocked('down.example.com') is None
+
+
+def test_failing_sites_are_reported_unknown_and_not_refetched():
+    with StubServer({'/': (403, {}, 'Forbidden')}) as server:
+        first = is_stripe_enabled(server.url('/'))
+        second = is_stripe_enabled(server.url('/'))
+
+        assert server.hits('/') == 1
+
+    assert result_status(first) == 'unknown'
+    assert '403' in first['details']['error']
+    assert second['status'] == 'unknown'
+    assert second['details']['circuit'] == 'backoff'
+    assert second['details']['retry_after'] > 0
+
+
+def test_missing_pages_do_not_back_off_the_site():
+    with StubServer({'/gone': (404, {}, 'Not found')}) as server:
+        key = f'127.0.0.1:{server.port}'
+        results = [is_stripe_enabled(server.url('/gone')) for _ in range(3)]
+
+        assert server.hits('/gone') == 3
+
+    assert all('404' in result['details']['error'] for result in results)
+    assert stripe_detector.failure_cache.blocked(key) is None
+    assert stripe_detector.failure_cache.stats()['failing'] == 0
+
+
+@pytest.mark.parametrize('error, counted', [
+    (requests.ConnectionError('refused'), True),
+    (requests.Timeout('timed out'), True),
+    (TimeoutError('deadline'), True),
+    (aiohttp.ClientResponseError(None, (), status=503), True),
+    (aiohttp.ClientResponseError(None, (), status=404), False),
+    (ValueError('bad page'), False),
+])
+def test_only_site_level_errors_count(error, counted):
+    assert is_host_failure(error) is counted
+
+
+def test_error_statuses_of_requests_count_by_status():
+    def http_error(status):
+        response = requests.Response()
+        response.status_code = status
+        return requests.HTTPError(f'{status} error', response=response)
+
+    assert [is_host_failure(http_error(status)) for status in (403, 404, 410, 429, 500, 503)] == \
+        [True, False, False, True, True, True]
+
+
+def test_success_clears_the_failure_record():
+    with StubServer({'/': (503, {}, 'Unavailable')}) as server:
+        key = f'127.0.0.1:{server.port}'
+        is_stripe_enabled(server.url('/'))
+        assert stripe_detector.failure_cache.blocked(key) is not None
+
+        # Let the backoff pass and the site recover
+        stripe_detector.failure_cache._entries[key]['retry_at'] = 0
+        server.routes['/'] = (200, {}, '<html><body>Hello</body></html>')
+        result = is_stripe_enabled(server.url('/'))
+
+    assert result['status'] == 'disabled'
+    assert stripe_detector.failure_cache.blocked(key) is None
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.services.fetch_scheduler import FetchScheduler
+
+
+def _wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def _fetch_in_thread(scheduler, url, order, hold=0.0):
+    def fetch():
+        host = scheduler.acquire(url)
+        order.append(url)
+        time.sleep(hold)
+        scheduler.release(host)
+    thread = threading.Thread(target=fetch)
+    thread.start()
+    return thread
+
+
+def test_limits_concurrency_per_host_and_overall():
+    scheduler = FetchScheduler(max_concurrency=3, per_host=2, rate=0)
+    held = [scheduler.acquire('https://a.com/1'), scheduler.acquire('https://a.com/2')]
+    order = []
+    third = _fetch_in_thread(scheduler, 'https://a.com/3', order)
+    _wait_for(lambda: scheduler.stats()['waiting'] == 1)
+
+    held.append(scheduler.acquire('https://b.com/1'))
+    fourth = _fetch_in_thread(scheduler, 'https://c.com/1', order)
+    _wait_for(lambda: scheduler.stats()['waiting'] == 2)
+    assert order == []
+
+    scheduler.release(held.pop())
+    fourth.join(1)
+    assert order == ['https://c.com/1']
+
+    scheduler.release(held.pop())
+    third.join(1)
+    assert order == ['https://c.com/1', 'https://a.com/3']
+    scheduler.release(held.pop())
+    assert scheduler.stats()['active'] == 0
+
+
+def test_waiting_hosts_take_turns():
+    scheduler = FetchScheduler(max_concurrency=1, per_host=1, rate=0)
+    host = scheduler.acquire('https://busy.com/0')
+    order = []
+    threads = []
+    for url in ['https://busy.com/1', 'https://busy.com/2', 'https://busy.com/3', 'https://quiet.com/1']:
+        threads.append(_fetch_in_thread(scheduler, url, order))
+        _wait_for(lambda: scheduler.stats()['waiting'] == len(threads))
+
+    scheduler.release(host)
+    for thread in threads:
+        thread.join(1)
+
+    assert order == ['https://busy.com/1', 'https://quiet.com/1', 'https://busy.com/2', 'https://busy.com/3']
+
+
+def test_spaces_requests_to_a_host_by_its_rate():
+    scheduler = FetchScheduler(max_concurrency=10, per_host=10, rate=20)
+    started = time.monotonic()
+    for _ in range(4):
+        scheduler.release(scheduler.acquire('https://a.com/'))
+    elapsed = time.monotonic() - started
+    scheduler.release(scheduler.acquire('https://b.com/'))
+
+    assert elapsed >= 0.15
+    assert time.monotonic() - started - elapsed < 0.05
+
+
+def test_deferred_host_waits_for_retry_after():
+    scheduler = FetchScheduler(rate=0)
+    scheduler.defer('a.com', 0.2)
+    started = time.monotonic()
+    scheduler.release(scheduler.acquire('https://a.com/'))
+
+    assert time.monotonic() - started >= 0.2
+    assert scheduler.stats()['deferred'] == 1
+
+
+def test_idle_hosts_are_forgotten_once_their_rate_limit_passes():
+    scheduler = FetchScheduler(rate=10)
+    for n in range(200):
+        scheduler.release(scheduler.acquire(f'https://shop{n}.com/'))
+    scheduler.defer('slow.com', 0.1)
+
+    assert scheduler.stats()['hosts_tracked'] == 201
+    time.sleep(0.15)
+    assert scheduler.stats()['hosts_tracked'] == 0
+
+
+def test_waiters_held_by_concurrency_start_once_the_rate_allows():
+    scheduler = FetchScheduler(per_host=1, rate=20)
+    order = []
+    threads = [_fetch_in_thread(scheduler, f'https://a.com/{n}', order, hold=0.01) for n in range(5)]
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert len(order) == 5
+    assert scheduler.stats()['active'] == 0
+
+
+def test_async_waiters_share_the_limits_and_can_be_cancelled():
+    scheduler = FetchScheduler(per_host=1, rate=0)
+
+    async def run():
+        host = await scheduler.acquire_async('https://a.com/')
+        waiter = asyncio.ensure_future(scheduler.acquire_async('https://a.com/'))
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()['waiting'] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        scheduler.release(host)
+        await scheduler.acquire_async('https://a.com/')
+
+    asyncio.run(run())
+    assert scheduler.stats()['waiting'] == 0
+    assert scheduler.stats()['active'] == 1
@@ -0,0 +1,102 @@
+import pytest
+import app.services.html_parser as html_parser
+from app.services.html_parser import available_backends, parse_html, resolve_backend
+from app.services.stripe_detector import analyze_html
+from app.services.checkout_helper import (
+    _handle_shopify_checkout,
+    _handle_woocommerce_checkout,
+    _find_checkout_link
+)
+from tests.stub_server import StubServer
+
+# Equivalence corpus: every backend must give identical detection results
+CORPUS = {
+    'stripe_elements': """
+<!DOCTYPE html>
+<html><head>
+<script src="https://js.stripe.com/v3/"></script>
+<meta name="description" content="Fast payment gateway checkout">
+</head><body>
+<form id="payment-form" data-secret="seti_123"><div id="card-element"></div><button>Pay</button></form>
+<script>const stripe = Stripe('pk_test_123'); stripe.elements();</script>
+</body></html>
+""",
+    'shopify_product': """
+<html><head><script>window.Shopify = {}; Shopify.theme = {"name": "Dawn"};</script>
+<link rel="stylesheet" href="//cdn.shopify.com/s/files/theme.css"></head>
+<body><div class="product-form">
+<script type="application/json" id="ProductJson-product-template">{"id": 1, "variants": [{"id": 4242}]}</script>
+<form action="/cart/add" method="post"><input type="hidden" name="id" value="4242"><button class="btn-buy">Add to cart</button></form>
+</div></body></html>
+""",
+    'woocommerce_product': """
+<html><body class="woocommerce single-product">
+<div class="summary"><form class="cart" method="post" enctype="multipart/form-data">
+<input type="number" name="quantity" value="1">
+<button type="submit" name="add-to-cart" value="77" class="single_add_to_cart_button">Add to cart</button>
+<input type="hidden" name="add-to-cart" value="77">
+</form></div>
+<script src="/wp-content/plugins/woocommerce-gateway-stripe/assets/js/wc-stripe.js"></script>
+</body></html>
+""",
+    'generic_checkout': """
+<html><body>
+<div class="checkout-container"><h2>Order summary</h2>
+<input name="card-number" placeholder="Card information">
+<a class="btn buy" href="/buy/widget">Buy now</a>
+<img src="/img/badges.png" alt="Secure checkout">
+</div></body></html>
+""",
+    'malformed': """
+<html><body><div class="pay-widget"><span data-payment-id=7>Total
+<form action="https://billing.example.com/charge"><input name="cc-number">
+<p>Unclosed paragraph <a href="https://example.com/terms">terms
+</div><script type="application/ld+json">{"@type": "Offer", "checkout": true}</script>
+""",
+    'plain': """
+<html><head><title>About us</title></head>
+<body><h1>Handmade mugs</h1><p>Ships in three days.</p></body></html>
+"""
+}
+
+
+def _detection(name, url, backend):
+    result = analyze_html(url, CORPUS[name], parser=backend)
+    return result['stripe_enabled'], result['confidence'], result['details']['detection_methods']
+
+
+@pytest.mark.parametrize('name', sorted(CORPUS))
+@pytest.mark.parametrize('url', ['https://shop.example.com/products/widget', 'https://shop.example.com/checkout'])
+def test_backends_give_identical_detection_results(name, url):
+    results = {backend: _detection(name, url, backend) for backend in available_backends()}
+    assert len(set(map(repr, results.values()))) == 1, results
+
+
+@pytest.mark.parametrize('backend', ['html.parser', 'lxml', 'html5lib'])
+def test_backends_give_identical_checkout_links(backend, monkeypatch):
+    if backend not in available_backends():
+        pytest.skip(f'{backend} is not installed')
+    monkeypatch.setattr(html_parser, 'HTML_PARSER_BACKEND', backend)
+
+    routes = {f'/{name}': (200, {}, html) for name, html in CORPUS.items()}
+    with StubServer(routes) as server:
+        base = server.url('')
+        assert _handle_shopify_checkout(server.url('/shopify_product')) == f'https://127.0.0.1:{server.port}/cart/4242:1'
+        assert _handle_woocommerce_checkout(server.url('/woocommerce_product')) == f'{base}/checkout/?add-to-cart=77&quantity=1'
+        assert _find_checkout_link(server.url('/generic_checkout')) == f'{base}/buy/widget'
+
+
+def test_partial_parse_keeps_only_checkout_elements():
+    soup = parse_html(CORPUS['shopify_product'], 'html.parser', partial=True)
+
+    assert soup.find('div') is None
+    assert soup.find('form').find('input', {'name': 'id'})['value'] == '4242'
+
+
+def test_resolve_backend_falls_back_when_unavailable(monkeypatch):
+    monkeypatch.setattr(html_parser, '_available_backends', ['html.parser'])
+
+    assert resolve_backend('lxml') == 'html.parser'
+    assert resolve_backend('auto') == 'html.parser'
+    with pytest.raises(ValueError):
+        resolve_backend('selectolax')
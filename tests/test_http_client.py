@@ -0,0 +1,174 @@
+import gzip
+import threading
+import time
+import pytest
+import urllib3.response
+import app.services.http_client as http_client
+from app.services.fetch_scheduler import FetchScheduler
+from tests.stub_server import StubServer
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools(monkeypatch):
+    # Start every test from new connection pools with fast retries
+    monkeypatch.setattr(http_client, '_adapter', None)
+    monkeypatch.setattr(http_client, '_local', threading.local())
+    monkeypatch.setattr(http_client, 'RETRY_BACKOFF', 0)
+    monkeypatch.setattr(http_client, 'scheduler', FetchScheduler(rate=0))
+
+
+def test_get_reuses_kept_alive_connections():
+    with StubServer({'/a': (200, {}, 'a'), '/b': (200, {}, 'b')}) as server:
+        assert http_client.get(server.url('/a')).text == 'a'
+        assert http_client.get(server.url('/b')).text == 'b'
+
+        stats = http_client.connection_stats()
+
+    assert stats['requests'] == 2
+    assert stats['connections'] == 1
+    assert stats['reused'] == 1
+
+
+def test_get_shares_pools_between_threads():
+    with StubServer({'/': (200, {}, 'ok')}) as server:
+        sessions = []
+
+        def fetch():
+            sessions.append(http_client.get_session())
+            http_client.get(server.url('/'))
+
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = http_client.connection_stats()
+
+    assert len(set(map(id, sessions))) == 4
+    assert stats['pools'] == 1
+    assert stats['requests'] == 4
+
+
+def test_get_sends_uniform_headers_and_decodes_gzip():
+    body = gzip.compress(b'<html>compressed</html>')
+    with StubServer({'/': (200, {'Content-Encoding': 'gzip'}, body)}) as server:
+        response = http_client.get(server.url('/'))
+        _, _, headers = server.requests[0]
+
+    assert response.text == '<html>compressed</html>'
+    assert 'gzip' in headers['Accept-Encoding']
+    assert headers['User-Agent'] == http_client.DEFAULT_HEADERS['User-Agent']
+
+
+def test_get_retries_transient_errors():
+    statuses = iter([503, 200])
+
+    def flaky(handler):
+        status = next(statuses)
+        return status, {}, 'ok' if status == 200 else 'busy'
+
+    with StubServer({'/': flaky}) as server:
+        response = http_client.get(server.url('/'))
+
+    assert response.status_code == 200
+    assert server.hits('/') == 2
+
+
+def test_get_waits_for_retry_after_before_retrying():
+    statuses = iter([429, 200])
+
+    def limited(handler):
+        status = next(statuses)
+        return status, {'Retry-After': '1'} if status == 429 else {}, 'ok' if status == 200 else 'slow down'
+
+    with StubServer({'/': limited}) as server:
+        started = time.monotonic()
+        response = http_client.get(server.url('/'))
+
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 1
+    assert http_client.scheduler.stats()['deferred'] == 1
+
+
+def test_get_does_not_wait_for_long_retry_after(monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_RETRY_AFTER', 0.5)
+    with StubServer({'/': (503, {'Retry-After': '3600'}, 'maintenance')}) as server:
+        response = http_client.get(server.url('/'))
+
+    assert response.status_code == 503
+    assert server.hits('/') == 1
+
+
+def test_streamed_response_holds_its_slot_until_closed():
+    with StubServer({'/': (200, {}, 'ok')}) as server:
+        response = http_client.get(server.url('/'), stream=True)
+        assert http_client.scheduler.stats()['active'] == 1
+        response.close()
+        response.close()
+
+    assert http_client.scheduler.stats()['active'] == 0
+
+
+def _conditional_route(body, etag):
+    def route(handler):
+        if handler.headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, ''
+        return 200, {'ETag': etag, 'Last-Modified': 'Wed, 01 Oct 2025 10:00:00 GMT'}, body
+    return route
+
+
+def test_download_text_revalidates_with_cache_validators():
+    with StubServer({'/': _conditional_route('<p>page</p>', '"v1"')}) as server:
+        _, text, info = http_client.download_text(server.url('/'))
+        assert text == '<p>page</p>'
+        assert info['validators'] == {'etag': '"v1"', 'last_modified': 'Wed, 01 Oct 2025 10:00:00 GMT'}
+
+        headers = http_client.conditional_headers(info['validators'])
+        response, text, info = http_client.download_text(server.url('/'), headers=headers)
+
+        assert server.requests[-1][2]['If-Modified-Since'] == 'Wed, 01 Oct 2025 10:00:00 GMT'
+
+    assert response.status_code == 304
+    assert text == ''
+    assert info == {'bytes': 0, 'stopped': None, 'not_modified': True, 'validators': {'etag': '"v1"'}}
+
+
+def _trickle(first, seconds):
+    """Body sending `first` at once, then a byte every 50ms for `seconds`."""
+    yield first
+    for _ in range(int(seconds / 0.05)):
+        time.sleep(0.05)
+        yield b'x'
+
+
+def test_download_text_stops_a_trickling_body_at_the_deadline():
+    trickle = (200, {'Content-Length': '100000'}, _trickle(b'<html><body>', 10))
+    with StubServer({'/': trickle}) as server:
+        started = time.monotonic()
+        _, text, info = http_client.download_text(server.url('/'), deadline=0.5)
+
+    assert time.monotonic() - started < 1.5
+    assert info['stopped'] == 'deadline'
+    assert text.startswith('<html><body>')
+
+
+def test_download_text_decodes_compressed_bodies():
+    html = '<html><body>' + 'café ' * 2000 + '</body></html>'
+    with StubServer({'/': (200, {'Content-Encoding': 'gzip'}, gzip.compress(html.encode('utf-8')))}) as server:
+        _, text, info = http_client.download_text(server.url('/'))
+
+    assert text == html
+    assert info['stopped'] is None
+
+
+def test_download_text_reads_bodies_without_read1(monkeypatch):
+    # urllib3 releases before 2.1 have no HTTPResponse.read1()
+    monkeypatch.delattr(urllib3.response.HTTPResponse, 'read1')
+    monkeypatch.delattr(urllib3.response.BaseHTTPResponse, 'read1')
+    html = '<html><body>' + 'café ' * 2000 + '</body></html>'
+    with StubServer({'/': (200, {'Content-Encoding': 'gzip'}, gzip.compress(html.encode('utf-8')))}) as server:
+        _, text, info = http_client.download_text(server.url('/'))
+
+    assert text == html
+    assert info['stopped'] is None
@@ -0,0 +1,123 @@
+import os
+import time
+import pytest
+import app.services.result_cache as result_cache
+import app.services.stripe_detector as stripe_detector
+from app.services.cache_store import SQLiteStore
+from app.services.merchant_index import (
+    KnownMerchants,
+    MerchantIndex,
+    build_index,
+    main,
+    records_from_cache,
+    write_index
+)
+from app.services.refresher import RefreshPool
+from app.services.result_cache import LRUCache, TieredCache
+from app.services.stripe_detector import is_stripe_enabled
+from tests.stub_server import StubServer
+
+
+def test_lookup_finds_every_indexed_key(tmp_path):
+    path = str(tmp_path / 'known.idx')
+    keys = [f'shop{i}.example.com' for i in range(500)]
+    write_index(path, [(key, 'enabled' if i % 2 else 'disabled', 0.5, 'shopify', 1700000000) for i, key in enumerate(keys)])
+    index = MerchantIndex(path)
+
+    assert len(index) == 500
+    assert index.lookup('shop7.example.com') == {
+        'status': 'enabled', 'confidence': 0.5, 'platform': 'shopify', 'checked_at': 1700000000
+    }
+    assert index.lookup('shop8.example.com')['status'] == 'disabled'
+    assert index.lookup('shop7.example.co') is None
+    assert index.lookup('a' * 100) is None
+
+
+def test_rebuilt_index_is_picked_up_without_a_restart(tmp_path):
+    path = str(tmp_path / 'known.idx')
+    known = KnownMerchants(path, reload_interval=0)
+    assert known.lookup('shop.com') is None
+
+    write_index(path, [('shop.com', 'disabled', 0.1, None, 1700000000)])
+    assert known.lookup('shop.com')['status'] == 'disabled'
+
+    write_index(path, [('shop.com', 'enabled', 0.9, 'woocommerce', 1700000100), ('other.com', 'enabled', 0.6, None, 0)])
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 1))
+    assert known.lookup('shop.com') == {'status': 'enabled', 'confidence': 0.9, 'platform': 'woocommerce', 'checked_at': 1700000100}
+
+
+def test_corrupt_index_means_no_known_merchants(tmp_path):
+    path = tmp_path / 'known.idx'
+    path.write_bytes(b'not an index')
+    assert KnownMerchants(str(path), reload_interval=0).lookup('shop.com') is None
+
+
+def test_records_skip_failures_and_old_results():
+    now = 1700000000
+    entries = [
+        ('good.com', {'timestamp': now - 10, 'result': {'stripe_enabled': True, 'confidence': 0.7, 'details': {'platform': 'shopify'}}}),
+        ('failed.com', {'timestamp': now - 10, 'result': {'stripe_enabled': False, 'confidence': 0, 'details': {'error': '403'}}}),
+        ('old.com', {'timestamp': now - 1000, 'result': {'stripe_enabled': False, 'confidence': 0.1, 'details': {}}})
+    ]
+    assert list(records_from_cache(entries, max_age=100, now=now)) == [('good.com', 'enabled', 0.7, 'shopify', now - 10)]
+
+
+def test_build_command_indexes_the_persistent_cache(tmp_path, monkeypatch, capsys):
+    store = SQLiteStore(str(tmp_path / 'cache.sqlite3'), 'detection')
+    cache = TieredCache(LRUCache(), store)
+    cache.set('shop.com', {'stripe_enabled': True, 'status': 'enabled', 'confidence': 0.8, 'details': {'platform': 'webflow'}})
+    monkeypatch.setattr(result_cache, 'detection_cache', cache)
+
+    main(['build', '--output', str(tmp_path / 'known.idx')])
+
+    assert 'Wrote 1 merchants' in capsys.readouterr().out
+    assert MerchantIndex(str(tmp_path / 'known.idx')).lookup('shop.com')['platform'] == 'webflow'
+
+
+def test_build_if_missing_keeps_an_existing_index(tmp_path, monkeypatch, capsys):
+    store = SQLiteStore(str(tmp_path / 'cache.sqlite3'), 'detection')
+    cache = TieredCache(LRUCache(), store)
+    cache.set('shop.com', {'stripe_enabled': True, 'status': 'enabled', 'confidence': 0.8, 'details': {}})
+    monkeypatch.setattr(result_cache, 'detection_cache', cache)
+    path = str(tmp_path / 'known.idx')
+
+    assert build_index(path, if_missing=True) == 1
+    cache.set('other.com', {'stripe_enabled': False, 'status': 'disabled', 'confidence': 0.1, 'details': {}})
+    main(['build', '--output', path, '--if-missing'])
+
+    assert 'Kept the existing index' in capsys.readouterr().out
+    assert len(MerchantIndex(path)) == 1
+    assert build_index(path) == 2
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_known_merchants_are_answered_without_fetching(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, 'detection_cache', TieredCache())
+    with StubServer({'/': (200, {}, '<html></html>')}) as server:
+        path = str(tmp_path / 'known.idx')
+        write_index(path, [(f'127.0.0.1:{server.port}', 'enabled', 0.9, 'shopify', int(time.time()))])
+        monkeypatch.setattr(stripe_detector, 'known_merchants', KnownMerchants(path))
+
+        result = is_stripe_enabled(server.url('/product'))
+
+        assert server.hits('/product') == 0
+
+    assert result['stripe_enabled'] is True
+    assert result['details']['result_source'] == 'known_merchant_index'
+
+
+def test_old_index_answers_queue_a_refresh(tmp_path, monkeypatch):
+    monkeypatch.setattr(stripe_detector, 'refresh_pool', RefreshPool(workers=1))
+    with StubServer({'/product': (200, {}, '<html><body>Plain</body></html>')}) as server:
+        key = f'127.0.0.1:{server.port}'
+        path = str(tmp_path / 'known.idx')
+        checked_at = int(time.time() - result_cache.detection_cache.ttl - 60)
+        write_index(path, [(key, 'enabled', 0.9, None, checked_at)])
+        monkeypatch.setattr(stripe_detector, 'known_merchants', KnownMerchants(path))
+
+        result = is_stripe_enabled(server.url('/product'))
+        assert stripe_detector.refresh_pool.wait_idle(2)
+
+    assert result['details']['result_source'] == 'known_merchant_index'
+    assert server.hits('/product') == 1
+    assert result_cache.detection_cache.get(key)['status'] == 'disabled'
@@ -0,0 +1,56 @@
+from bs4 import BeautifulSoup
+from app.services.page_features import extract_features
+from app.services.stripe_detector import (
+    _detect_stripe_js,
+    _detect_stripe_links,
+    _detect_stripe_json_data,
+    _detect_stripe_metadata
+)
+
+PAGE_HTML = """
+<html>
+<head>
+    <meta name="description" content="Secure payment gateway">
+    <script src="/static/app.js"></script>
+    <script type="application/ld+json">{"@type": "Product", "offers": {"checkout": true}}</script>
+</head>
+<body>
+    <div id="Card-Container" class="pay-box wide" data-processor="Stripe"></div>
+    <form action="/cart/add" data-gateway="stripe"><input name="cc-number"></form>
+    <a href="https://example.com/about">About</a>
+    <img src="/logo.png" alt="Logo">
+    <span data-json='{"provider": "stripe"}'></span>
+</body>
+</html>
+"""
+
+
+def test_extract_features_collects_every_detector_input():
+    features = extract_features(BeautifulSoup(PAGE_HTML, 'html.parser'))
+
+    assert [src for src, _, _ in features.scripts] == ['/static/app.js', '']
+    assert features.json_scripts == ['{"@type": "Product", "offers": {"checkout": true}}']
+    assert features.forms == [('/cart/add', ['stripe'])]
+    assert features.hrefs == ['https://example.com/about']
+    assert features.meta_contents == ['Secure payment gateway']
+    assert features.images == [('/logo.png', 'Logo')]
+    assert 'Card-Container' in features.container_tokens
+    assert features.data_processors == ['Stripe']
+    assert features.data_json == ['{"provider": "stripe"}']
+    assert {'data-processor', 'data-gateway', 'data-json'} <= features.data_attributes
+    assert {'pay-box', 'wide'} <= features.class_tokens
+    assert features.field_names == ['cc-number']
+
+
+def test_detectors_score_features_like_the_tree():
+    soup = BeautifulSoup(PAGE_HTML, 'html.parser')
+    features = extract_features(soup)
+
+    assert _detect_stripe_js(PAGE_HTML, features) == _detect_stripe_js(PAGE_HTML, soup)
+    assert _detect_stripe_links(PAGE_HTML, features) == _detect_stripe_links(PAGE_HTML, soup) == 0.9
+    assert _detect_stripe_metadata(features) == _detect_stripe_metadata(soup) == 0.5
+
+
+def test_detect_stripe_json_data_checks_data_attributes():
+    html = '<div data-json=\'{"gateway": "Stripe"}\'></div>'
+    assert _detect_stripe_json_data(html, BeautifulSoup(html, 'html.parser')) == 1.0
@@ -0,0 +1,88 @@
+import json
+from app.services.platform_adapters import ProductIds, checkout_url, resolve_product, resolve_products
+from tests.stub_server import StubServer
+
+SHOPIFY_PRODUCT = {
+    'id': 7001,
+    'handle': 'widget',
+    'variants': [{'id': 11, 'available': False}, {'id': 12, 'available': True}, {'id': 13, 'available': True}]
+}
+
+SHOPIFY_PAGE = """
+<html><body>
+<script type="application/json" id="ProductJson-product-template">{"id": 7002, "variants": [{"id": 4242}]}</script>
+</body></html>
+"""
+
+WOOCOMMERCE_PAGE = """
+<html><body><form class="cart"><input type="hidden" name="add-to-cart" value="99"></form></body></html>
+"""
+
+
+def _json(data):
+    return 200, {'Content-Type': 'application/json'}, json.dumps(data)
+
+
+def test_shopify_product_json_is_read_instead_of_the_page():
+    with StubServer({'/products/widget.js': _json(SHOPIFY_PRODUCT), '/products/widget': (200, {}, SHOPIFY_PAGE)}) as store:
+        ids = resolve_product(store.url('/products/widget'), 'shopify')
+        requested = resolve_product(store.url('/collections/all/products/widget?variant=13'), 'shopify')
+
+        assert store.hits('/products/widget') == 0
+
+    assert ids == ProductIds('7001', '12', 'json')
+    assert requested.variant_id == '13'
+    assert checkout_url(store.url('/products/widget'), 'shopify', ids) == f'https://127.0.0.1:{store.port}/cart/12:1'
+
+
+def test_shopify_falls_back_to_the_product_page():
+    with StubServer({'/products/widget': (200, {}, SHOPIFY_PAGE)}) as store:
+        ids = resolve_product(store.url('/products/widget'), 'shopify')
+
+        assert store.hits('/products/widget.js') == 1
+
+    assert ids == ProductIds('7002', '4242', 'html')
+
+
+def test_woocommerce_products_of_a_store_resolve_in_one_store_api_request():
+    catalog = [
+        {'id': 1, 'slug': 'mug', 'variations': []},
+        {'id': 2, 'slug': 'shirt', 'variations': [{'id': 21, 'attributes': []}]}
+    ]
+    with StubServer({
+        '/wp-json/wc/store/v1/products': _json(catalog),
+        '/product/poster/': (200, {}, WOOCOMMERCE_PAGE)
+    }) as store:
+        urls = [store.url('/product/mug/'), store.url('/product/shirt/'), store.url('/product/poster/'), store.url('/about/')]
+        resolved = resolve_products(urls, 'woocommerce')
+
+        api_paths = [path for _, path, _ in store.requests if path.startswith('/wp-json')]
+        assert len(api_paths) == 1
+        assert 'slug=mug,shirt,poster' in api_paths[0]
+        assert store.hits('/product/mug/') == 0
+
+    assert resolved[urls[0]] == ProductIds('1', None, 'json')
+    assert resolved[urls[1]] == ProductIds('2', '21', 'json')
+    # Not in the Store API response, so scraped from its page
+    assert resolved[urls[2]] == ProductIds('99', None, 'html')
+    assert resolved[urls[3]] is None
+    assert checkout_url(urls[1], 'woocommerce', resolved[urls[1]]) == store.url('/checkout/?add-to-cart=21&quantity=1')
+
+
+def test_percent_encoded_handles_and_slugs_are_not_encoded_twice():
+    with StubServer({
+        '/products/caf%C3%A9.js': _json(SHOPIFY_PRODUCT),
+        '/wp-json/wc/store/v1/products': _json([{'id': 3, 'slug': 'caf%c3%a9', 'variations': []}])
+    }) as store:
+        shopify = resolve_product(store.url('/products/caf%C3%A9'), 'shopify')
+        woocommerce = resolve_product(store.url('/product/caf%C3%A9/'), 'woocommerce')
+
+        api_paths = [path for _, path, _ in store.requests if path.startswith('/wp-json')]
+
+    assert shopify == ProductIds('7001', '12', 'json')
+    assert woocommerce == ProductIds('3', None, 'json')
+    assert 'slug=caf%C3%A9&' in api_paths[0]
+
+
+def test_unknown_platforms_resolve_nothing():
+    assert resolve_products(['https://shop.example.com/p/1'], 'bigcommerce') == {'https://shop.example.com/p/1': None}
@@ -0,0 +1,74 @@
+import json
+import app.services.checkout_helper as checkout_helper
+import app.services.http_client as http_client
+from app.services.cache_keys import cache_key
+from app.services.checkout_helper import generate_checkout_url
+from app.services.platforms import cached_platform, identify_platform
+from app.services.stripe_detector import is_stripe_enabled
+from tests.stub_server import StubServer
+
+SHOPIFY_STRIPE_HTML = """
+<html><head>
+<script src="https://js.stripe.com/v3/"></script>
+<script>Shopify.theme = {"name": "Dawn"};</script>
+</head><body><div id="card-element"></div></body></html>
+"""
+
+
+def test_identify_platform_from_page_signatures():
+    assert identify_platform(SHOPIFY_STRIPE_HTML) == 'shopify'
+    assert identify_platform('<html><body>Plain</body></html>') is None
+
+
+def test_identify_platform_needs_a_shopify_store_signature():
+    assert identify_platform('<link href="//cdn.shopify.com/s/files/theme.css">') == 'shopify'
+    assert identify_platform('<p>We moved here from Shopify last year.</p>') is None
+
+
+def test_identify_platform_treats_add_to_cart_forms_as_woocommerce():
+    page = '<form class="cart"><button name="add-to-cart" value="42">Add to basket</button></form>'
+    assert identify_platform(page) == 'woocommerce'
+
+
+def test_detection_records_the_platform_for_the_whole_site():
+    with StubServer({'/checkout': (200, {}, SHOPIFY_STRIPE_HTML)}) as server:
+        is_stripe_enabled(server.url('/checkout'))
+
+    assert cache_key(server.url('/checkout')).endswith('#checkout')
+    assert cached_platform(server.url('/products/widget')) == {'platform': 'shopify'}
+
+
+def test_checkout_for_a_known_merchant_skips_the_product_page():
+    product = json.dumps({'id': 1, 'variants': [{'id': 55, 'available': True}]})
+    with StubServer({
+        '/': (200, {}, SHOPIFY_STRIPE_HTML),
+        '/products/widget': (200, {}, SHOPIFY_STRIPE_HTML),
+        '/products/widget.js': (200, {'Content-Type': 'application/json'}, product)
+    }) as server:
+        assert is_stripe_enabled(server.url('/'))['stripe_enabled'] is True
+
+        checkout_url = generate_checkout_url(server.url('/products/widget'))
+
+        assert server.hits('/products/widget') == 0
+
+    assert checkout_url == f'https://127.0.0.1:{server.port}/cart/55:1'
+
+
+def test_sites_on_no_known_platform_are_remembered_too():
+    with StubServer({'/': (200, {}, '<html><body>Plain</body></html>')}) as server:
+        assert checkout_helper._detect_platform(server.url('/')) == 'unknown'
+        assert checkout_helper._detect_platform(server.url('/other')) == 'unknown'
+
+        assert server.hits('/') == 1
+        assert server.hits('/other') == 0
+
+
+def test_pages_cut_short_do_not_record_a_missing_platform(monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_BODY_BYTES', 64)
+    page = '<html><body>' + 'x' * 200 + '<script>Shopify.theme = {};</script></body></html>'
+    with StubServer({'/': (200, {}, page)}) as server:
+        result = is_stripe_enabled(server.url('/'))
+        assert checkout_helper._detect_platform(server.url('/other')) == 'unknown'
+
+    assert result['details']['fetch']['stopped'] == 'max_bytes'
+    assert cached_platform(server.url('/')) is None
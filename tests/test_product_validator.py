@@ -0,0 +1,158 @@
+import threading
+import time
+import pytest
+import app.services.result_cache as result_cache
+import server
+from app.services.product_validator import (
+    VALIDATION_DEADLINE,
+    VALIDATION_WORKERS,
+    batch_limits,
+    iter_product_verdicts,
+    validate_products,
+    validate_urls
+)
+from tests.stub_server import StubServer
+
+STRIPE_HTML = """
+<html><head><script src="https://js.stripe.com/v3/"></script></head>
+<body><div id="card-element"></div><script>Stripe('pk_test_123').elements();</script></body></html>
+"""
+
+PLAIN_HTML = "<html><body><p>Just a blog about gardening.</p></body></html>"
+
+
+def test_validate_products_checks_each_domain_once_in_input_order():
+    with StubServer({'/a': (200, {}, STRIPE_HTML), '/b': (200, {}, STRIPE_HTML)}) as stripe_shop, \
+            StubServer({'/c': (200, {}, PLAIN_HTML)}) as plain_shop:
+        products = [
+            {'url': stripe_shop.url('/a'), 'name': 'A'},
+            {'url': plain_shop.url('/c'), 'name': 'C'},
+            {'name': 'no url'},
+            {'url': stripe_shop.url('/b'), 'name': 'B'}
+        ]
+        filtered = validate_products(products)
+
+        assert stripe_shop.hits('/a') + stripe_shop.hits('/b') == 1
+        assert plain_shop.hits('/c') == 1
+
+    assert [product['name'] for product in filtered] == ['A', 'B']
+    assert 'stripe_info' in filtered[0]
+    assert result_cache.detection_cache.stats()['entries'] == 2
+
+
+def test_validate_products_checks_domains_in_parallel():
+    with StubServer({'/': (200, {}, STRIPE_HTML)}, {'/': 0.3}) as first, \
+            StubServer({'/': (200, {}, STRIPE_HTML)}, {'/': 0.3}) as second, \
+            StubServer({'/': (200, {}, PLAIN_HTML)}, {'/': 0.3}) as third:
+        products = [{'url': server.url('/')} for server in (first, second, third)]
+        started = time.monotonic()
+        filtered = validate_products(products, max_workers=3)
+        elapsed = time.monotonic() - started
+
+    assert filtered == products[:2]
+    assert elapsed < 0.6
+
+
+def test_validate_products_leaves_out_domains_past_the_deadline():
+    release = threading.Event()
+
+    def stalled(handler):
+        release.wait(2)
+        return 200, {}, STRIPE_HTML
+
+    with StubServer({'/': (200, {}, STRIPE_HTML)}) as fast, StubServer({'/': stalled}) as slow:
+        products = [{'url': slow.url('/'), 'name': 'slow'}, {'url': fast.url('/'), 'name': 'fast'}]
+        started = time.monotonic()
+        filtered = validate_products(products, deadline=0.5)
+        elapsed = time.monotonic() - started
+        assert result_cache.detection_cache.get(f'127.0.0.1:{slow.port}') is None
+        release.set()
+
+    assert [product['name'] for product in filtered] == ['fast']
+    assert elapsed < 1.5
+
+
+def test_validate_urls_checks_each_site_once_and_answers_cached_sites_at_once():
+    with StubServer({'/a': (200, {}, STRIPE_HTML), '/b': (200, {}, STRIPE_HTML)}, {'/a': 0.1, '/b': 0.1}) as shop, \
+            StubServer({'/': (200, {}, PLAIN_HTML)}) as blog:
+        validate_urls([blog.url('/')])
+        urls = [shop.url('/a'), blog.url('/'), shop.url('/b')]
+        results = validate_urls(urls)
+
+        assert shop.hits('/a') + shop.hits('/b') == 1
+        assert blog.hits('/') == 1
+
+    assert [result['url'] for result in results] == urls
+    assert [result['status'] for result in results] == ['enabled', 'disabled', 'enabled']
+    assert [result['source'] for result in results] == ['check', 'cache', 'check']
+    assert results[0]['elapsed_ms'] >= 100
+    assert results[1]['elapsed_ms'] == 0
+
+
+def test_validate_urls_reports_sites_past_the_deadline_as_unknown():
+    release = threading.Event()
+
+    def stalled(handler):
+        release.wait(2)
+        return 200, {}, STRIPE_HTML
+
+    with StubServer({'/': stalled}) as slow, StubServer({'/': (200, {}, PLAIN_HTML)}) as fast:
+        results = validate_urls([slow.url('/'), fast.url('/')], deadline=0.3)
+        release.set()
+
+    assert [result['status'] for result in results] == ['unknown', 'disabled']
+    assert 'deadline' in results[0]['details']['error']
+
+
+def test_product_verdicts_stream_cached_first_then_in_completion_order():
+    with StubServer({'/': (200, {}, STRIPE_HTML)}, {'/': 0.3}) as slow, \
+            StubServer({'/': (200, {}, PLAIN_HTML)}) as fast, \
+            StubServer({'/a': (200, {}, STRIPE_HTML), '/b': (200, {}, STRIPE_HTML)}) as cached:
+        validate_products([{'url': cached.url('/a')}])
+        products = [
+            {'url': slow.url('/'), 'name': 'slow'},
+            {'url': cached.url('/a'), 'name': 'cached a'},
+            {'url': fast.url('/'), 'name': 'fast'},
+            {'name': 'no url'},
+            {'url': cached.url('/b'), 'name': 'cached b'}
+        ]
+        records = list(iter_product_verdicts(products, max_workers=2))
+
+    summary = records.pop()
+    assert [(record['product']['name'], record['source']) for record in records] == [
+        ('cached a', 'cache'), ('cached b', 'cache'), ('fast', 'check'), ('slow', 'check')
+    ]
+    assert [record['index'] for record in records] == [1, 4, 2, 0]
+    assert [record['status'] for record in records] == ['enabled', 'enabled', 'disabled', 'enabled']
+    assert 'stripe_info' in records[3]['product']
+    assert summary['type'] == 'summary'
+    assert (summary['total'], summary['validated'], summary['stripe_enabled']) == (5, 4, 3)
+    assert (summary['domains_checked'], summary['domains_unchecked']) == (2, 0)
+
+
+
+def test_batch_limits_default_to_and_are_capped_by_the_settings():
+    assert batch_limits() == (VALIDATION_WORKERS, VALIDATION_DEADLINE)
+    assert batch_limits(2, 0.5) == (2, 0.5)
+    assert batch_limits(10 ** 6, 10 ** 6) == (VALIDATION_WORKERS, VALIDATION_DEADLINE)
+
+
+@pytest.mark.parametrize('max_workers, deadline', [
+    (0, None), (-3, None), ('8', None), (2.5, None), (True, None),
+    (None, 0), (None, -1), (None, '30'), (None, float('inf')), (None, [1])
+])
+def test_batch_limits_reject_bad_values(max_workers, deadline):
+    with pytest.raises(ValueError):
+        batch_limits(max_workers, deadline)
+
+
+@pytest.mark.parametrize('path, body, headers', [
+    ('/api/filter-products', {'products': [], 'max_workers': 'many'}, {}),
+    ('/api/filter-products', {'products': [], 'deadline': -1}, {'Accept': 'application/x-ndjson'}),
+    ('/api/validate-urls', {'urls': ['https://example.com'], 'max_workers': 0}, {})
+])
+def test_endpoints_reject_bad_batch_limits(path, body, headers):
+    response = server.app.test_client().post(path, json=body, headers=headers)
+
+    assert response.status_code == 400
+    assert 'must be a positive' in response.get_json()['error']
@@ -0,0 +1,128 @@
+import threading
+import time
+import pytest
+import app.services.result_cache as result_cache
+import app.services.stripe_detector as stripe_detector
+from app.services.refresher import RefreshPool
+from app.services.result_cache import LRUCache, TieredCache
+from app.services.stripe_detector import is_stripe_enabled
+from tests.stub_server import StubServer
+
+STRIPE_HTML = """
+<html><head><script src="https://js.stripe.com/v3/"></script></head>
+<body><div id="card-element"></div></body></html>
+"""
+
+
+def test_refreshes_are_deduplicated_and_run_most_requested_first():
+    pool = RefreshPool(workers=1)
+    gate = threading.Event()
+    ran = []
+    pool.submit('blocker', lambda: gate.wait(2))
+    while pool.stats()['running'] == 0:
+        time.sleep(0.01)
+
+    assert pool.submit('rare.example.com', lambda: ran.append('rare'))
+    assert pool.submit('popular.example.com', lambda: ran.append('popular'))
+    assert not pool.submit('popular.example.com', lambda: ran.append('duplicate'))
+    assert not pool.submit('popular.example.com', lambda: ran.append('duplicate'))
+    gate.set()
+
+    assert pool.wait_idle(2)
+    assert ran == ['popular', 'rare']
+    assert pool.stats()['deduplicated'] == 2
+
+
+def test_full_queue_drops_new_keys():
+    pool = RefreshPool(workers=1, max_queued=1)
+    gate = threading.Event()
+    pool.submit('blocker', lambda: gate.wait(2))
+    while pool.stats()['running'] == 0:
+        time.sleep(0.01)
+
+    assert pool.submit('a.example.com', lambda: None)
+    assert not pool.submit('b.example.com', lambda: None)
+    gate.set()
+    assert pool.wait_idle(2)
+    assert pool.stats()['dropped'] == 1
+
+
+def test_stale_results_are_served_at_once_and_refreshed(monkeypatch):
+    cache = TieredCache(LRUCache(), ttl=60, hard_ttl=3600)
+    monkeypatch.setattr(result_cache, 'detection_cache', cache)
+    monkeypatch.setattr(stripe_detector, 'refresh_pool', RefreshPool(workers=1))
+    with StubServer({'/': (200, {}, STRIPE_HTML)}, {'/': 0.3}) as server:
+        key = f'127.0.0.1:{server.port}'
+        cache.memory.set(key, {'timestamp': time.time() - 120, 'result': {'stripe_enabled': False, 'confidence': 0}})
+
+        started = time.monotonic()
+        result = is_stripe_enabled(server.url('/'))
+        assert time.monotonic() - started < 0.2
+        assert result['stripe_enabled'] is False
+
+        assert stripe_detector.refresh_pool.wait_idle(2)
+        assert server.hits('/') == 1
+
+    assert cache.get(key)['stripe_enabled'] is True
+
+
+def test_entries_past_the_hard_ttl_are_fetched_inline(monkeypatch):
+    cache = TieredCache(LRUCache(), ttl=60, hard_ttl=100)
+    monkeypatch.setattr(result_cache, 'detection_cache', cache)
+    with StubServer({'/': (200, {}, STRIPE_HTML)}) as server:
+        key = f'127.0.0.1:{server.port}'
+        cache.memory.set(key, {'timestamp': time.time() - 120, 'result': {'stripe_enabled': False, 'confidence': 0}})
+
+        assert is_stripe_enabled(server.url('/'))['stripe_enabled'] is True
+
+
+def test_refresh_extends_unchanged_pages_without_parsing(monkeypatch):
+    cache = TieredCache(LRUCache(), ttl=60, hard_ttl=3600)
+    monkeypatch.setattr(result_cache, 'detection_cache', cache)
+
+    def page(handler):
+        if handler.headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, ''
+        return 200, {'ETag': '"v1"'}, STRIPE_HTML
+
+    with StubServer({'/': page}) as server:
+        key = f'127.0.0.1:{server.port}'
+        first = is_stripe_enabled(server.url('/'))
+        cache.memory.set(key, {'timestamp': time.time() - 120, 'result': first})
+
+        monkeypatch.setattr(stripe_detector, 'analyze_html', lambda *args, **kwargs: pytest.fail('page was parsed'))
+        refreshed = stripe_detector.refresh_site(key, server.url('/'))
+
+        assert server.requests[-1][2]['If-None-Match'] == '"v1"'
+
+    assert refreshed['stripe_enabled'] is True
+    assert refreshed['confidence'] == first['confidence']
+    assert refreshed['details']['fetch']['not_modified'] is True
+    assert 'revalidated_at' in refreshed['details']
+    assert cache.get(key) is refreshed
+
+
+def test_refresh_carries_over_results_when_the_fingerprint_matches(monkeypatch):
+    cache = TieredCache(LRUCache(), ttl=60, hard_ttl=3600)
+    monkeypatch.setattr(result_cache, 'detection_cache', cache)
+    with StubServer({'/': (200, {}, STRIPE_HTML)}) as server:
+        key = f'127.0.0.1:{server.port}'
+        first = is_stripe_enabled(server.url('/'))
+        assert first['details']['result_source'] == 'recomputed'
+
+        # Only text outside the payment markup changed
+        server.routes['/'] = (200, {}, STRIPE_HTML.replace('card-element', 'card-widget'))
+        monkeypatch.setattr(stripe_detector, 'analyze_html', lambda *args, **kwargs: pytest.fail('page was scored'))
+        carried = stripe_detector.refresh_site(key, server.url('/'))
+
+        assert carried['details']['result_source'] == 'carried_over'
+        assert carried['confidence'] == first['confidence']
+
+        # A new script source changes the fingerprint
+        monkeypatch.undo()
+        monkeypatch.setattr(result_cache, 'detection_cache', cache)
+        server.routes['/'] = (200, {}, STRIPE_HTML.replace('<body>', '<body><script src="/new.js"></script>'))
+        recomputed = stripe_detector.refresh_site(key, server.url('/'))
+
+    assert recomputed['details']['result_source'] == 'recomputed'
+    assert recomputed['details']['fingerprint'] != first['details']['fingerprint']
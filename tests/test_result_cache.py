@@ -0,0 +1,58 @@
+import time
+from app.services.cache_store import SQLiteStore
+from app.services.result_cache import LRUCache, TieredCache, entry_size
+
+
+def _entry(value, age=0):
+    return {'timestamp': time.time() - age, 'result': value}
+
+
+def test_lru_evicts_least_recently_used_over_entry_cap():
+    cache = LRUCache(max_entries=2, max_bytes=10_000)
+    cache.set('a', _entry(1))
+    cache.set('b', _entry(2))
+    cache.get('a')
+    cache.set('c', _entry(3))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.evictions == 1
+
+
+def test_lru_accounts_entry_sizes_against_byte_cap():
+    # Sizes are measured on the serialized entry, so pin the timestamp
+    # rather than let the clock decide how many digits it has
+    big = {'timestamp': 1700000000.25, 'result': 'x' * 400}
+    cache = LRUCache(max_entries=100, max_bytes=2 * entry_size(big) + 10)
+    for key in 'abc':
+        cache.set(key, big)
+
+    assert len(cache) == 2
+    assert cache.bytes == 2 * entry_size(big)
+    small = {'timestamp': 1700000000.25, 'result': 1}
+    cache.set('a', small)
+    assert cache.bytes == entry_size(big) + entry_size(small)
+
+
+def test_expired_entries_are_misses_in_both_tiers(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'cache.sqlite3'), 'detection')
+    store.set('old.example.com', _entry({'stripe_enabled': True}, age=100))
+    cache = TieredCache(LRUCache(), store, ttl=50, hard_ttl=80)
+    cache.memory.set('old.example.com', _entry({'stripe_enabled': True}, age=100))
+
+    assert cache.get('old.example.com') is None
+    stats = cache.stats()
+    assert stats['expired'] == 1 and stats['misses'] == 1 and stats['hits'] == 0
+
+
+def test_persistent_hits_are_promoted_and_survive_restarts(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = TieredCache(LRUCache(), SQLiteStore(path, 'detection'))
+    cache.set('shop.example.com', {'stripe_enabled': True, 'confidence': 0.6})
+    cache.flush()
+
+    restarted = TieredCache(LRUCache(), SQLiteStore(path, 'detection'))
+    assert restarted.get('shop.example.com')['confidence'] == 0.6
+    assert restarted.get('shop.example.com')['confidence'] == 0.6
+    stats = restarted.stats()
+    assert stats['store_hits'] == 1 and stats['memory_hits'] == 1
@@ -0,0 +1,65 @@
+import re
+import pytest
+from app.services.signatures import (
+    DECISIVE_SIGNATURES,
+    SignatureScanner,
+    StreamingScanner,
+    STRIPE_SIGNATURES,
+    content_fingerprint,
+    scan_signatures
+)
+
+
+def test_scan_matches_separate_searches():
+    html = """
+    <script src="https://checkout.stripe.com/v3"></script>
+    <script>const s = loadStripe('pk'); const e = stripeElements(opts);</script>
+    <p>Enter your Credit Card number below. Shopify order summary</p>
+    """
+    expected = {
+        tag for tag, patterns in STRIPE_SIGNATURES.items()
+        if any(re.search(pattern, html, re.IGNORECASE) for pattern in patterns)
+    }
+    assert scan_signatures(html) == expected
+
+
+def test_scan_reports_overlapping_signatures_for_every_tag():
+    scanner = SignatureScanner({'js': [r'stripeelements'], 'elements': [r'elements\(']})
+    assert scanner.scan('StripeElements(opts)') == {'js', 'elements'}
+
+
+def test_scan_verifies_patterns_beyond_the_literal_prefix():
+    scanner = SignatureScanner({'call': [r'stripe\(.*\)']})
+    assert scanner.scan('Stripe(\n)') == frozenset()
+    assert scanner.scan('Stripe(\n) Stripe(key)') == {'call'}
+
+
+def test_scan_without_hits():
+    assert scan_signatures('<html><body>Hello world</body></html>') == frozenset()
+
+
+def test_streaming_scanner_finds_signatures_across_chunks():
+    scanner = StreamingScanner(DECISIVE_SIGNATURES)
+
+    assert scanner.feed('<script src="https://js.STR') == frozenset()
+    assert scanner.feed('IPE.com/v3/"></script>') == {'decisive'}
+
+
+def test_streaming_scanner_rejects_unbounded_signatures():
+    with pytest.raises(ValueError):
+        StreamingScanner({'call': [r'stripe\(.*\)']})
+
+
+def test_content_fingerprint_tracks_payment_markup_only():
+    page = """<html><head><script src="https://js.stripe.com/v3/"></script>
+    <script type="application/ld+json">{"@type": "Product",
+        "name": "Widget"}</script></head>
+    <body><p>In stock</p><form action="/cart/add"></form></body></html>"""
+    fingerprint = content_fingerprint('https://shop.example.com/p', page)
+
+    assert content_fingerprint('https://shop.example.com/q', page.replace('In stock', 'Sold out')) == fingerprint
+    assert content_fingerprint('https://shop.example.com/p', page.replace('"name": "Widget"', '"name":  "Widget"')) == fingerprint
+    assert content_fingerprint('https://shop.example.com/p', page.replace('/cart/add', '/cart/buy')) != fingerprint
+    assert content_fingerprint('https://shop.example.com/p', page.replace('js.stripe.com', 'js.example.com')) != fingerprint
+    assert content_fingerprint('https://shop.example.com/p', page.replace('Widget', 'Gadget')) != fingerprint
+    assert content_fingerprint('https://shop.example.com/checkout', page) != fingerprint
@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import app.services.result_cache as result_cache
+import app.services.stripe_detector as stripe_detector
+from app.services.result_cache import TieredCache
+from app.services.single_flight import SingleFlight
+from app.services.stripe_detector import is_stripe_enabled
+from tests.stub_server import StubServer
+
+STRIPE_HTML = """
+<html><head><script src="https://js.stripe.com/v3/"></script></head>
+<body><div id="card-element"></div></body></html>
+"""
+
+
+def _run_concurrently(count, fn):
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(lambda _: fn(), range(count)))
+
+
+def test_concurrent_callers_share_one_computation():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return {'value': 42}
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(flight.do, 'key', compute) for _ in range(5)]
+        while flight.stats()['coalesced'] < 4:
+            time.sleep(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {'hits': 0, 'misses': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_waiters_receive_the_leaders_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(2)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, 'key', compute)
+        started.wait(2)
+        waiter = executor.submit(flight.do, 'key', compute)
+        while flight.stats()['coalesced'] < 1:
+            time.sleep(0.01)
+        release.set()
+        for future in (leader, waiter):
+            with pytest.raises(ValueError):
+                future.result()
+
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_lookup_hits_skip_the_computation():
+    flight = SingleFlight()
+    assert flight.do('key', lambda: 'computed', lookup=lambda: 'cached') == 'cached'
+    assert flight.do('key', lambda: 'computed', lookup=lambda: None) == 'computed'
+    assert flight.stats() == {'hits': 1, 'misses': 1, 'coalesced': 0, 'in_flight': 0}
+
+
+def test_concurrent_checks_of_one_site_fetch_it_once(monkeypatch):
+    monkeypatch.setattr(result_cache, 'detection_cache', TieredCache())
+    monkeypatch.setattr(result_cache, 'platform_cache', TieredCache())
+    monkeypatch.setattr(stripe_detector, 'detection_flight', SingleFlight())
+    with StubServer({'/': (200, {}, STRIPE_HTML)}, {'/': 0.3}) as server:
+        results = _run_concurrently(8, lambda: is_stripe_enabled(server.url('/')))
+
+        assert server.hits('/') == 1
+
+    assert all(result['stripe_enabled'] for result in results)
+    stats = stripe_detector.detection_flight.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] + stats['coalesced'] == 7
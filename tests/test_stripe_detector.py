@@ -1,11 +1,16 @@
 import pytest
+from datetime import timedelta
 from app.services.stripe_detector import (
     is_stripe_enabled,
+    analyze_html,
     _detect_stripe_js,
     _detect_stripe_checkout,
     _detect_stripe_elements
 )
 from unittest.mock import patch, MagicMock
+import app.services.http_client as http_client
+import app.services.result_cache as result_cache
+from app.services.cache_keys import cache_key
 from bs4 import BeautifulSoup
 
 # Mock HTML with Stripe integration
@@ -46,6 +51,31 @@ NON_STRIPE_HTML = """
 </html>
 """
 
+def _mock_response(html, chunk_size=None):
+    """Build a mocked streaming response serving the given HTML"""
+    body = html.encode('utf-8')
+    size = chunk_size or max(len(body), 1)
+    chunks = [body[i:i + size] for i in range(0, len(body), size)]
+    mock_response = MagicMock()
+    mock_response.text = html
+    mock_response.encoding = 'utf-8'
+    mock_response.status_code = 200
+    mock_response.headers = {}
+    mock_response.elapsed = timedelta(0)
+    mock_response.raise_for_status.return_value = None
+    mock_response.served = []
+    
+    remaining = iter(chunks)
+    
+    def read1(amt=None, decode_content=None):
+        chunk = next(remaining, b'')
+        if chunk:
+            mock_response.served.append(chunk)
+        return chunk
+    
+    mock_response.raw.read1.side_effect = read1
+    return mock_response
+
 @pytest.fixture
 def stripe_soup():
     return BeautifulSoup(STRIPE_HTML, 'html.parser')
@@ -66,32 +96,26 @@ def test_detect_stripe_elements_positive(stripe_soup):
 def test_detect_stripe_elements_negative(non_stripe_soup):
     assert _detect_stripe_elements(NON_STRIPE_HTML, non_stripe_soup) == 0.0
 
-@patch('requests.get')
+@patch('app.services.http_client.get')
 def test_is_stripe_enabled_positive(mock_get, stripe_soup):
     # Configure the mock to return a response with Stripe HTML
-    mock_response = MagicMock()
-    mock_response.text = STRIPE_HTML
-    mock_response.raise_for_status.return_value = None
-    mock_get.return_value = mock_response
+    mock_get.return_value = _mock_response(STRIPE_HTML)
     
     result = is_stripe_enabled('https://example.com/product')
     
     assert result['stripe_enabled'] is True
     assert result['confidence'] > 0.3
 
-@patch('requests.get')
+@patch('app.services.http_client.get')
 def test_is_stripe_enabled_negative(mock_get, non_stripe_soup):
     # Configure the mock to return a response without Stripe HTML
-    mock_response = MagicMock()
-    mock_response.text = NON_STRIPE_HTML
-    mock_response.raise_for_status.return_value = None
-    mock_get.return_value = mock_response
+    mock_get.return_value = _mock_response(NON_STRIPE_HTML)
     
     result = is_stripe_enabled('https://example.com/product')
     
     assert result['stripe_enabled'] is False
 
-@patch('requests.get')
+@patch('app.services.http_client.get')
 def test_is_stripe_enabled_exception(mock_get):
     # Configure the mock to raise an exception
     mock_get.side_effect = Exception("Connection error")
@@ -100,4 +124,65 @@ def test_is_stripe_enabled_exception(mock_get):
     
     assert result['stripe_enabled'] is False
     assert result['confidence'] == 0
-    assert 'Connection error' in result['details']['error']
\ No newline at end of file
+    assert 'Connection error' in result['details']['error']
+
+def test_analyze_html_tiered_decides_stripe_js_from_text():
+    result = analyze_html('https://example.com/product', STRIPE_HTML, tiered=True)
+
+    assert result['stripe_enabled'] is True
+    assert result['details']['tier'] == 'text'
+
+def test_analyze_html_tiered_decides_plain_page_from_text():
+    html = '<html><body><h1>Handmade mugs</h1><p>Ships in 3 days.</p></body></html>'
+    result = analyze_html('https://example.com/product', html, tiered=True)
+
+    assert result['stripe_enabled'] is False
+    assert result['details']['tier'] == 'text'
+
+@pytest.mark.parametrize('url, html', [
+    ('https://example.com/product', STRIPE_HTML),
+    ('https://example.com/checkout', STRIPE_HTML),
+    ('https://example.com/product', '<html><body><h1>Handmade mugs</h1><p>Ships in 3 days.</p></body></html>'),
+])
+def test_analyze_html_tiered_confidence_bounds_the_full_score(url, html):
+    tiered = analyze_html(url, html, tiered=True)
+    full = analyze_html(url, html)
+
+    assert tiered['details']['tier'] == 'text'
+    assert tiered['stripe_enabled'] == full['stripe_enabled']
+    low, high = tiered['details']['confidence_bounds']
+    assert tiered['confidence'] == low
+    assert low <= full['confidence'] <= high
+
+def test_analyze_html_tiered_parses_ambiguous_pages():
+    tiered = analyze_html('https://example.com/product', NON_STRIPE_HTML, tiered=True)
+    full = analyze_html('https://example.com/product', NON_STRIPE_HTML)
+
+    assert tiered['details']['tier'] == 'dom'
+    assert tiered['stripe_enabled'] == full['stripe_enabled']
+    assert tiered['confidence'] == full['confidence']
+
+
+@patch('app.services.http_client.get')
+def test_is_stripe_enabled_stops_at_decisive_signature(mock_get):
+    # The decisive signature straddles the boundary between two chunks
+    html = '<html><head><script src="https://js.stri' + 'pe.com/v3/"></script></head><body>' + 'x' * 5000 + '</body></html>'
+    mock_get.return_value = _mock_response(html, chunk_size=html.index('pe.com'))
+    
+    result = is_stripe_enabled('https://decisive.example.com/product')
+    
+    assert result['stripe_enabled'] is True
+    assert result['details']['fetch']['stopped'] == 'decisive_signature'
+    assert len(mock_get.return_value.served) == 2
+
+@patch('app.services.http_client.get')
+def test_is_stripe_enabled_caps_body_size(mock_get, monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_BODY_BYTES', 1024)
+    mock_get.return_value = _mock_response('<p>' + 'a' * 10000 + '</p>', chunk_size=300)
+    
+    result = is_stripe_enabled('https://huge.example.com/product')
+    
+    assert result['details']['fetch'] == {'bytes': 1024, 'stopped': 'max_bytes'}
+    # The unread rest of the page may still hold Stripe
+    assert result['status'] == 'unknown'
+    assert result_cache.detection_cache.get(cache_key('https://huge.example.com/product')) is None